@@ -9,6 +9,7 @@ import base64
 import datetime
 import re
 import os
+import sys
 
 import pysolr
 from flask import render_template, flash, request, redirect, url_for, Response
@@ -22,6 +23,9 @@ from forms import *
 import models
 from appinit import app, db
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from capture import freshness as capture_freshness
+
 
 
 
@@ -318,6 +322,20 @@ def json_timeline():
 
 
 
+@app.route('/freshness')
+def freshness():
+    hours = request.args.get('hours', 24, type=float)
+    sources = freshness_percentiles(hours)
+    rows = sorted(sources.iteritems(), key=lambda s: -s[1].get('publish_to_insert', {}).get('count', 0))
+    return render_template('pages/freshness.html', rows=rows, hours=hours)
+
+
+@app.route('/freshness/json')
+def json_freshness():
+    hours = request.args.get('hours', 24, type=float)
+    return Response(json.dumps({'data': freshness_percentiles(hours)}), mimetype='application/json')
+
+
 @app.route("/query/<coll_name>", methods=['GET'])
 def mongo_query(coll_name):
     """
@@ -407,6 +425,19 @@ def fix_json_output(json_obj):
     return _fix_json(json_obj)
 
 
+def freshness_percentiles(hours):
+    """
+    p50/p95/p99 of the lags of each source in the last `hours` hours, from
+    the hourly rollups written by capture/freshness.py.
+    :return: dict source -> kind -> {'count': ..., 'p50': ..., 'p95': ..., 'p99': ...} (seconds)
+    """
+    since = datetime.datetime.utcnow() - datetime.timedelta(hours=hours)
+    return capture_freshness.percentiles(since, collection=mongo_client.MCDB.freshness)
+
+
+app.add_template_filter(capture_freshness.format_lag, 'lag')
+
+
 def fetch_docs(colname, limit=100, ids=None):
     """
     Query MongoDB in the collection specified
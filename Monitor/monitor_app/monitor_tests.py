@@ -36,6 +36,12 @@ class MonitorTestCase(unittest.TestCase):
         rv = self.app.get('/urls/json')
         self.assertIn("meta", json.loads(rv.data))
 
+    def test_freshness(self):
+        rv = self.app.get('/freshness/json?hours=48')
+        self.assertIn("data", json.loads(rv.data))
+        rv = self.app.get('/freshness')
+        self.assertEqual(rv.status_code, 200)
+
     def test_solr_query_articles(self):
         rv = self.app.get('/solrquery/mediacloud_articles/rolezinho')
         self.assertGreater(len(json.loads(rv.data)), 0)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+u"""
+Benchmark of the date parsers on a corpus of date strings found in feeds and
+outlet pages (data/date_strings.tsv, one `source<TAB>string` per line).
+
+Compares `utilities.parsedates.parse_date` (dateutil, then the portuguese
+parser) with `utilities.dates`, one string at a time and in batch, and checks
+that both give the same dates::
+
+    python benchmarks/bench_dates.py --repeat 200
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import argparse
+import codecs
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utilities import dates, parsedates
+
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'date_strings.tsv')
+
+
+def load_corpus(path=CORPUS):
+    """
+    :return: list of (source, date string)
+    """
+    corpus = []
+    with codecs.open(path, encoding='utf8') as f:
+        for line in f:
+            if line.strip() and not line.startswith('#'):
+                source, value = line.rstrip('\n').split('\t', 1)
+                corpus.append((source, value))
+    return corpus
+
+
+def as_utc(date):
+    if date is not None and date.tzinfo is not None:
+        return (date - date.utcoffset()).replace(tzinfo=None)
+    return date
+
+
+def timed(function, corpus, repeat):
+    results = []
+    t0 = time.time()
+    for _ in xrange(repeat):
+        results = []
+        for source, value in corpus:
+            try:
+                results.append(function(value, source))
+            except Exception:
+                # parsedates.parse_date lets some errors of parse_pt_date through
+                results.append(None)
+    return results, time.time() - t0
+
+
+def main(repeat):
+    corpus = load_corpus()
+    n = len(corpus) * repeat
+    old, old_time = timed(lambda value, source: parsedates.parse_date(value), corpus, repeat)
+    new, new_time = timed(dates.parse_date, corpus, repeat)
+    by_source = {}
+    for source, value in corpus:
+        by_source.setdefault(source, []).extend([value] * repeat)
+    t0 = time.time()
+    for source, values in by_source.iteritems():
+        dates.parse_dates(values, source)
+    batch_time = time.time() - t0
+
+    print "{0} strings, {1} times".format(len(corpus), repeat)
+    print "parsedates.parse_date  {0:8.1f} us/string".format(old_time / n * 1e6)
+    print "dates.parse_date       {0:8.1f} us/string  ({1:.1f}x)".format(new_time / n * 1e6, old_time / new_time)
+    print "dates.parse_dates      {0:8.1f} us/string  ({1:.1f}x)".format(batch_time / n * 1e6, old_time / batch_time)
+    for (source, value), a, b in zip(corpus, old, new):
+        if as_utc(a) != b:
+            print u"differs: {0!r} -> {1} / {2}".format(value, as_utc(a), b)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the date parsers')
+    parser.add_argument('-r', '--repeat', type=int, default=100, help='number of passes over the corpus')
+    args = parser.parse_args()
+
+    main(args.repeat)
@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+u"""
+End-to-end benchmark of the feed ingest (`downloader.parallel_fetch`).
+
+A stand-in server, in its own process, generates synthetic RSS feeds and
+article pages with a configurable latency, page size, error rate and length
+of redirect chains. The feeds are registered in a scratch database of the
+local MongoDB (`MCDB_bench` by default, dropped at start) and the downloader
+fetches them with its usual thread pool; the run reports feeds/s,
+articles/s, the time spent in each stage and the peak RSS::
+
+    python benchmarks/bench_ingest.py --feeds 200 --items 20 --latency 0.05
+
+Stage times are summed over the fetching threads, so they add up to more
+than the wall time. The ingest only publishes the articles in the outbox;
+with ``--elastic`` the ``elastic`` consumer then indexes them in
+Elasticsearch, outside of the wall time of the ingest.
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import argparse
+import collections
+import datetime
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import urlparse
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'capture'))
+sys.path.insert(0, ROOT)
+
+
+WORDS = (u"governo federal anunciou novas medidas para economia durante reunião hoje impacto previsto sobre "
+         u"preços emprego longo próximos meses ministro afirmou que proposta será enviada congresso semana "
+         u"oposição criticou decisão estados municípios receberão recursos saúde educação segurança pública "
+         u"segundo dados instituto crescimento foi menor esperado analistas mercado avaliam cenário").split()
+
+FEED = u"""<?xml version="1.0" encoding="utf-8"?>
+<rss version="2.0"><channel>
+<title>Jornal {feed}</title><link>{base}/</link><description>Últimas notícias</description>
+{items}
+</channel></rss>"""
+
+ITEM = u"""<item><title>{title}</title><link>{link}</link><description>{summary}</description>
+<pubDate>{date}</pubDate><category>política</category></item>"""
+
+PAGE = u"""<html><head><meta charset="utf-8"><title>{title} - Jornal {feed}</title></head><body>
+<div id="menu"><a href="/">Capa</a> <a href="/politica">Política</a> <a href="/economia">Economia</a></div>
+<div class="materia"><h1>{title}</h1>{body}</div>
+<div class="comentarios"><p>Comente esta notícia</p></div>
+</body></html>"""
+
+
+def sentence(rng, n):
+    return u' '.join(rng.choice(WORDS) for _ in xrange(n)).capitalize() + u'.'
+
+
+class Corpus(object):
+    """
+    Synthetic feeds and pages, deterministic for a seed. The article bodies
+    are drawn from a fixed set so the server does little work per request.
+    """
+    def __init__(self, items, article_size, error_rate, redirects, seed=0, bodies=50):
+        self.items = items
+        self.error_rate = error_rate
+        self.redirects = redirects
+        self.seed = seed
+        rng = random.Random(seed)
+        self.bodies = []
+        for _ in xrange(bodies):
+            paragraphs, size = [], 0
+            while size < article_size:
+                paragraphs.append(u'<p>{0}</p>'.format(u' '.join(sentence(rng, 15) for _ in xrange(4))))
+                size += len(paragraphs[-1])
+            self.bodies.append(u'\n'.join(paragraphs))
+
+    def _rng(self, *key):
+        return random.Random(hash((self.seed,) + key))
+
+    def fails(self, path):
+        return self._rng('error', path).random() < self.error_rate
+
+    def title(self, feed, item):
+        return sentence(self._rng('title', feed, item), 8)[:-1]
+
+    def feed(self, base, feed):
+        now = datetime.datetime.utcnow()
+        items = []
+        for item in xrange(self.items):
+            link = u'{0}/r/{1}/noticia/{2}/{3}'.format(base, self.redirects, feed, item) if self.redirects else \
+                u'{0}/noticia/{1}/{2}'.format(base, feed, item)
+            date = (now - datetime.timedelta(minutes=10 * item)).strftime('%a, %d %b %Y %H:%M:%S +0000')
+            items.append(ITEM.format(title=self.title(feed, item), link=link, date=date,
+                                     summary=sentence(self._rng('summary', feed, item), 20)))
+        return FEED.format(feed=feed, base=base, items=u'\n'.join(items))
+
+    def page(self, feed, item):
+        body = self.bodies[self._rng('body', feed, item).randrange(len(self.bodies))]
+        return PAGE.format(feed=feed, title=self.title(feed, item), body=body)
+
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """
+    /feed/<n>.xml: a feed; /noticia/<feed>/<item>: an article page;
+    /r/<k>/<path>: redirects to /r/<k-1>/<path>, then to /<path>.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        parts = self.path.strip('/').split('/')
+        if parts[0] == 'r' and len(parts) > 2:
+            hops = int(parts[1]) - 1
+            target = '/' + '/'.join(parts[2:]) if hops <= 0 else '/r/{0}/{1}'.format(hops, '/'.join(parts[2:]))
+            return self._send(302, '', headers={'Location': target})
+        if server.corpus.fails(self.path):
+            return self._send(500, 'Internal Server Error')
+        base = 'http://{0}:{1}'.format(*server.server_address)
+        if parts[0] == 'feed':
+            return self._send(200, server.corpus.feed(base, int(parts[1].split('.')[0])),
+                              'application/rss+xml; charset=utf-8')
+        if parts[0] == 'noticia' and len(parts) == 3:
+            return self._send(200, server.corpus.page(int(parts[1]), int(parts[2])), 'text/html; charset=utf-8')
+        self._send(404, 'Not Found')
+
+    def _send(self, status, body, content_type='text/plain', headers=None):
+        body = body.encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).iteritems():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve(port, corpus, latency, ready):
+    server = _ThreadingServer(('127.0.0.1', port), _StandInHandler)
+    server.corpus = corpus
+    server.latency = latency
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_server(corpus, latency=0.0, port=0):
+    """
+    Start the stand-in server in a child process.
+    :return: (process, base url)
+    """
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(port, corpus, latency, ready))
+    process.daemon = True
+    process.start()
+    return process, 'http://127.0.0.1:{0}'.format(ready.get(timeout=10))
+
+
+class StageTimes(object):
+    """
+    Time spent in each stage, summed over the threads.
+    """
+    def __init__(self):
+        self.seconds = collections.defaultdict(float)
+        self.calls = collections.defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.seconds[stage] += seconds
+            self.calls[stage] += 1
+
+    def wrap(self, stage, function):
+        """
+        :param stage: name of the stage, or function of the arguments returning it
+        """
+        def timed(*args, **kwargs):
+            t0 = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(stage(*args, **kwargs) if callable(stage) else stage, time.time() - t0)
+        return timed
+
+
+class TimedCollection(object):
+    """
+    Collection whose queries and inserts are counted in a stage.
+    """
+    def __init__(self, collection, times, stage='mongo'):
+        self._collection = collection
+        self._times = times
+        self._stage = stage
+
+    def find(self, *args, **kwargs):
+        t0 = time.time()
+        try:
+            return list(self._collection.find(*args, **kwargs))
+        finally:
+            self._times.add(self._stage, time.time() - t0)
+
+    def insert(self, *args, **kwargs):
+        return self._times.wrap(self._stage, self._collection.insert)(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+def _fetch_stage(url, *args, **kwargs):
+    return 'fetch feed' if urlparse.urlparse(url or '').path.startswith('/feed/') else 'fetch article'
+
+
+def instrument(downloader, times):
+    """
+    Time the stages of the downloader.
+    """
+    import feedparser
+    import outbox
+    import warc
+    warc.get = times.wrap(_fetch_stage, warc.get)
+    feedparser.parse = times.wrap('parse feed', feedparser.parse)
+    for stage, name in [('extract text', 'goosefy'), ('detect language', 'detect_language'),
+                        ('parse dates', 'parse_date'), ('compress', 'compress_content')]:
+        setattr(downloader, name, times.wrap(stage, getattr(downloader, name)))
+    outbox.publish = times.wrap('publish event', outbox.publish)
+    downloader.index_article_on_elastic = times.wrap('index elastic', downloader.index_article_on_elastic)
+    downloader.ARTICLES = TimedCollection(downloader.ARTICLES, times)
+
+
+def peak_rss():
+    """
+    Peak resident memory of the process and of its children (the extraction
+    workers), in MB.
+    """
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.
+    return own, children
+
+
+def run(feeds, items, article_size, latency, error_rate, redirects, threads, database, elastic, seed):
+    corpus = Corpus(items, article_size, error_rate, redirects, seed)
+    server, base = start_server(corpus, latency)
+
+    import pymongo
+    import connections
+    import content_paths
+    import downloader
+    import freshness
+    import language
+    import outbox
+    import settings
+    import tracing
+    client = connections.mongo()
+    client.drop_database(database)
+    db = client[database]
+    # everything the downloader writes, ids and memos included, goes to the scratch database
+    downloader.FEEDS = db.feeds
+    downloader.ARTICLES = db.articles
+    downloader.ARTICLES.ensure_index([("link", pymongo.ASCENDING), ("published", pymongo.ASCENDING)])
+    content_paths.PATHS = db.content_paths
+    language.LANGUAGES = db.source_languages
+    outbox.OUTBOX, outbox.OFFSETS, outbox.ARTICLES = db.outbox, db.outbox_offsets, db.articles
+    connections.SPHINX_IDS = connections.Sequence(db.counters, 'articles.sphinx_id')
+    tracing.TRACES = db.traces
+    freshness.FRESHNESS = db.freshness
+    if threads:
+        downloader.config['threads'] = threads
+    for n in xrange(feeds):
+        db.feeds.insert({'title_detail': {'base': u'{0}/feed/{1}.xml'.format(base, n)},
+                         'updated': datetime.datetime.now()})
+
+    times = StageTimes()
+    instrument(downloader, times)
+    t0 = time.time()
+    try:
+        downloader.parallel_fetch()
+    finally:
+        wall = time.time() - t0
+        server.terminate()
+    if elastic:
+        settings.OUTBOX_SETTLE = 0
+        outbox.consume('elastic', once=True)
+    stored = db.articles.count()
+    rss, children_rss = peak_rss()
+    return {
+        'feeds': feeds, 'items': items, 'article_size': article_size, 'latency': latency,
+        'error_rate': error_rate, 'redirects': redirects, 'threads': downloader.config['threads'],
+        'seconds': wall, 'feeds_per_second': times.calls['fetch feed'] / wall,
+        'articles_stored': stored, 'articles_per_second': stored / wall,
+        'stages': dict((stage, {'seconds': times.seconds[stage], 'calls': times.calls[stage]})
+                       for stage in times.seconds),
+        'peak_rss_mb': rss, 'peak_children_rss_mb': children_rss,
+    }
+
+
+def report(result):
+    print "{feeds} feeds x {items} items, {threads} threads, {latency}s latency, " \
+          "{error_rate:.0%} errors, {redirects} redirects".format(**result)
+    print "wall time     {0:10.1f} s".format(result['seconds'])
+    print "feeds/s       {0:10.2f}".format(result['feeds_per_second'])
+    print "articles/s    {0:10.2f}  ({1} stored)".format(result['articles_per_second'], result['articles_stored'])
+    print "peak RSS      {0:10.1f} MB  (extraction workers {1:.1f} MB)".format(result['peak_rss_mb'],
+                                                                             result['peak_children_rss_mb'])
+    print "stage                thread-s    calls    ms/call"
+    for stage, t in sorted(result['stages'].iteritems(), key=lambda s: -s[1]['seconds']):
+        print "{0:18} {1:10.1f} {2:8d} {3:10.2f}".format(stage, t['seconds'], t['calls'],
+                                                         t['seconds'] / t['calls'] * 1000)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='End-to-end benchmark of the feed ingest')
+    parser.add_argument('--feeds', type=int, default=100, help='number of feeds')
+    parser.add_argument('--items', type=int, default=20, help='articles per feed')
+    parser.add_argument('--article-size', type=int, default=8000, help='characters of text per article')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds the server waits before answering')
+    parser.add_argument('--error-rate', type=float, default=0.02, help='share of the requests answered with HTTP 500')
+    parser.add_argument('--redirects', type=int, default=1, help='redirects before each article')
+    parser.add_argument('-t', '--threads', type=int, default=None, help='fetching threads of the downloader')
+    parser.add_argument('--database', default='MCDB_bench', help='scratch database, dropped at start')
+    parser.add_argument('--elastic', action='store_true', help='index the articles in Elasticsearch')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', metavar='FILE', help='also write the results to FILE')
+    args = parser.parse_args()
+
+    result = run(args.feeds, args.items, args.article_size, args.latency, args.error_rate, args.redirects,
+                 args.threads, args.database, args.elastic, args.seed)
+    report(result)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+u"""
+Micro-benchmarks of the hot functions of the pipeline, on fixed fixtures
+(data/pages/*.html, data/feed.xml, data/date_strings.tsv and the Mongo
+documents of data/articles.json)::
+
+    python benchmarks/bench_micro.py                 # all the cases
+    python benchmarks/bench_micro.py 'parse_date*'   # some of them
+    python benchmarks/bench_micro.py --list
+
+Each case is run in loops of at least `--min-time` seconds, `--repeat`
+times, and the best time per operation is kept. The results are appended
+to a JSON lines history (benchmarks/history.jsonl by default) and compared
+with the median of the last `--window` runs on the same host: a case
+slower by more than `--threshold` is flagged as a regression and the exit
+status is 1.
+
+Cases whose module can't be imported here (missing dependency, MongoDB not
+running) are reported as skipped.
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import argparse
+import codecs
+import collections
+import datetime
+import fnmatch
+import gc
+import glob
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import timeit
+from struct import pack
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(ROOT)
+DATA = os.path.join(ROOT, 'data')
+HISTORY = os.path.join(ROOT, 'history.jsonl')
+for path in (os.path.join(REPO, 'Monitor', 'monitor_app'), os.path.join(REPO, 'indexing'),
+             os.path.join(REPO, 'capture'), REPO):
+    sys.path.insert(0, path)
+
+
+class Fixtures(object):
+    """
+    The fixture corpora, loaded on first use.
+    """
+    @property
+    def pages(self):
+        """
+        {name: html}
+        """
+        if not hasattr(self, '_pages'):
+            self._pages = collections.OrderedDict()
+            for path in sorted(glob.glob(os.path.join(DATA, 'pages', '*.html'))):
+                with codecs.open(path, encoding='utf8') as f:
+                    self._pages[os.path.basename(path)[:-5]] = f.read()
+        return self._pages
+
+    @property
+    def feed(self):
+        if not hasattr(self, '_feed'):
+            with open(os.path.join(DATA, 'feed.xml'), 'rb') as f:
+                self._feed = f.read()
+        return self._feed
+
+    @property
+    def dates(self):
+        """
+        [(source, date string)]
+        """
+        if not hasattr(self, '_dates'):
+            from bench_dates import load_corpus
+            self._dates = load_corpus()
+        return self._dates
+
+    @property
+    def articles(self):
+        """
+        Article documents as read from MongoDB, with the `link_content` of their page.
+        """
+        if not hasattr(self, '_articles'):
+            import zlib
+            import cPickle as CP
+            import bson
+            from bson import json_util
+            with codecs.open(os.path.join(DATA, 'articles.json'), encoding='utf8') as f:
+                self._articles = json.loads(f.read(), object_hook=json_util.object_hook)
+            for article in self._articles:
+                html = self.pages[article.pop('page')]
+                article['link_content'] = bson.Binary(zlib.compress(CP.dumps(html, CP.HIGHEST_PROTOCOL)))
+                article['compressed'] = True
+        return self._articles
+
+
+FIXTURES = Fixtures()
+CASES = collections.OrderedDict()
+
+
+def case(name):
+    """
+    Register a case. The decorated function prepares it and returns
+    (function running a batch of operations, number of operations in a batch).
+    """
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+
+@case('compress_content')
+def _compress_content():
+    from downloader import compress_content
+    pages = FIXTURES.pages.values()
+    return lambda: [compress_content(html) for html in pages], len(pages)
+
+
+@case('decompress_content')
+def _decompress_content():
+    from downloader import compress_content, decompress_content
+    compressed = [compress_content(html) for html in FIXTURES.pages.values()]
+    return lambda: [decompress_content(c) for c in compressed], len(compressed)
+
+
+@case('goosefy')
+def _goosefy():
+    # as configured: the body selectors learned per domain, the watchdog
+    import watchdog
+    from downloader import goosefy
+    watchdog.start()
+    pages = [(html, {'link': 'http://www.jornalexemplo.com.br/politica/{0}.shtml'.format(name)})
+             for name, html in FIXTURES.pages.iteritems()]
+    return lambda: [goosefy(html, dict(article)) for html, article in pages], len(pages)
+
+
+def _extract_text(engine):
+    import extraction
+    pages = FIXTURES.pages.values()
+    return lambda: [extraction.extract_text(html, engine=engine) for html in pages], len(pages)
+
+
+@case('extract_text[goose]')
+def _extract_text_goose():
+    return _extract_text('goose')
+
+
+@case('extract_text[density]')
+def _extract_text_density():
+    return _extract_text('density')
+
+
+@case('detect_language')
+def _detect_language():
+    # without a source, so the detector runs on every text
+    from downloader import detect_language
+    texts = [article['cleaned_text'] for article in FIXTURES.articles]
+    return lambda: [detect_language(text) for text in texts], len(texts)
+
+
+def _parse_all(parse, corpus):
+    for source, value in corpus:
+        try:
+            parse(value, source)
+        except Exception:
+            # parsedates.parse_date lets some errors of parse_pt_date through
+            pass
+
+
+@case('parsedates.parse_date')
+def _parsedates_parse_date():
+    from utilities import parsedates
+    corpus = FIXTURES.dates
+    return lambda: _parse_all(lambda value, source: parsedates.parse_date(value), corpus), len(corpus)
+
+
+@case('dates.parse_date')
+def _dates_parse_date():
+    from utilities import dates
+    corpus = FIXTURES.dates
+    return lambda: _parse_all(dates.parse_date, corpus), len(corpus)
+
+
+@case('mongo2sphinx.serialize')
+def _serialize():
+    import mongo2sphinx
+    # fields and attributes of the articles index in indexing/sphinx.conf
+    fields = ['summary', 'title', 'cleaned_text', 'link', '_id', 'title', 'links', 'link', 'language', 'published',
+              'summary', '_id']
+    articles = FIXTURES.articles
+    return lambda: [mongo2sphinx.serialize(doc, i, fields) for i, doc in enumerate(articles, 1)], len(articles)
+
+
+@case('fix_json_output')
+def _fix_json_output():
+    from app import fix_json_output
+    articles = FIXTURES.articles
+    return lambda: fix_json_output(articles), len(articles)
+
+
+def search_response(articles, matches=1000):
+    """
+    Encode the searchd response to one query of the articles index.
+    """
+    import calendar
+    import sphinxapi
+    attrs = [('published', sphinxapi.SPH_ATTR_TIMESTAMP), ('language', sphinxapi.SPH_ATTR_STRING),
+             ('link', sphinxapi.SPH_ATTR_STRING), ('_id', sphinxapi.SPH_ATTR_STRING)]
+    fields = ['summary', 'title', 'cleaned_text', 'link']
+    out = [pack('>L', sphinxapi.SEARCHD_OK), pack('>L', len(fields))]
+    out.extend(pack('>L', len(f)) + f for f in fields)
+    out.append(pack('>L', len(attrs)))
+    out.extend(pack('>L', len(name)) + name + pack('>L', t) for name, t in attrs)
+    out.append(pack('>2L', matches, 1))
+    for i in xrange(matches):
+        doc = articles[i % len(articles)]
+        out.append(pack('>QL', i + 1, 1000 + i))
+        out.append(pack('>L', calendar.timegm(doc['published'].utctimetuple())))
+        for value in (doc['language']['code'], doc['link'], str(doc['_id'])):
+            value = value.encode('utf8') if isinstance(value, unicode) else value
+            out.append(pack('>L', len(value)) + value)
+    words = ['governo', 'economia']
+    out.append(pack('>4L', matches, matches * 3, 12, len(words)))
+    out.extend(pack('>L', len(w)) + w + pack('>2L', 500, 1200) for w in words)
+    return ''.join(out)
+
+
+@case('sphinxapi.decode_response')
+def _decode_response():
+    import sphinxapi
+    client = sphinxapi.SphinxClient()
+    response = search_response(FIXTURES.articles)
+    # RunQueries of the unmodified client, with searchd replaced by the canned response
+    client._Connect = lambda: True
+    client._Send = lambda sock, req: None
+    client._GetResponse = lambda sock, client_ver: response
+    client.AddQuery('governo', 'articles')
+    reqs = client._reqs
+
+    def run_query():
+        client._reqs = list(reqs)
+        return client.RunQueries()
+    return run_query, 1
+
+
+@case('feedparser.parse')
+def _parse_feed():
+    import feedparser
+    feed = FIXTURES.feed
+    headers = {'content-type': 'application/rss+xml; charset=utf-8',
+               'content-location': 'http://www.jornalexemplo.com.br/rss/ultimas.xml'}
+    return lambda: feedparser.parse(feed, response_headers=headers), 1
+
+
+def measure(function, ops, repeat=5, min_time=0.2):
+    """
+    Time a batch function as timeit does.
+    :return: {'best': seconds per operation, 'median': ..., 'loops': operations timed per repetition}
+    """
+    def timed(number):
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            t0 = timeit.default_timer()
+            for _ in xrange(number):
+                function()
+            return timeit.default_timer() - t0
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    function()  # warm up caches and memos
+    number = 1
+    elapsed = timed(number)
+    while elapsed < min_time:
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+        elapsed = timed(number)
+    times = sorted([elapsed] + [timed(number) for _ in xrange(repeat - 1)])
+    per_op = [t / (number * ops) for t in times]
+    return {'best': per_op[0], 'median': per_op[len(per_op) // 2], 'loops': number * ops}
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def baseline(history, name, host, window):
+    """
+    Median of the best times of `name` in the last `window` runs on `host`.
+    """
+    values = [run['results'][name]['best'] for run in history
+              if run.get('host') == host and name in run.get('results', {})][-window:]
+    if not values:
+        return None
+    values.sort()
+    return values[len(values) // 2]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO,
+                                       stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(patterns=None, repeat=5, min_time=0.2, history_path=HISTORY, window=5, threshold=0.1, record=True):
+    """
+    Run the selected cases, compare them with the history and record them.
+    :return: names of the cases that regressed
+    """
+    names = [n for n in CASES if not patterns or any(fnmatch.fnmatch(n, p) for p in patterns)]
+    history = load_history(history_path)
+    host = socket.gethostname()
+    results, regressions = {}, []
+    print "{0:28} {1:>12} {2:>12} {3:>12} {4:>8}".format('case', 'best us/op', 'median', 'baseline', 'change')
+    for name in names:
+        try:
+            function, ops = CASES[name]()
+        except Exception as e:
+            # ImportError, or the module failed to connect to a service
+            print "{0:28} skipped: {1}: {2}".format(name, type(e).__name__, e)
+            continue
+        result = results[name] = measure(function, ops, repeat, min_time)
+        base = baseline(history, name, host, window)
+        change, flag = '', ''
+        if base:
+            ratio = result['best'] / base - 1
+            change = '{0:+.1%}'.format(ratio)
+            if ratio > threshold:
+                flag = 'REGRESSION'
+                regressions.append(name)
+        print "{0:28} {1:12.2f} {2:12.2f} {3:>12} {4:>8} {5}".format(
+            name, result['best'] * 1e6, result['median'] * 1e6,
+            '{0:.2f}'.format(base * 1e6) if base else '-', change, flag)
+    if record and results:
+        entry = {'date': datetime.datetime.utcnow().isoformat(), 'commit': git_commit(), 'host': host,
+                 'python': platform.python_version(), 'results': results}
+        with open(history_path, 'a') as f:
+            f.write(json.dumps(entry, sort_keys=True) + '\n')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Micro-benchmarks of the hot functions')
+    parser.add_argument('cases', nargs='*', help='names or glob patterns of the cases to run (default: all)')
+    parser.add_argument('-l', '--list', action='store_true', help='list the cases')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='repetitions of each case')
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum seconds of each repetition')
+    parser.add_argument('--history', default=HISTORY, help='JSON lines file of the previous results')
+    parser.add_argument('--window', type=int, default=5, help='previous runs the results are compared to')
+    parser.add_argument('--threshold', type=float, default=0.1, help='slowdown flagged as a regression')
+    parser.add_argument('--no-record', action='store_true', help='do not add the results to the history')
+    args = parser.parse_args()
+
+    if args.list:
+        print '\n'.join(CASES)
+        sys.exit(0)
+    regressions = run(args.cases, args.repeat, args.min_time, args.history, args.window, args.threshold,
+                      not args.no_record)
+    if regressions:
+        print "Regressions: {0}".format(', '.join(regressions))
+    sys.exit(1 if regressions else 0)
@@ -43,11 +43,16 @@ __WEBSITE__ = 'incolumitas.com'
 
 import sys
 import re
+import shelve
+import threading
+from multiprocessing.pool import ThreadPool
 from urlparse import urlparse
 from random import choice
 
 import lxml.html
 
+from ratelimit import RateLimiter
+
 
 try:
     import requests
@@ -75,6 +80,40 @@ class InvalidNumberResultsException(GoogleSearchError):
         return '%d is not a valid number of results per page' % self.nres
 
 
+class GoogleRequestError(GoogleSearchError):
+    def __init__(self, message):
+        self.message = message
+    def __str__(self):
+        return self.message
+
+
+class ResultCache(object):
+    '''
+    Persistent cache of the links found on each result page, keyed by
+    (query, offset, language), so that reruns don't repeat requests.
+    '''
+    def __init__(self, path):
+        self._db = shelve.open(path)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(query, offset, language):
+        return '{0}|{1}|{2}'.format(query, offset, language).encode('utf8')
+
+    def get(self, query, offset, language):
+        with self._lock:
+            return self._db.get(self._key(query, offset, language))
+
+    def set(self, query, offset, language, hrefs):
+        with self._lock:
+            self._db[self._key(query, offset, language)] = hrefs
+            self._db.sync()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
 class GoogleScraper:
     '''
     Offers a fast way to query the google search engine. It returns a list
@@ -108,7 +147,6 @@ class GoogleScraper:
         'User-Agent': 'Mozilla/5.0',
         'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
         'Accept-Encoding': 'gzip, deflate',
-        'Connection': 'close',
         'DNT': '1'
     }
 
@@ -128,7 +166,8 @@ class GoogleScraper:
 'Mozilla/4.0 (compatible; MSIE 8.0; Windows NT 6.0; Trident/4.0; Mozilla/4.0 (compatible; MSIE 6.0; Windows NT 5.1; SV1) ; .NET CLR 3.5.30729)'
     ]
 
-    def __init__(self, search_term, number_results_page=50, offset=0, language=''):
+    def __init__(self, search_term, number_results_page=50, offset=0, language='',
+                 session=None, cache=None, rate_limiter=None, threads=4, search_url=None):
         self.search_term = search_term
         if number_results_page not in [10, 25, 50, 100]:
             raise InvalidNumberResultsException(number_results_page)
@@ -136,15 +175,30 @@ class GoogleScraper:
         self.number_results_page = number_results_page
         self.offset = offset
         self.language = language
+        # A single session is shared by all the threads so connections are reused
+        self.session = session if session is not None else requests.Session()
+        self.cache = cache
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter(1.0)
+        self.threads = threads
+        self.search_url = search_url or self._GOOGLE_SEARCH
+        self.errors = []
 
     # Front end
     # This function returns a list of 5-tuples:
     # (addressing scheme, network location, path, query, fragment identifier).
+    # Result pages are fetched concurrently; pages that fail are skipped and
+    # their errors kept in self.errors.
     def search(self, number_pages=1):
+        offsets = [self.offset + self.number_results_page * i for i in range(number_pages)]
+        pool = ThreadPool(max(1, min(self.threads, number_pages)))
+        try:
+            pages = pool.map(self._search_page, offsets)
+        finally:
+            pool.close()
+            pool.join()
+
         res = []
-        for i in range(number_pages):
-            self.offset = int(self.number_results_page * 100 * i)
-            href_list = self._search()
+        for href_list in pages:
             urls = self._clean_results(href_list)
 
             # Now try to create ParseResult objects from the URL
@@ -157,49 +211,65 @@ class GoogleScraper:
 
     # private internal functions who implement the actual stuff
 
+    def _search_page(self, offset):
+        if self.cache is not None:
+            href_list = self.cache.get(self.search_term, offset, self.language)
+            if href_list is not None:
+                return href_list
+        try:
+            href_list = self._search(offset)
+        except GoogleRequestError as err:
+            print('[-] Page at offset {} failed: {}'.format(offset, err))
+            self.errors.append(err)
+            return []
+        if self.cache is not None:
+            self.cache.set(self.search_term, offset, self.language, href_list)
+        return href_list
+
     # When random == True, several headers (like the UA) are chosen
     # randomly.
-    def _build_query(self, random=False):
-        self._GOOGLE_SEARCH_PARAMS['q'] = self.search_term
-        self._GOOGLE_SEARCH_PARAMS['num'] = self.number_results_page
-        self._GOOGLE_SEARCH_PARAMS['start'] = str(self.offset)
-        self._GOOGLE_SEARCH_PARAMS['lr'] = self.language
-
+    def _build_query(self, offset, random=False):
+        params = dict(self._GOOGLE_SEARCH_PARAMS)
+        params['q'] = self.search_term
+        params['num'] = self.number_results_page
+        params['start'] = str(offset)
+        params['lr'] = self.language
+
+        headers = dict(self._HEADERS)
         if random:
-            self._HEADERS['User-Agent'] = choice(self._UAS)
+            headers['User-Agent'] = choice(self._UAS)
+        return params, headers
 
     # Search via google and parse with lxml
     # private function
-    def _search(self):
-        self._build_query()
+    def _search(self, offset):
+        params, headers = self._build_query(offset)
 
+        self.rate_limiter.wait()
         try:
-            r = requests.get(self._GOOGLE_SEARCH, headers=self._HEADERS,
-                            params=self._GOOGLE_SEARCH_PARAMS, timeout=3.0)
+            r = self.session.get(self.search_url, headers=headers,
+                                 params=params, timeout=3.0)
         except requests.ConnectionError as cerr:
-            print('Network problem occured')
-            sys.exit(1)
+            raise GoogleRequestError('Network problem occured: {}'.format(cerr))
         except requests.Timeout as terr:
-            print('Connection timeout')
-            sys.exit(1)
+            raise GoogleRequestError('Connection timeout')
 
         if not r.ok:
-            print('HTTP Error:', r.status_code)
+            message = 'HTTP Error: {}'.format(r.status_code)
             if str(r.status_code)[0] == '5':
-                print('Maybe google recognizes you as sneaky spammer after'
-                      ' you requested their services too inexhaustibly :D')
-            sys.exit(1)
+                message += (' Maybe google recognizes you as sneaky spammer after'
+                            ' you requested their services too inexhaustibly :D')
+            raise GoogleRequestError(message)
 
         html = r.text
 
         try:
             dom = lxml.html.fromstring(html)
             links = dom.cssselect('a')
-        except NameError:
-            print('Some error occured while lxml tried to parse')
-            sys.exit(1)
+        except (NameError, lxml.etree.ParserError):
+            raise GoogleRequestError('Some error occured while lxml tried to parse')
 
-        return [e.get('href') for e in links]
+        return [e.get('href') for e in links if e.get('href')]
 
 
     # Clean all href attributes within a a element and returns
@@ -231,7 +301,7 @@ class GoogleScraper:
                     hit = ['found' for b in BADBOYS if b in u]
                     if not hit:
                         cleaned.append(u)
-            elif isinstance(e, str):
+            elif isinstance(e, basestring):
                 hit = ['found' for b in BADBOYS if b in e]
                 if not hit:
                     cleaned.append(e)
@@ -241,10 +311,12 @@ class GoogleScraper:
 
         return cleaned
 
-def scrape(query, results_per_page=100, number_pages=1, offset=0, language=''):
+def scrape(query, results_per_page=100, number_pages=1, offset=0, language='', **kwargs):
     """
     Search for terms and return a list of all URLs.
+    Extra keyword arguments (session, cache, rate_limiter, threads,
+    search_url) are passed to GoogleScraper.
     """
-    scraper = GoogleScraper(query, number_results_page=results_per_page, offset=offset, language=language)
+    scraper = GoogleScraper(query, number_results_page=results_per_page, offset=offset, language=language, **kwargs)
     results = scraper.search(number_pages=number_pages)
     return [url for url in results]
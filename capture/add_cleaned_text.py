@@ -1,13 +1,17 @@
+import argparse
 import logging
-import pymongo
+import os
 import sys
-import goose
-import pymongo
 import zlib
 import pickle as CP
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pymongo
+
 import settings
 from downloader import goosefy
+from utilities.migration import Migration
 
 
 # This is not defined in config.py because this log is specific to this tool,
@@ -16,38 +20,61 @@ from downloader import goosefy
 LOG_FILE = '/tmp/goose_migration.log'
 LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
 
-logging.basicConfig(filename=LOG_FILE, format=LOG_FORMAT, level=logging.INFO)
-stdout_handler = logging.StreamHandler(sys.stdout)
-stdout_handler.setFormatter(logging.Formatter(LOG_FORMAT))
-logger = logging.getLogger()
-logger.addHandler(stdout_handler)
 
-mongo_client = pymongo.MongoClient(settings.MONGOHOST)
-collection = mongo_client.MCDB.articles
-
-cursor = collection.find({'cleaned_text': {'$exists': False}},
-        timeout=False)
-
-total = cursor.count()
-if total == 0:
-    logging.info('There are no articles to update \o/')
-    sys.exit(0)
-
-logging.info("We have {:d} articles to update.".format(total))
-i = 0
-for article in cursor:
+def add_cleaned_text(article):
+    """
+    Migration transform: extract the text of an article from its page.
+    """
     try:
         decompressed = zlib.decompress(article['link_content'])
         orig_html = CP.loads(decompressed)
+        article.pop('reextract', None)
         cleaned_text = goosefy(orig_html, article)
-        collection.update({'_id': article['_id']}, {'$set':
-            {'cleaned_text': cleaned_text}})
+        update = {'$set': {'cleaned_text': cleaned_text}}
+        if not article.get('reextract'):
+            update['$unset'] = {'reextract': ''}
+        return update
     except Exception as e:
-        logger.exception('_id: %s [Exception] %s', article['_id'], e)
-        collection.update({'_id': article['_id']}, {'$set':
-            {'cleaned_text': article.get('summary', '')}})
-    i += 1
-    if (i % 1000) == 0:
-        logging.info('{:010d}/{:010d} articles updated.'.format(i, total))
-
-cursor.close()
+        logging.exception('_id: %s [Exception] %s', article['_id'], e)
+        return {'$set': {'cleaned_text': article.get('summary', '')}}
+
+
+def reextract_later(article):
+    """
+    Migration timeout: keep the fallback text and the article flagged.
+    """
+    return {'$set': {'cleaned_text': article.get('cleaned_text', article.get('summary', '')), 'reextract': True}}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Extract the text of the articles without one')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='number of worker processes (default: one per CPU)')
+    parser.add_argument('--resume', action='store_true', help='continue the previous run where it stopped')
+    args = parser.parse_args()
+
+    logging.basicConfig(filename=LOG_FILE, format=LOG_FORMAT, level=logging.INFO)
+    stdout_handler = logging.StreamHandler(sys.stdout)
+    stdout_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logging.getLogger().addHandler(stdout_handler)
+
+    # The migration workers can't start the watchdog processes, the engine
+    # runs in them directly, interrupted after REEXTRACTION_TIME seconds
+    settings.EXTRACTION_WATCHDOG = False
+
+    mongo_client = pymongo.MongoClient(settings.MONGOHOST)
+    collection = mongo_client.MCDB.articles
+
+    # Articles without text, or stored with a fallback text because the extraction
+    # failed or timed out (see watchdog.py)
+    query = {'$or': [{'cleaned_text': {'$exists': False}}, {'reextract': True}]}
+    if collection.find(query).count() == 0:
+        logging.info('There are no articles to update \o/')
+        sys.exit(0)
+
+    migration = Migration('add_cleaned_text', collection, query, add_cleaned_text,
+                          fields=['link', 'link_content', 'summary', 'cleaned_text', 'reextract'],
+                          processes=args.processes, time_limit=settings.REEXTRACTION_TIME,
+                          on_timeout=reextract_later)
+    total, updated, errors = migration.run(args.resume)
+    logging.info('{:d} articles updated, {:d} errors.'.format(updated, errors))
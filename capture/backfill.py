@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+u"""
+Historical backfill of the news outlets described in `outlets/*.json`.
+
+The archive of an outlet is the sequence of its older index pages (the
+`pages` entry of the outlet file). The page range of each category is split
+into partitions which are crawled in parallel by a pool of threads, while the
+shared fetcher keeps the requests to each host spaced. Every partition is
+checkpointed in the `crawler_backfill` collection after each page, so an
+interrupted backfill resumes where it stopped when run again with the same
+arguments.
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import argparse
+import datetime
+import time
+from multiprocessing.pool import ThreadPool
+
+
+import connections
+import crawler
+import fetcher
+import logging_mc
+import memory
+import metrics
+import profiling
+import settings
+import warc
+import watchdog
+
+
+logger = logging_mc.get_logger('backfill')
+
+MCDB = connections.MCDB
+PARTITIONS = MCDB.crawler_backfill  # Progress of the partitions of the archives
+
+config = {
+    'threads': settings.BACKFILL_THREADS,  # Partitions crawled at the same time
+    'host_interval': settings.BACKFILL_HOST_INTERVAL,
+    'partition_size': 20,  # Index pages per partition
+}
+
+
+def partitions(outlet, last, first=None, size=None):
+    """
+    Split the archive pages of an outlet into partitions.
+    :param last: last index page to crawl
+    :param first: first index page to crawl, by default the first page after the index
+    :param size: number of pages per partition
+    :return: list of partition dicts, in the format stored in `crawler_backfill`
+    """
+    size = config['partition_size'] if size is None else size
+    first = outlet['pages'].get('first', 2) if first is None else first
+    parts = []
+    for url, category in crawler.index_urls(outlet):
+        for start in xrange(first, last + 1, size):
+            end = min(start + size - 1, last)
+            parts.append({
+                '_id': u'{0}|{1}|{2}-{3}'.format(outlet['name'], category or '', start, end),
+                'outlet': outlet['name'],
+                'category': category,
+                'start': start,
+                'end': end,
+            })
+    return parts
+
+
+def pending_partitions(parts):
+    """
+    Return the partitions not completed yet, with the page where each one
+    stopped as `next_page`.
+    """
+    progress = {}
+    ids = [p['_id'] for p in parts]
+    for i in xrange(0, len(ids), 1000):
+        for doc in PARTITIONS.find({'_id': {'$in': ids[i:i + 1000]}}, fields=['done', 'next_page']):
+            progress[doc['_id']] = doc
+    pending = []
+    for part in parts:
+        doc = progress.get(part['_id'], {})
+        if doc.get('done'):
+            continue
+        pending.append(dict(part, next_page=doc.get('next_page', part['start'])))
+    return pending
+
+
+def checkpoint(part, next_page, stored, done=False):
+    PARTITIONS.update({'_id': part['_id']},
+                      {'$set': {'outlet': part['outlet'], 'category': part['category'],
+                                'start': part['start'], 'end': part['end'],
+                                'next_page': next_page, 'done': done, 'updated': datetime.datetime.now()},
+                       '$inc': {'stored': stored}},
+                      upsert=True)
+
+
+class Backfill(object):
+    def __init__(self, outlets, threads=None, host_interval=None):
+        self.outlets = dict((o['name'], o) for o in outlets)
+        self.threads = config['threads'] if threads is None else threads
+        host_interval = config['host_interval'] if host_interval is None else host_interval
+        self.http = fetcher.Fetcher(pool_size=self.threads, host_interval=host_interval)
+
+    def crawl_page(self, outlet, category, page):
+        """
+        Crawl the articles of an archive page that are not stored yet.
+        :return: (number of links in the page, number of articles stored),
+                 or None if the page could not be fetched
+        """
+        url = outlet['pages']['url'].format(category=category, page=page)
+        with metrics.stage('index_fetch'):
+            response = self.http.get(url)
+        if response is None:
+            metrics.error('index_fetch')
+            return None
+        tree = crawler.parse_html(response.content)
+        if tree is None:
+            logger.error("Could not parse index page %s", url)
+            return 0, 0
+        links = crawler.find_links(outlet, tree, response.url)
+        known = crawler.known_links(links)
+        articles = []
+        for link in links:
+            if link in known:
+                continue
+            try:
+                article = crawler.download_article(outlet, self.http, link, category)
+            except Exception as e:
+                logger.exception("Failed to crawl %s: %s", link, e)
+                continue
+            if article is not None:
+                articles.append(article)
+        return len(links), crawler.store_articles(articles, 'backfill')
+
+    def crawl_partition(self, part):
+        """
+        Crawl the pages of a partition from the last checkpoint. The partition
+        is done at its last page or at the end of the archive (a page without
+        links); a page that could not be fetched leaves it pending for the
+        next run.
+        :return: number of articles stored
+        """
+        outlet = self.outlets[part['outlet']]
+        total = 0
+        try:
+            for page in xrange(part['next_page'], part['end'] + 1):
+                result = self.crawl_page(outlet, part['category'], page)
+                if result is None:
+                    logger.warning("Partition %s stopped at page %s", part['_id'], page)
+                    return total
+                if result[0] == 0:
+                    logger.info("End of the archive of %s at page %s", part['_id'], page)
+                    break
+                total += result[1]
+                checkpoint(part, page + 1, result[1])
+            checkpoint(part, part['end'] + 1, 0, done=True)
+        except Exception as e:
+            logger.exception("Partition %s interrupted: %s", part['_id'], e)
+        return total
+
+    def run(self, last, first=None, size=None):
+        """
+        Backfill the archive pages `first` to `last` of every outlet.
+        :return: number of articles stored
+        """
+        t0 = time.time()
+        parts = []
+        for name, outlet in sorted(self.outlets.iteritems()):
+            if not outlet.get('pages'):
+                logger.warning("%s has no archive pages to backfill", name)
+                continue
+            parts.extend(partitions(outlet, last, first, size))
+        pending = pending_partitions(parts)
+        logger.info("%s of %s partitions to crawl", len(pending), len(parts))
+        watchdog.start()
+        pool = ThreadPool(self.threads)
+        stored = 0
+        try:
+            for n, count in enumerate(profiling.interruptible(pool.imap_unordered(self.crawl_partition, pending)), 1):
+                stored += count
+                logger.info("%s/%s partitions crawled, %s articles stored (%.1f articles/s)",
+                            n, len(pending), stored, stored / (time.time() - t0))
+        finally:
+            pool.close()
+            pool.join()
+        return stored
+
+
+def main(names, last, first=None, size=None, threads=None):
+    return Backfill(crawler.load_outlets(names), threads=threads).run(last, first, size)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Crawl the archives of the configured outlets')
+    parser.add_argument('outlets', nargs='*', help='names of the outlets to backfill (default: all)')
+    parser.add_argument('-f', '--first', type=int, default=None, help='first archive page')
+    parser.add_argument('-l', '--last', type=int, required=True, help='last archive page')
+    parser.add_argument('-s', '--size', type=int, default=None, help='pages per partition')
+    parser.add_argument('-t', '--threads', type=int, default=None, help='number of partitions crawled at once')
+    parser.add_argument('--replay', nargs='+', metavar='WARC',
+                        help='fetch the pages from these WARC files or directories instead of the network')
+    parser.add_argument('--update', action='store_true',
+                        help='with --replay, update the articles already stored instead of skipping them')
+    args = parser.parse_args()
+    if args.replay:
+        warc.start_replay(args.replay, args.update)
+    watchdog.start()  # before the threads of the metrics, profiling and memory
+    metrics.start('backfill')
+    profiling.install('backfill')
+    memory.install('backfill')
+
+    main(args.outlets or None, args.last, args.first, args.size, args.threads)
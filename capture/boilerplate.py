@@ -0,0 +1,128 @@
+#-*- coding:utf-8 -*-
+u"""
+Text density extraction of the body of news articles.
+
+A lighter alternative to Goose working directly on the lxml tree: every
+paragraph-like block is scored by the number of Portuguese stopwords it
+contains, penalized by the share of its text inside links, and the score is
+propagated to its parent and grandparent. The element with the highest score
+is the body of the article and its text blocks are returned in the same
+format as Goose (blocks separated by blank lines).
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import re
+
+
+config = {
+    'min_stopwords': 2,  # Stopwords a block needs to count as text
+    'max_link_density': 0.33,  # Share of the text of a block inside links above which it is navigation
+    'min_words': 3,  # Blocks of the body with fewer words are dropped from the text
+}
+
+STOPWORDS = frozenset(u"""
+a à ao aos aquela aquelas aquele aqueles aquilo as às até com como contra da das de dela delas dele
+deles depois do dos e é ela elas ele eles em entre era eram essa essas esse esses esta está estão
+estas estava estavam este estes eu foi foram há isso isto já lhe lhes mais mas me mesmo meu minha
+muito na nas não nem no nos nós nossa nosso num numa o os ou para pela pelas pelo pelos por porque
+qual quando que quem se sem ser será seu seus sua suas só também te tem têm ter teve tinha um uma
+umas uns vai vão você foi sobre após ainda antes bem cada desde disse diz durante enquanto então
+estar fazer feito foram hoje isso lá onde outra outras outro outros pode podem pois segundo seja
+sendo sido tanto toda todas todo todos três dois duas vez vezes
+""".split())
+
+BLOCK_TAGS = ('p', 'pre', 'td', 'blockquote', 'li', 'dd')
+IGNORED_TAGS = frozenset(['script', 'style', 'noscript', 'iframe', 'form', 'button', 'select', 'nav'])
+
+_WORDS = re.compile(r'\w+', re.UNICODE)
+_SPACES = re.compile(r'\s+', re.UNICODE)
+
+
+def _text(element):
+    """
+    Text of an element without the content of scripts, styles and forms.
+    """
+    parts = []
+    stack = [element]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, basestring):
+            parts.append(item)
+            continue
+        if item.text:
+            parts.append(item.text)
+        for child in reversed(item):
+            if child.tail:
+                stack.append(child.tail)
+            if isinstance(child.tag, basestring) and child.tag not in IGNORED_TAGS:
+                stack.append(child)
+    return _SPACES.sub(u' ', u''.join(parts)).strip()
+
+
+def _ignored(element):
+    return any(a.tag in IGNORED_TAGS for a in element.iterancestors())
+
+
+def block_stats(element):
+    """
+    :return: (text, number of words, number of stopwords, link density) of a block
+    """
+    text = _text(element)
+    words = _WORDS.findall(text.lower())
+    if not words:
+        return text, 0, 0, 0.0
+    link_chars = sum(len(_text(a)) for a in element.iter('a'))
+    stopwords = sum(1 for w in words if w in STOPWORDS)
+    return text, len(words), stopwords, min(1.0, link_chars / float(max(len(text), 1)))
+
+
+def top_node(tree):
+    """
+    Return the element holding the body of the article, or None.
+    """
+    scores = {}
+    for block in tree.iter(*BLOCK_TAGS):
+        if _ignored(block):
+            continue
+        text, words, stopwords, link_density = block_stats(block)
+        if stopwords < config['min_stopwords'] or link_density > config['max_link_density']:
+            continue
+        score = stopwords * (1.0 - link_density)
+        parent = block.getparent()
+        if parent is None:
+            continue
+        scores[parent] = scores.get(parent, 0.0) + score
+        grandparent = parent.getparent()
+        if grandparent is not None:
+            scores[grandparent] = scores.get(grandparent, 0.0) + score / 2
+    if not scores:
+        return None
+    return max(scores.iteritems(), key=lambda s: s[1])[0]
+
+
+def node_text(node):
+    """
+    Text of the blocks of the body which are not navigation, separated by blank lines.
+    """
+    paragraphs = []
+    for child in node if len(node) else [node]:
+        if not isinstance(child.tag, basestring) or child.tag in IGNORED_TAGS:
+            continue
+        text, words, stopwords, link_density = block_stats(child)
+        if words >= config['min_words'] and link_density <= config['max_link_density']:
+            paragraphs.append(text)
+    return u'\n\n'.join(paragraphs)
+
+
+def extract(tree):
+    """
+    Find the body of the article in an lxml tree.
+    :return: (body element, text), (None, u'') if no text was found
+    """
+    node = top_node(tree)
+    if node is None:
+        return None, u''
+    return node, node_text(node)
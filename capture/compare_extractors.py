@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+u"""
+Compare the extraction engines on a sample of the stored articles.
+
+Every engine extracts the text of the same pages (the `link_content` of the
+articles); the texts are compared word by word with those of the reference
+engine (Goose) and the speed of each engine is reported, e.g.::
+
+    python capture/compare_extractors.py --limit 500 --source crawler_Valor
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import argparse
+import random
+import re
+import time
+
+
+import connections
+import extraction
+from downloader import decompress_content
+
+
+MCDB = connections.MCDB
+ARTICLES = MCDB.articles  # Article Collection
+
+_WORDS = re.compile(r'\w+', re.UNICODE)
+
+
+def load_sample(limit, source=None, seed=None):
+    """
+    Return a random sample of `limit` stored pages as (url, html) tuples.
+    """
+    query = {'link_content': {'$exists': True}}
+    if source is not None:
+        query['source'] = source
+    total = ARTICLES.find(query).count()
+    skip = random.Random(seed).randint(0, max(total - limit, 0))
+    sample = []
+    for article in ARTICLES.find(query, fields=['link', 'link_content'], skip=skip, limit=limit):
+        try:
+            sample.append((article['link'], decompress_content(article['link_content'])))
+        except Exception:
+            continue
+    return sample
+
+
+def word_scores(text, reference):
+    """
+    Precision, recall and F1 of the words of `text` against those of `reference`.
+    """
+    words = _WORDS.findall(text.lower())
+    expected = _WORDS.findall(reference.lower())
+    if not words or not expected:
+        return (1.0, 1.0, 1.0) if words == expected else (0.0, 0.0, 0.0)
+    counts = {}
+    for w in expected:
+        counts[w] = counts.get(w, 0) + 1
+    common = 0
+    for w in words:
+        if counts.get(w, 0) > 0:
+            counts[w] -= 1
+            common += 1
+    precision, recall = common / float(len(words)), common / float(len(expected))
+    f1 = 2 * precision * recall / (precision + recall) if common else 0.0
+    return precision, recall, f1
+
+
+def run_engine(engine, sample):
+    """
+    Extract the text of every page of the sample.
+    :return: (list of texts, seconds spent)
+    """
+    texts = []
+    t0 = time.time()
+    for url, html in sample:
+        tree = extraction.parse_html(html)
+        try:
+            texts.append(extraction.extract_article(html, tree, url, engine=engine).cleaned_text or u'')
+        except Exception:
+            texts.append(u'')
+    return texts, time.time() - t0
+
+
+def compare(sample, engines=extraction.ENGINES, reference='goose'):
+    """
+    :return: dict engine -> {'seconds', 'pages_per_second', 'precision', 'recall', 'f1', 'empty', 'worst'}
+    """
+    texts, report = {}, {}
+    for engine in engines:
+        texts[engine], seconds = run_engine(engine, sample)
+        report[engine] = {'seconds': seconds, 'pages_per_second': len(sample) / seconds if seconds else 0.0,
+                          'empty': sum(1 for t in texts[engine] if not t)}
+    for engine in engines:
+        scores = [word_scores(t, r) for t, r in zip(texts[engine], texts[reference])]
+        n = float(len(scores) or 1)
+        report[engine].update({
+            'precision': sum(s[0] for s in scores) / n,
+            'recall': sum(s[1] for s in scores) / n,
+            'f1': sum(s[2] for s in scores) / n,
+            'worst': sorted(zip([s[2] for s in scores], [url for url, _ in sample]))[:5],
+        })
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the speed and output of the extraction engines')
+    parser.add_argument('-l', '--limit', type=int, default=200, help='number of stored pages to extract')
+    parser.add_argument('-s', '--source', default=None, help='only pages of this source')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the random sample')
+    args = parser.parse_args()
+
+    sample = load_sample(args.limit, args.source, args.seed)
+    print "{0} pages".format(len(sample))
+    for engine, r in sorted(compare(sample).iteritems()):
+        print "{0:8} {1:8.1f} pages/s  precision {2:.3f}  recall {3:.3f}  F1 {4:.3f}  empty {5}".format(
+            engine, r['pages_per_second'], r['precision'], r['recall'], r['f1'], r['empty'])
+        for f1, url in r['worst'] if engine != 'goose' else []:
+            print "    {0:.3f} {1}".format(f1, url)
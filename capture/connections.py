@@ -0,0 +1,223 @@
+#-*- coding:utf-8 -*-
+u"""
+Connections of the capture processes to MongoDB, Elasticsearch and PyPLN.
+
+Importing a module of the capture connects to nothing: the collections of
+`MCDB` (``FEEDS = connections.MCDB.feeds``) stand for the collections of
+the MCDB database and connect on their first use, through a single
+`pymongo.MongoClient` per process whose pool is shared by all the modules
+and threads. `mongo`, `elastic` and `pypln` return the clients of the
+process, created on their first call. The clients are created again in
+forked processes, since a client can't be used across a fork.
+
+`SPHINX_IDS` numbers the articles at their insertion (their `sphinx_id`),
+as Sphinx needs an integer id unique across its main and delta indexes.
+
+The indexes of the collections are not created on import either: they are
+listed in `INDEXES`, and created by::
+
+    python capture/connections.py ensure-indexes
+
+to run once when deploying, and again when an index is added to the list.
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import argparse
+import os
+import threading
+
+import pymongo
+from pymongo.collection import Collection as _PymongoCollection
+from pymongo.database import Database as _PymongoDatabase
+
+import logging_mc
+import settings
+
+
+logger = logging_mc.get_logger('connections')
+
+_lock = threading.Lock()
+_clients = {}  # service -> (pid, client)
+
+# (collection of MCDB, keys, options of ensure_index)
+INDEXES = [
+    ('articles', [("link", pymongo.ASCENDING), ("published", pymongo.ASCENDING)], {}),
+    ('articles', [("published", pymongo.DESCENDING)], {}),
+    ('articles', [("cleaned_text", pymongo.ASCENDING)], {}),
+    ('articles', [("source", pymongo.ASCENDING)], {}),
+    ('articles', [("status", pymongo.ASCENDING)], {}),
+    ('articles', [("pypln_url", pymongo.ASCENDING)], {'sparse': True}),
+    ('articles', [("sphinx_id", pymongo.ASCENDING)], {'unique': True, 'sparse': True}),
+    ('feeds', [("subtitle_detail.base", pymongo.ASCENDING)], {}),
+    # key to ensure uniqueness of feeds in the table
+    ('feeds', [("subtitle_detail.base", pymongo.ASCENDING), ("link", pymongo.ASCENDING)],
+     {'unique': True, 'dropDups': True}),
+    ('feeds', [("last_visited", pymongo.DESCENDING), ("updated", pymongo.DESCENDING)], {}),
+    ('urls', [("url", pymongo.ASCENDING)], {'unique': True}),
+    ('urls', [("fetched_on", pymongo.ASCENDING)], {}),
+    ('domain_edges', [("src", pymongo.ASCENDING)], {}),
+    ('domain_rank', [("rank", pymongo.DESCENDING)], {}),
+    ('crawler_backfill', [("outlet", pymongo.ASCENDING), ("done", pymongo.ASCENDING)], {}),
+    ('freshness', [("hour", pymongo.DESCENDING)], {}),
+    ('traces', [("trace", pymongo.ASCENDING)], {}),
+    ('traces', [("start", pymongo.ASCENDING)], {'expireAfterSeconds': int(settings.TRACE_RETENTION * 86400)}),
+    ('outbox', [("created", pymongo.ASCENDING)], {'expireAfterSeconds': int(settings.OUTBOX_RETENTION * 86400)}),
+]
+
+
+def _shared(service, create):
+    pid = os.getpid()
+    entry = _clients.get(service)
+    if entry is None or entry[0] != pid:
+        with _lock:
+            entry = _clients.get(service)
+            if entry is None or entry[0] != pid:
+                entry = _clients[service] = (pid, create())
+    return entry[1]
+
+
+def mongo():
+    """
+    :return: the MongoClient of the process
+    """
+    return _shared('mongo', lambda: pymongo.MongoClient(settings.MONGOHOST, 27017,
+                                                        max_pool_size=settings.MONGO_POOL_SIZE))
+
+
+def elastic():
+    """
+    :return: the Elasticsearch client of the process
+    """
+    def create():
+        import elasticsearch
+        return elasticsearch.Elasticsearch(hosts=[settings.ELASTICHOST])
+    return _shared('elastic', create)
+
+
+def pypln():
+    """
+    :return: the PyPLN client of the process, logged in
+    """
+    def create():
+        from pypln.api import PyPLN
+        return PyPLN(settings.PYPLNHOST, settings.PYPLN_CREDENTIALS)
+    return _shared('pypln', create)
+
+
+class Collection(object):
+    """
+    Collection of the MongoClient of the process, looked up on first use.
+    Attributes other than the methods of pymongo collections are
+    sub-collections, as in pymongo.
+    """
+    def __init__(self, database, name):
+        self.name = name
+        self._database = database
+        self._pid = None
+        self._collection = None
+
+    def collection(self):
+        """
+        :return: the pymongo collection
+        """
+        if self._pid != os.getpid():
+            self._collection = mongo()[self._database][self.name]
+            self._pid = os.getpid()
+        return self._collection
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if hasattr(_PymongoCollection, name):
+            return getattr(self.collection(), name)
+        return self[name]
+
+    def __getitem__(self, name):
+        return Collection(self._database, u'{0}.{1}'.format(self.name, name))
+
+    def __repr__(self):
+        return 'Collection({0!r}, {1!r})'.format(self._database, self.name)
+
+
+class Database(object):
+    """
+    Database of the MongoClient of the process, looked up on first use.
+    Attributes other than the methods of pymongo databases are collections.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def database(self):
+        """
+        :return: the pymongo database
+        """
+        return mongo()[self.name]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if hasattr(_PymongoDatabase, name):
+            return getattr(self.database(), name)
+        return self[name]
+
+    def __getitem__(self, name):
+        return Collection(self.name, name)
+
+    def __repr__(self):
+        return 'Database({0!r})'.format(self.name)
+
+
+MCDB = Database('MCDB')
+
+
+class Sequence(object):
+    """
+    Unique integers from 1, reserved by blocks in a document of `counters`
+    and handed out by the threads of the process. The rest of a block is
+    skipped when the process stops.
+    """
+    def __init__(self, counters, name, block=100):
+        self.counters = counters
+        self.name = name
+        self.block = block
+        self._lock = threading.Lock()
+        self._pid = None
+        self._next = self._end = 0
+
+    def next(self):
+        with self._lock:
+            if self._pid != os.getpid() or self._next >= self._end:
+                doc = self.counters.find_and_modify({'_id': self.name}, {'$inc': {'last': self.block}},
+                                                    upsert=True, new=True)
+                self._end = doc['last'] + 1
+                self._next = self._end - self.block
+                self._pid = os.getpid()
+            self._next += 1
+            return self._next - 1
+
+
+SPHINX_IDS = Sequence(MCDB.counters, 'articles.sphinx_id')
+
+
+def ensure_indexes(database=None):
+    """
+    Create the indexes of `INDEXES` missing in the database.
+    :param database: name of the database, MCDB by default
+    """
+    db = mongo()[database or MCDB.name]
+    for collection, keys, options in INDEXES:
+        name = db[collection].ensure_index(keys, **options)
+        logger.info("Index %s of %s ensured", name or keys, collection)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Manage the connections of the capture to its services")
+    subparsers = parser.add_subparsers(dest='command')
+    indexes = subparsers.add_parser('ensure-indexes', help="Create the indexes of the MCDB collections")
+    indexes.add_argument('--database', default=MCDB.name, help="Database, MCDB by default")
+    args = parser.parse_args()
+    if args.command == 'ensure-indexes':
+        ensure_indexes(args.database)
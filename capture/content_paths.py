@@ -0,0 +1,243 @@
+#-*- coding:utf-8 -*-
+u"""
+Per domain cache of the location of the article body.
+
+The pages of an outlet keep the body of the articles in the same element, so
+once we know it there is no need to run the full scoring of the extraction
+engine (Goose by default) on every page. While a domain is being learned
+every page goes through the engine and a CSS selector is derived from the
+node it picked; when the same selector yields the same text as the engine on
+`verify_pages` consecutive pages it is stored in the `content_paths`
+collection and the text of the following pages of the domain is read
+directly from that element. The engine is still used when the selector does
+not match a single element or the text found looks wrong, and on a sample of
+the pages to check that the selector is still valid.
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import datetime
+import re
+import threading
+from collections import namedtuple
+from copy import deepcopy
+
+from lxml.cssselect import CSSSelector
+from lxml.etree import XPathError
+
+import connections
+import extraction
+import logging_mc
+import settings
+import watchdog
+from linkgraph import domain_of
+
+
+logger = logging_mc.get_logger('content_paths')
+
+MCDB = connections.MCDB
+PATHS = MCDB.content_paths  # Verified body selector of each domain
+
+config = {
+    'verify_pages': 5,  # Consecutive pages where the selector must agree with the engine
+    'recheck_every': 50,  # Pages read from the selector between two checks with the engine
+    'max_misses': 3,  # Consecutive misses before the selector of a domain is dropped
+    'min_words': 30,  # Shorter texts are considered wrong and extracted by the engine
+    'min_overlap': 0.9,  # Fraction of the words of the engine that the selector text must contain
+    'max_growth': 1.5,  # Maximum size of the selector text relative to the engine text
+}
+
+Extracted = namedtuple('Extracted', ['title', 'cleaned_text', 'selector'])
+
+_IGNORED_TAGS = ('script', 'style', 'noscript', 'iframe', 'form', 'button')
+_WORDS = re.compile(r'\w+', re.UNICODE)
+_SPACES = re.compile(r'\s+', re.UNICODE)
+
+
+def node_text(node):
+    """
+    Text of an element in the format of Goose: the text of its children,
+    with white space collapsed, separated by blank lines.
+    """
+    node = deepcopy(node)
+    for element in node.iter(*_IGNORED_TAGS):
+        element.drop_tree()
+    paragraphs = []
+    for child in [node] if not len(node) else node:
+        if not isinstance(child.tag, basestring):
+            continue
+        text = _SPACES.sub(u' ', child.text_content()).strip()
+        if len(_WORDS.findall(text)) >= 3:
+            paragraphs.append(text)
+    return u'\n\n'.join(paragraphs)
+
+
+def select_text(tree, selector):
+    """
+    Return the text of the single element matched by `selector`, or None.
+    """
+    try:
+        nodes = CSSSelector(selector)(tree)
+    except (XPathError, SyntaxError, ValueError) as e:
+        logger.warning("Invalid selector %s: %s", selector, e)
+        return None
+    if len(nodes) != 1:
+        return None
+    return node_text(nodes[0])
+
+
+def engine_extract(html, tree=None, url=None, engine=None):
+    """
+    Run the extraction engine, and read the node it picked with its selector
+    on the same tree, so that the page is parsed once also in the workers of
+    the watchdog.
+    :return: (`extraction.Extraction`, text of its body selector or None)
+    """
+    tree = extraction.parse_html(html) if tree is None else tree
+    news = extraction.extract_text(html, tree, url, engine)
+    return news, body_text(tree, news)
+
+
+def body_text(tree, news):
+    if tree is None or news.body_selector is None:
+        return None
+    return select_text(tree, news.body_selector)
+
+
+def looks_right(text):
+    return text is not None and len(_WORDS.findall(text)) >= config['min_words']
+
+
+def same_text(text, reference):
+    """
+    Whether the text read with a selector matches the text extracted by the engine.
+    """
+    if not text or not reference:
+        return False
+    words = set(w.lower() for w in _WORDS.findall(text))
+    expected = set(w.lower() for w in _WORDS.findall(reference))
+    if not expected:
+        return False
+    overlap = len(words & expected) / float(len(expected))
+    return overlap >= config['min_overlap'] and len(text) <= config['max_growth'] * len(reference)
+
+
+class ContentPaths(object):
+    """
+    Learned selectors, by domain. Each domain is in one of two states: being
+    learned (`candidate` and the number of pages it agreed with the engine in
+    a row) or verified (`selector`, with the pages read since the last check and
+    the consecutive misses).
+    """
+    def __init__(self, extract_text=None):
+        """
+        :param extract_text: function running the extraction engine, with the
+                             signature of `extraction.extract_text`. By default
+                             the engine runs under the watchdog if
+                             `settings.EXTRACTION_WATCHDOG` is set.
+        """
+        self._extract_text = extract_text
+        self._domains = {}
+        self._lock = threading.Lock()
+
+    def run_engine(self, html, tree, url):
+        """
+        :return: (`extraction.Extraction`, text of its body selector or None)
+        """
+        if self._extract_text is not None:
+            tree = extraction.parse_html(html) if tree is None else tree
+            news = self._extract_text(html, tree, url)
+            return news, body_text(tree, news)
+        if settings.EXTRACTION_WATCHDOG:
+            # the page is parsed in the worker
+            return watchdog.extract_text(html, url=url, function=engine_extract)
+        return engine_extract(html, tree, url)
+
+    def _state(self, domain):
+        with self._lock:
+            state = self._domains.get(domain)
+        if state is not None:
+            return state
+        doc = PATHS.find_one({'_id': domain}, fields=['selector'])
+        state = {'selector': doc['selector'] if doc else None,
+                 'candidate': None, 'agreements': 0, 'since_check': 0, 'misses': 0}
+        with self._lock:
+            return self._domains.setdefault(domain, state)
+
+    def extract(self, html, tree=None, url=None):
+        """
+        Extract the title and text of an article, from the learned selector
+        of its domain when there is one, otherwise with the extraction engine.
+        :return: `Extracted` tuple; its selector is None when the engine was used
+        :raise watchdog.ExtractionError: if the engine failed or ran out of time
+        """
+        domain = domain_of(url)
+        state = self._state(domain) if domain is not None else None
+        selector = state['selector'] if state is not None else None
+        if selector is not None:
+            # read from the selector, parsed here only for the domains which have one
+            tree = extraction.parse_html(html) if tree is None else tree
+        if selector is not None and tree is not None:
+            with self._lock:
+                state['since_check'] += 1
+                check = state['since_check'] >= config['recheck_every']
+                if check:
+                    state['since_check'] = 0
+            text = select_text(tree, selector)
+            if looks_right(text) and not check:
+                with self._lock:
+                    state['misses'] = 0
+                return Extracted(extraction.page_title(tree), text, selector)
+            news, _ = self.run_engine(html, tree, url)
+            if looks_right(text) and same_text(text, news.cleaned_text):
+                with self._lock:
+                    state['misses'] = 0
+            else:
+                self._miss(domain, state)
+            return Extracted(news.title, news.cleaned_text, None)
+        news, text = self.run_engine(html, tree, url)
+        if state is not None and selector is None:
+            self._learn(domain, state, news, text)
+        return Extracted(news.title, news.cleaned_text, None)
+
+    def _miss(self, domain, state):
+        with self._lock:
+            state['misses'] += 1
+            if state['misses'] < config['max_misses'] or state['selector'] is None:
+                return
+            logger.warning("Dropping the body selector %s of %s", state['selector'], domain)
+            state.update(selector=None, candidate=None, agreements=0, since_check=0, misses=0)
+        PATHS.remove({'_id': domain})
+
+    def _learn(self, domain, state, news, text):
+        """
+        :param text: text of the body selector of the engine
+        """
+        candidate = news.body_selector
+        agrees = looks_right(text) and same_text(text, news.cleaned_text)
+        with self._lock:
+            if not agrees:
+                state.update(candidate=None, agreements=0)
+                return
+            if candidate != state['candidate']:
+                state.update(candidate=candidate, agreements=0)
+            state['agreements'] += 1
+            if state['agreements'] < config['verify_pages']:
+                return
+            state.update(selector=candidate, candidate=None, agreements=0, since_check=0, misses=0)
+        logger.info("Body of the articles of %s found at %s", domain, candidate)
+        PATHS.update({'_id': domain}, {'$set': {'selector': candidate, 'verified': datetime.datetime.now()}},
+                     upsert=True)
+
+
+PATHS_CACHE = ContentPaths()
+
+
+def extract(html, tree=None, url=None):
+    """
+    Extract the title and text of an article using the shared cache of selectors.
+    See `ContentPaths.extract`.
+    """
+    return PATHS_CACHE.extract(html, tree, url)
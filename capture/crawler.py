@@ -0,0 +1,530 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+u"""
+Crawler engine for the news outlets described in `outlets/*.json`.
+
+Each outlet file declares where its latest news are listed and how to read
+them::
+
+    {
+        "name": "valor",                        # name used on the command line
+        "source": "crawler_Valor",              # value of the `source` field of the articles
+        "index_urls": ["http://www.valor.com.br/ultimas-noticias/{category}"],
+        "categories": ["brasil", "politica"],   # optional, expanded in the index urls
+        "link_selector": "#block-central h2",   # CSS selector of the links (or of their containers)
+        "link_pattern": "/noticia/",            # optional regex the article urls must match
+        "date": {
+            "selector": "span.date",            # CSS selector of the element with the date
+            "attribute": "datetime",            # optional, read an attribute instead of the text
+            "regex": "(\\d{2}/\\d{2}/\\d{4}) .s (\\d{2})h(\\d{2})",  # optional, groups are joined by spaces
+            "formats": ["%d/%m/%Y %H %M"],      # strptime formats; portuguese month names become numbers
+            "fallback_now": false               # use the crawling time when no date is found
+        },
+        "category": {"url_segment": 0},         # optional, category taken from the url path
+        "pages": {                              # optional, older index pages followed in incremental mode
+            "url": "http://www.valor.com.br/ultimas-noticias/{category}/{page}",
+            "first": 2, "max": 10               # number of the first page after the index and of the last one
+        },
+        "continuation": {                       # optional, follow a link when the text is only a teaser
+            "marker": "post completo no blog", "container": "article#news", "link_text": "blog"
+        }
+    }
+
+All outlets are crawled in the same run: index pages are fetched
+concurrently, the links are checked against the database in a single query
+and the new articles are fetched, extracted and inserted in bulk by a pool of
+threads shared by all sites, so a run takes about as long as the slowest site.
+Each article is downloaded once and parsed once: the same lxml tree is used
+to find its date and category and handed to Goose to extract the text.
+
+In incremental mode (``--incremental``), meant for runs every few minutes,
+the index pages are requested with the validators (ETag/Last-Modified) of the
+previous run, so unchanged pages cost a 304, and the older index pages are
+followed only while they still list links that are not stored. The validators
+of a page are kept only once all its new articles are stored, so failed
+downloads are retried on the next run.
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import re
+import sys
+import time
+import urlparse
+from multiprocessing.pool import ThreadPool
+
+import connections
+import content_paths
+import fetcher
+import logging_mc
+import memory
+import metrics
+import outbox
+import profiling
+import settings
+import tracing
+import warc
+import watchdog
+from downloader import EXTRACTED_FIELDS, compress_content, detect_language, update_extracted
+from extraction import page_summary, page_title, parse_html
+from linkgraph import domain_of
+from watchdog import ExtractionError
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utilities.dates import parse_date
+from utilities.parsedates import FULL_MONTHS, MONTHS
+
+
+logger = logging_mc.get_logger('crawler')
+
+MCDB = connections.MCDB
+ARTICLES = MCDB.articles  # Article Collection
+STATE = MCDB.crawler_state  # HTTP validators of the index pages, by url
+
+OUTLETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'outlets')
+
+config = {
+    'threads': settings.CRAWLER_THREADS,  # Threads shared by all the outlets
+    'host_interval': settings.CRAWLER_HOST_INTERVAL,
+    'batch_size': 50,  # Articles inserted per bulk insert
+    'max_pages': 10,  # Default last index page followed in incremental mode
+}
+
+_MONTH_NAMES = dict(MONTHS)
+_MONTH_NAMES.update(FULL_MONTHS)
+_MONTH_REGEX = re.compile(r'\b(' + '|'.join(sorted(_MONTH_NAMES, key=len, reverse=True)) + r')\b', re.UNICODE)
+
+
+def load_outlets(names=None):
+    """
+    Read the outlet configurations.
+    :param names: names of the outlets to load, all of them if None
+    :return: list of outlet configuration dicts
+    """
+    outlets = []
+    for path in sorted(glob.glob(os.path.join(OUTLETS_DIR, '*.json'))):
+        with open(path) as f:
+            outlet = json.load(f)
+        if names is None or outlet['name'] in names:
+            outlets.append(outlet)
+    if names is not None:
+        missing = set(names) - set(o['name'] for o in outlets)
+        if missing:
+            raise ValueError("Unknown outlets: {0}".format(', '.join(sorted(missing))))
+    return outlets
+
+
+def index_urls(outlet):
+    """
+    Expand the index url patterns of an outlet.
+    :return: list of (index url, category) tuples
+    """
+    urls = []
+    for pattern in outlet['index_urls']:
+        if '{category}' in pattern:
+            urls.extend((pattern.format(category=c), c) for c in outlet.get('categories', []))
+        else:
+            urls.append((pattern, None))
+    return urls
+
+
+def find_links(outlet, tree, base_url):
+    """
+    Return the article urls selected by the `link_selector` of the outlet.
+    """
+    pattern = re.compile(outlet['link_pattern']) if outlet.get('link_pattern') else None
+    links = []
+    for element in tree.cssselect(outlet['link_selector']):
+        anchor = element if element.tag == 'a' else next(element.iter('a'), None)
+        if anchor is None or not anchor.get('href'):
+            continue
+        url = urlparse.urljoin(base_url, anchor.get('href').strip())
+        if pattern is not None and not pattern.search(url):
+            continue
+        if url not in links:
+            links.append(url)
+    return links
+
+
+def page_url(outlet, category, page):
+    """
+    Return the url of an older index page of an outlet, or None if the outlet
+    is not paginated or `page` is past the last page to follow.
+    """
+    pages = outlet.get('pages')
+    if not pages or page > pages.get('max', config['max_pages']):
+        return None
+    return pages['url'].format(category=category, page=page)
+
+
+def parse_outlet_date(text, date_config, source=None):
+    """
+    Parse a date string following the `date` section of an outlet configuration.
+    :param source: name of the outlet, to memoize the format of its dates
+    """
+    text = text.strip()
+    if date_config.get('regex'):
+        match = re.search(date_config['regex'], text, re.UNICODE)
+        if match is None:
+            return None
+        text = ' '.join(match.groups()) if match.groups() else match.group(0)
+    formats = date_config.get('formats')
+    if not formats:
+        try:
+            return parse_date(text, source)
+        except ValueError:
+            return None
+    text = _MONTH_REGEX.sub(lambda m: str(_MONTH_NAMES[m.group(1)]), text.lower())
+    for fmt in formats:
+        try:
+            return datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def extract_date(outlet, tree):
+    date_config = outlet.get('date', {})
+    published = None
+    for element in tree.cssselect(date_config['selector']) if 'selector' in date_config else []:
+        if date_config.get('attribute'):
+            value = element.get(date_config['attribute'])
+        else:
+            value = element.text_content()
+        published = parse_outlet_date(value, date_config, outlet['name']) if value else None
+        if published is not None:
+            break
+    if published is None:
+        logger.warning("No date found for an article of %s", outlet['name'])
+        if date_config.get('fallback_now'):
+            published = datetime.datetime.now()
+    return published
+
+
+def extract_category(outlet, url, index_category):
+    category_config = outlet.get('category', {})
+    if 'url_segment' in category_config:
+        path = [p for p in urlparse.urlparse(url).path.split('/') if p]
+        if len(path) > category_config['url_segment'] + 1:
+            return path[category_config['url_segment']]
+        return None
+    return index_category
+
+
+def follow_continuation(outlet, http, tree, url, text):
+    """
+    Some articles are only a teaser for a full post elsewhere (e.g. a blog).
+    Returns the (url, text) of the full post, or the original ones.
+    """
+    cont = outlet.get('continuation')
+    if not cont or cont['marker'] not in text:
+        return url, text
+    containers = tree.cssselect(cont['container'])
+    targets = [a.get('href') for c in containers for a in c.iter('a')
+               if a.get('href') and a.text_content().strip() == cont['link_text']]
+    if len(targets) != 1:
+        logger.error("Could not find the continuation of %s", url)
+        return url, text
+    response = http.get(urlparse.urljoin(url, targets[0]))
+    if response is None:
+        return url, text
+    html = fetcher.decode(response)
+    try:
+        return response.url, content_paths.extract(html, parse_html(html), response.url).cleaned_text
+    except ExtractionError as e:
+        logger.error("Could not extract the continuation of %s: %s", url, e)
+        return url, text
+
+
+def download_article(outlet, http, url, index_category=None):
+    """
+    Fetch an article and extract its fields.
+    :return: article dict or None if it could not be fetched or has no text
+    """
+    trace = tracing.new_trace()
+    with metrics.stage('article_fetch', trace):
+        response = http.get(url)
+    if response is None:
+        metrics.error('article_fetch')
+        return None
+    html = fetcher.decode(response)
+    tree = parse_html(html)
+    if tree is None:
+        logger.error("Could not parse %s", url)
+        return None
+    try:
+        with metrics.stage('extraction', trace):
+            news = content_paths.extract(html, tree, response.url)
+        title, text, reextract = news.title, news.cleaned_text or u'', False
+    except ExtractionError as e:
+        # stored with the description of the page until add_cleaned_text.py extracts it again
+        logger.error("Could not extract the text of %s: %s", url, e)
+        title, text, reextract = page_title(tree), page_summary(tree), True
+    full_post, text = follow_continuation(outlet, http, tree, url, text)
+    if not text:
+        logger.warning("No text extracted from %s", url)
+        return None
+    with metrics.stage('language_detection', trace):
+        lang = detect_language(text, domain_of(full_post))
+    article = {
+        'link': url,  # as listed in the index, for `known_links`
+        'source': outlet['source'],
+        'link_content': compress_content(html),
+        'compressed': True,
+        'language': lang,
+        'title': title,
+        'cleaned_text': text,
+        'published': extract_date(outlet, tree),
+        'category': extract_category(outlet, url, index_category),
+        'crawled': datetime.datetime.now(),
+        'trace_id': trace,
+    }
+    if reextract:
+        article['reextract'] = True
+    if full_post != url:
+        article['continuation_link'] = full_post
+    return article
+
+
+def known_links(links):
+    """
+    Return the subset of `links` already stored, with one query per thousand
+    links. None is known when a replay updates the stored articles.
+    """
+    links = list(links)
+    known = set()
+    if warc.updating():
+        return known
+    for i in xrange(0, len(links), 1000):
+        cursor = ARTICLES.find({'link': {'$in': links[i:i + 1000]}}, fields=['link'])
+        known.update(doc['link'] for doc in cursor)
+    return known
+
+
+def load_validators(urls):
+    """
+    Return the validators stored for the index pages in `urls`, as a dict
+    url -> {'etag': ..., 'last_modified': ...}
+    """
+    urls = list(urls)
+    validators = {}
+    for i in xrange(0, len(urls), 1000):
+        for doc in STATE.find({'_id': {'$in': urls[i:i + 1000]}}, fields=['etag', 'last_modified']):
+            validators[doc['_id']] = doc
+    return validators
+
+
+def save_validators(validators):
+    """
+    Store the validators of index pages.
+    :param validators: dict url -> {'etag': ..., 'last_modified': ...}
+    """
+    if not validators:
+        return
+    now = datetime.datetime.now()
+    bulk = STATE.initialize_unordered_bulk_op()
+    for url, v in validators.iteritems():
+        bulk.find({'_id': url}).upsert().update(
+            {'$set': {'etag': v.get('etag'), 'last_modified': v.get('last_modified'), 'checked': now}})
+    bulk.execute()
+
+
+def conditional_headers(validators):
+    """
+    Headers making a request conditional on the validators of a previous response.
+    """
+    headers = {}
+    if validators and validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators and validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
+
+def store_articles(articles, process='crawler'):
+    """
+    Insert the new articles, found with `known_links`; the stored ones are
+    updated instead when a replay updates them.
+    :return: number of articles inserted
+    """
+    if articles and warc.updating():
+        articles = update_stored(articles)
+    if not articles:
+        return 0
+    write = metrics.stage('mongo_write')
+    with write:
+        for article in articles:
+            article['sphinx_id'] = connections.SPHINX_IDS.next()
+        ARTICLES.insert(articles, w=1)
+    seconds = time.time() - write.t0
+    for article in articles:
+        tracing.record(article.get('trace_id'), 'mongo_write', write.t0, seconds)
+    # the dates of the outlets are in local time, as `crawled`
+    outbox.publish([outbox.event(article, article['crawled']) for article in articles])
+    metrics.ARTICLES_STORED.labels(process).inc(len(articles))
+    return len(articles)
+
+
+def update_stored(articles):
+    """
+    Update the stored articles among `articles` with their new extraction.
+    :return: the articles not stored yet
+    """
+    stored = {}
+    for doc in ARTICLES.find({'link': {'$in': [a['link'] for a in articles]}}, fields=['link']):
+        stored[doc['link']] = doc['_id']
+    with metrics.stage('mongo_write'):
+        for article in articles:
+            if article['link'] in stored:
+                update_extracted(stored[article['link']], article,
+                                 EXTRACTED_FIELDS + ['title', 'published', 'category'])
+    return [a for a in articles if a['link'] not in stored]
+
+
+class Crawler(object):
+    def __init__(self, outlets, threads=None, host_interval=None, incremental=False):
+        self.outlets = outlets
+        self.threads = config['threads'] if threads is None else threads
+        self.incremental = incremental
+        host_interval = config['host_interval'] if host_interval is None else host_interval
+        self.http = fetcher.Fetcher(pool_size=self.threads, host_interval=host_interval)
+        self.validators = {}  # Validators of the index pages sent in the conditional requests
+        self.pages = {}  # index url -> (validators of the response, links not stored)
+
+    def _read_index(self, task):
+        """
+        Fetch an index page; `page` is None for the pages in `index_urls`.
+        :return: (task, links, validators); links is None if the page is unchanged
+        """
+        outlet, url, category, page = task
+        headers = conditional_headers(self.validators.get(url)) if self.incremental else {}
+        with metrics.stage('index_fetch'):
+            response = self.http.get(url, headers=headers)
+        if response is None:
+            metrics.error('index_fetch')
+            return task, [], None
+        if response.status_code == 304:
+            return task, None, None
+        validators = {'etag': response.headers.get('etag'),
+                      'last_modified': response.headers.get('last-modified')}
+        tree = parse_html(response.content)
+        if tree is None:
+            logger.error("Could not parse index page %s", url)
+            return task, [], None
+        return task, find_links(outlet, tree, response.url), validators
+
+    def _download(self, task):
+        outlet, url, category = task
+        try:
+            return url, download_article(outlet, self.http, url, category)
+        except Exception as e:
+            logger.exception("Failed to crawl %s: %s", url, e)
+            return url, None
+
+    def find_new_articles(self, pool):
+        """
+        Read the index pages of every outlet and return the links not yet
+        stored, checking the links of all the pages read concurrently with a
+        single query. In incremental mode the next index page of a category
+        is read only if the current one has links not stored yet.
+        """
+        tasks = [(o, url, c, None) for o in self.outlets for url, c in index_urls(o)]
+        if self.incremental:
+            self.validators = load_validators(url for _, url, _, _ in tasks)
+        found, seen = [], set()
+        unchanged = 0
+        while tasks:
+            results = profiling.pool_map(pool, self._read_index, tasks)
+            known = known_links(set(link for _, links, _ in results for link in links or []) - seen)
+            tasks = []
+            for (outlet, url, category, page), links, validators in results:
+                if links is None:
+                    unchanged += 1
+                    continue
+                new = [link for link in links if link not in known]
+                if self.incremental and validators is not None:
+                    self.pages[url] = (validators, set(new))
+                for link in new:
+                    if link not in seen:
+                        seen.add(link)
+                        found.append((outlet, link, category))
+                if self.incremental and new and outlet.get('pages'):
+                    number = outlet['pages'].get('first', 2) if page is None else page + 1
+                    next_url = page_url(outlet, category, number)
+                    if next_url is not None:
+                        tasks.append((outlet, next_url, category, number))
+        if unchanged:
+            logger.info("%s index pages unchanged since the last run", unchanged)
+        return found
+
+    def save_state(self, stored):
+        """
+        Keep the validators of the index pages whose new articles were all stored.
+        :param stored: urls of the articles stored in this run
+        """
+        save_validators(dict((url, validators) for url, (validators, new) in self.pages.iteritems()
+                             if new <= stored))
+
+    def run(self):
+        """
+        Crawl all the outlets once.
+        :return: number of articles stored
+        """
+        t0 = time.time()
+        watchdog.start()
+        pool = ThreadPool(self.threads)
+        stored_urls = set()
+        try:
+            tasks = self.find_new_articles(pool)
+            logger.info("%s new articles found in %s outlets", len(tasks), len(self.outlets))
+            stored, batch, batch_urls = 0, [], []
+            for url, article in profiling.interruptible(pool.imap_unordered(self._download, tasks)):
+                if article is None:
+                    continue
+                batch.append(article)
+                batch_urls.append(url)
+                if len(batch) >= config['batch_size']:
+                    stored += store_articles(batch)
+                    stored_urls.update(batch_urls)
+                    batch, batch_urls = [], []
+            stored += store_articles(batch)
+            stored_urls.update(batch_urls)
+        finally:
+            pool.close()
+            pool.join()
+        if self.incremental:
+            self.save_state(stored_urls)
+        logger.info("%s articles stored in %.1f seconds", stored, time.time() - t0)
+        return stored
+
+
+def main(names=None, threads=None, incremental=False):
+    return Crawler(load_outlets(names), threads=threads, incremental=incremental).run()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Crawl the latest news of the configured outlets')
+    parser.add_argument('outlets', nargs='*', help='names of the outlets to crawl (default: all)')
+    parser.add_argument('-t', '--threads', type=int, default=None, help='number of fetching threads')
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        help='use conditional requests and follow the index pages until the stored links')
+    parser.add_argument('--replay', nargs='+', metavar='WARC',
+                        help='fetch the pages from these WARC files or directories instead of the network')
+    parser.add_argument('--update', action='store_true',
+                        help='with --replay, update the articles already stored instead of skipping them')
+    args = parser.parse_args()
+    if args.replay:
+        warc.start_replay(args.replay, args.update)
+    watchdog.start()  # before the threads of the metrics, profiling and memory
+    metrics.start('crawler')
+    profiling.install('crawler')
+    memory.install('crawler')
+
+    main(args.outlets or None, args.threads, args.incremental)
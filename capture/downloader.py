@@ -9,81 +9,77 @@ license: GPL V3 or Later
 
 __docformat__ = 'restructuredtext en'
 
-import logging
+import argparse
 from multiprocessing.pool import ThreadPool
 import time
 import datetime
 import zlib
 import cPickle as CP
-import cld
 import sys
 import os
-from logging.handlers import RotatingFileHandler
 import feedparser
 import pymongo
-import goose
 import requests
 from requests.exceptions import ConnectionError, MissingSchema, Timeout
 from bson.errors import InvalidDocument
 from pymongo.errors import DuplicateKeyError
 import bson
-from dateutil.parser import parse
 
 import settings
-import elasticsearch
+import connections
+import content_paths
+import freshness
+import language
+import logging_mc
+import memory
+import metrics
+import outbox
+import profiling
+import tracing
+import warc
+import watchdog
+from watchdog import ExtractionError
 
-# import nlp
-import load_into_pypln
-
-es = elasticsearch.Elasticsearch(hosts=[settings.ELASTICHOST])
 
 sys.path.append('/'.join(os.getcwd().split("/")[:-1]))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utilities.dates import parse_date
 
 ###########################
 #  Setting up Logging
 ###########################
-logger = logging.getLogger("Downloader")
-logger.setLevel(logging.DEBUG)
-# create console handler and set level to debug
-ch = logging.StreamHandler()
-ch.setLevel(logging.DEBUG)
-fh = RotatingFileHandler('/tmp/mediacloud.log', maxBytes=5e6, backupCount=3)
-# create formatter
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-# add formatter to ch
-ch.setFormatter(formatter)
-fh.setFormatter(formatter)
-# add ch to logger
-#logger.addHandler(ch)  # uncomment for console output of messages
-logger.addHandler(fh)
+logger = logging_mc.get_logger("Downloader", '/tmp/mediacloud.log', console=False)
 
 
  ## Media Cloud database setup
-client = pymongo.MongoClient(settings.MONGOHOST, 27017)
-MCDB = client.MCDB
+MCDB = connections.MCDB
 FEEDS = MCDB.feeds  # Feed collection
 ARTICLES = MCDB.articles  # Article Collection
 
-## Ensure indices are created
-FEEDS.ensure_index([("subtitle_detail.base", pymongo.ASCENDING)])
-FEEDS.ensure_index([("last_visited", pymongo.DESCENDING), ("updated", pymongo.DESCENDING)])
-ARTICLES.ensure_index([("link", pymongo.ASCENDING), ("published", pymongo.ASCENDING)])
-ARTICLES.ensure_index([("published", pymongo.DESCENDING)])
-ARTICLES.ensure_index("cleaned_text")
-
 
 
 
 config = {
     'threads': 45,  # Number of threads used in the fetching pool
+    'batch_size': 100,  # Feeds read per query
 }
 
+EXTRACTED_FIELDS = ['link_content', 'compressed', 'cleaned_text', 'language']  # Updated by a replay
+
 
 def goosefy(content, article):
+    """
+    Extract the text of an article, falling back to its summary. If the
+    extraction fails or takes too long the article is flagged with
+    `reextract`, for add_cleaned_text.py.
+    """
     cleaned_text = ''
     if len(content.strip()) > 0:
-        cleaned_text = goose.Goose({'enable_image_fetching': False, 'use_meta_language': False,
-                                'target_language': 'pt'}).extract(raw_html=content).cleaned_text
+        try:
+            cleaned_text = content_paths.extract(content, url=article.get('link')).cleaned_text
+        except ExtractionError as e:
+            logger.error("Could not extract the text of %s: %s", article.get('link'), e)
+            article['reextract'] = True
     if len(cleaned_text) == 0:
         if article.has_key('summary'):
             cleaned_text = article['summary']
@@ -91,18 +87,45 @@ def goosefy(content, article):
     return cleaned_text
 
 
+def update_extracted(_id, article, fields=EXTRACTED_FIELDS):
+    """
+    Replace the fields extracted from the page of a stored article by those
+    of `article`, extracted again (see `warc.updating`).
+    """
+    update = {'$set': dict((f, article[f]) for f in fields if f in article)}
+    if article.get('reextract'):
+        update['$set']['reextract'] = True
+    else:
+        update['$unset'] = {'reextract': ''}
+    ARTICLES.update({'_id': _id}, update, w=1)
+
+
 class RSSDownload(object):
     def __init__(self, feed_id, url):
         self.url = url
         self.feed_id = feed_id
+        self.fetch_span = None  # (start, seconds) of the fetch of the feed
 
     def parse(self):
-        response = feedparser.parse(self.url)
+        try:
+            with metrics.stage('feed_fetch') as fetch:
+                r = warc.get(self.url, timeout=30)
+            self.fetch_span = (fetch.t0, time.time() - fetch.t0)
+        except requests.RequestException as e:
+            logger.error("Failed to fetch feed %s: %s", self.url, e)
+            return
+        if not r.ok:
+            metrics.error('feed_fetch')
+            logger.error("Fetching feed %s returned HTTP %s", self.url, r.status_code)
+            return
+        headers = dict((k.lower(), v) for k, v in r.headers.iteritems())
+        headers.setdefault('content-location', r.url)
+        response = feedparser.parse(r.content, response_headers=headers)
         if response.bozo:
             logger.error("fetching %s returned an exception: %s", self.url, response.bozo_exception)
             return
         if not response.entries:
-            logger.warning("{} had no entries".format(self.url))
+            logger.warning("%s had no entries", self.url)
             return
 
         self._save_articles(response.entries)
@@ -112,11 +135,13 @@ class RSSDownload(object):
 
     def _save_articles(self, entries):
         logger.info("Downloading %s articles from %s", len(entries), self.url)
-        #corpus = nlp.get_corpus()
         for entry in entries:
             if "%set" in entry:  # hallmark of empty article
                 logger.error("Empty article from %s", self.url)
                 continue
+            trace = entry['trace_id'] = tracing.new_trace()
+            if self.fetch_span is not None:
+                tracing.record(trace, 'feed_fetch', *self.fetch_span)
 
             for k, v in entry.iteritems():
                 if isinstance(v, time.struct_time):
@@ -124,7 +149,8 @@ class RSSDownload(object):
                     entry[k] = datetime.datetime.fromtimestamp(time.mktime(v))
 
             try:
-                r = requests.get(entry.get('link'), timeout=30)
+                with metrics.stage('article_fetch', trace):
+                    r = warc.get(entry.get('link'), timeout=30)
             except ConnectionError:
                 logger.error("Failed to fetch %s", entry.get('link'))
                 continue
@@ -141,17 +167,19 @@ class RSSDownload(object):
                 dec_content = r.content.decode(encoding)
                 entry['link_content'] = compress_content(dec_content)
                 entry['compressed'] = True
-                entry['language'] = detect_language(dec_content)
-                entry['cleaned_text'] = goosefy(dec_content, entry)
+                with metrics.stage('extraction', trace):
+                    entry['cleaned_text'] = goosefy(dec_content, entry)
+                with metrics.stage('language_detection', trace):
+                    entry['language'] = detect_language(entry['cleaned_text'] or dec_content, self.url)
                 # Parsing date strings
                 if 'published' in entry:
                     try:
-                        entry['published'] = parse(entry['published'])
+                        entry['published'] = parse_date(entry['published'], self.url)
                     except ValueError:
                         logger.error("Could not parse date %s ", entry['published'])
                 if 'updated' in entry:
                     try:
-                        entry['updated'] = parse(entry['updated'])
+                        entry['updated'] = parse_date(entry['updated'], self.url)
                     except ValueError:
                         logger.error("Could not parse date %s ", entry['updated'])
                 else:
@@ -169,19 +197,25 @@ class RSSDownload(object):
                 entry.pop('published_parsed')
             except KeyError:
                 pass
-            load_into_pypln.load_document(entry, corpus)
-            exists = list(ARTICLES.find({"link": entry.link}))
+            exists = list(ARTICLES.find({"link": entry.link}, fields=['_id']))
             # print exists
-            if not exists:
+            if exists and warc.updating():
+                with metrics.stage('mongo_write', trace):
+                    update_extracted(exists[0]['_id'], entry)
+            elif not exists:
                 if "published" in entry:
                     # consider parsing the string datetime into a datetime object
                     pass
                 try:
-                    _id = ARTICLES.insert(entry, w=1)
+                    with metrics.stage('mongo_write', trace):
+                        entry['sphinx_id'] = connections.SPHINX_IDS.next()
+                        ARTICLES.insert(entry, w=1)
                 except DuplicateKeyError:
                     logger.error("Duplicate article found")
                     return
-                index_article_on_elastic(entry, _id)
+                metrics.ARTICLES_STORED.labels('downloader').inc()
+                # the dates of the feeds are parsed to UTC
+                outbox.publish([outbox.event(entry, datetime.datetime.utcnow())])
                 # print "inserted"
 
 def index_article_on_elastic(doc, _id):
@@ -200,11 +234,13 @@ def index_article_on_elastic(doc, _id):
     body = {k: v for k, v in doc.items() if k in indexed_fields}
 
     elastic_doc['body'] = doc
-    es.index(index=elastic_doc['index'],
-             doc_type=elastic_doc['doc_type'],
-             id=elastic_doc['id'],
-             body=body
-    )
+    with metrics.stage('es_index', doc.get('trace_id')):
+        connections.elastic().index(index=elastic_doc['index'],
+                                    doc_type=elastic_doc['doc_type'],
+                                    id=elastic_doc['id'],
+                                    body=body
+        )
+    freshness.indexed(doc, _id)
 
 
 def compress_content(html):
@@ -231,14 +267,14 @@ def decompress_content(compressed_html):
     return orig_html
 
 
-def detect_language(text):
+def detect_language(text, source=None):
     """
     Detect the language of text using chromium_compact_language_detector
-    :param text: text to be analyzed
+    :param text: text to be analyzed, only its beginning is used
+    :param source: feed url or domain of the text, see `language.LanguageMemo`
     :return: {"name": portuguese, "pt"}
     """
-    name, code, isReliable, textBytesFound, details = cld.detect(text.encode('utf8'))
-    return {"name": name, "code": code}
+    return language.detect_language(text, source)
 
 
 def fetch_feed(feed):
@@ -246,10 +282,14 @@ def fetch_feed(feed):
         f = RSSDownload(feed[0], feed[1])
     except InvalidDocument:
         logger.error("This feed failed: %s", f)
+    in_flight = metrics.IN_FLIGHT.labels('downloader')
+    in_flight.inc()
     try:
         f.parse()
     except Exception as e:
-        logger.error("An error occurred while trying to fetch feed {}: {}".format(f.url, e))
+        logger.error("An error occurred while trying to fetch feed %s: %s", f.url, e)
+    finally:
+        in_flight.dec()
 
 
 def parallel_fetch():
@@ -257,19 +297,23 @@ def parallel_fetch():
     Starts parallel threads to fetch feeds.
     """
     feed_count = FEEDS.count()  # Needed for first round of while
-    feed_urls = []
     t0 = time.time()
     feeds_scanned = 0
+    feeds_fetched = 0
+    watchdog.start()
     thread_pool = ThreadPool(config['threads'])
     while feeds_scanned < feed_count:
-        feed_cursor = FEEDS.find({}, skip=feeds_scanned, limit=100, sort=[("last_visited", pymongo.DESCENDING),
+        feed_urls = []  # Only the current batch, so the feeds fetched can be freed
+        batch = 0
+        feed_cursor = FEEDS.find({}, skip=feeds_scanned, limit=config['batch_size'], sort=[("last_visited", pymongo.DESCENDING),
                                                                           ("updated", pymongo.DESCENDING)])
         for feed in feed_cursor:
+            batch += 1
             if "updated" in feed:
                 try:
                     date = feed["updated"]
                     if not isinstance(date, datetime.datetime):
-                        date = parse(date)
+                        date = parse_date(date, "feeds.updated")
                     FEEDS.update({"_id": feed["_id"]}, {"$set": {"updated": date}})
                 except ValueError:
                     FEEDS.update({"_id": feed["_id"]}, {"$set": {"updated": datetime.datetime.now()}})
@@ -288,13 +332,28 @@ def parallel_fetch():
             except UnicodeEncodeError:
                 logger.error("Feed %s failed Unicode decoding", feed.get('link', None))
             #fetch_feed(t["base"].decode('utf8'))
+        if not batch:
+            break
         if feed_urls:  # Only if there are urls to fetch
-            thread_pool.map(fetch_feed, feed_urls)
-            feeds_scanned += len(feed_urls)
-            logger.info("%s feeds scanned after %s minutes", feeds_scanned, (time.time()-t0)/60.)
-            feed_count = FEEDS.count()
+            profiling.pool_map(thread_pool, fetch_feed, feed_urls)
+            feeds_fetched += len(feed_urls)
+        feeds_scanned += batch
+        logger.info("%s feeds scanned after %s minutes", feeds_scanned, (time.time()-t0)/60.)
+        feed_count = FEEDS.count()
     thread_pool.close()
-    logger.info("Time taken to download %s feeds: %s minutes.", len(feed_urls), (time.time()-t0)/60.)
+    logger.info("Time taken to download %s feeds: %s minutes.", feeds_fetched, (time.time()-t0)/60.)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Download the articles of the feeds')
+    parser.add_argument('--replay', nargs='+', metavar='WARC',
+                        help='fetch the pages from these WARC files or directories instead of the network')
+    parser.add_argument('--update', action='store_true',
+                        help='with --replay, update the articles already stored instead of skipping them')
+    args = parser.parse_args()
+    if args.replay:
+        warc.start_replay(args.replay, args.update)
+    watchdog.start()  # before the threads of the metrics, profiling and memory
+    metrics.start('downloader')
+    profiling.install('downloader')
+    memory.install('downloader')
     parallel_fetch()
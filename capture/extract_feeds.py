@@ -9,14 +9,16 @@ license: GPL V3 or Later
 __docformat__ = 'restructuredtext en'
 
 import argparse
-import logging
 
 from pymongo.errors import OperationFailure
 import pymongo
 
+import connections
 import feedfinder
+import logging_mc
+import linkgraph
 import urlscanner
-import settings
+import sitemaps
 
 
 
@@ -27,50 +29,39 @@ import settings
 ###########################
 #  Setting up Logging
 ###########################
-logger = logging.getLogger("Extract_feeds")
-logger.setLevel(logging.DEBUG)
-# create console handler and set level to debug
-ch = logging.StreamHandler()
-ch.setLevel(logging.DEBUG)
-#fh = RotatingFileHandler('/tmp/mediacloud.log', maxBytes=5e6, backupCount=3)
-# create formatter
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-# add formatter to ch
-ch.setFormatter(formatter)
-#fh.setFormatter(formatter)
-# add ch to logger
-logger.addHandler(ch)  # uncomment for console output of messages
-#logger.addHandler(fh)
+logger = logging_mc.get_logger("Extract_feeds", fmt='%(asctime)s - %(levelname)s - %(message)s')
 
 ## Media Cloud database setup
-client = pymongo.MongoClient(settings.MONGOHOST, 27017)
-MCDB = client.MCDB
+MCDB = connections.MCDB
 URLS = MCDB.urls  # Feed collection
 
-## Ensure indices are created
 FEEDS = MCDB.feeds
 ARTICLES = MCDB.articles
-FEEDS.ensure_index([("subtitle_detail.base", pymongo.ASCENDING)])
-# the index below is key to ensure uniqueness of feeds in the table
-FEEDS.ensure_index([("subtitle_detail.base", pymongo.ASCENDING), ("link", pymongo.ASCENDING)], unique=True, dropDups=True)
-FEEDS.ensure_index([("last_visited", pymongo.DESCENDING), ("updated", pymongo.DESCENDING)])
-ARTICLES.ensure_index([("link", pymongo.ASCENDING), ("published", pymongo.ASCENDING)])
-ARTICLES.ensure_index([("published", pymongo.DESCENDING)])
-URLS.ensure_index([("fetched_on", pymongo.ASCENDING)])
 
 
 
-def main(urls, depth):
+def main(urls, depth, mode='crawl', prioritize=0):
     """
     Starting capturing of
     :param urls:
     :param depth:
+    :param mode: 'crawl' to scan pages with httrack, 'sitemap' to use robots.txt and sitemaps
+    :param prioritize: if not zero, scan the urls (of the file, if given) ordered by the rank of
+                       their domains in the link graph, followed by up to this number of top
+                       ranked domains without feeds
     """
-    if urls:
+    scan = scan_url if mode == 'crawl' else scan_sitemaps
+    if prioritize:
+        if urls:
+            with open(urls) as f:
+                scan_prioritized(scan, depth, prioritize, [u.strip() for u in f if u.strip()])
+        else:
+            scan_prioritized(scan, depth, prioritize)
+    elif urls:
         with open(urls) as f:
             for u in f:
                 print "scanning {} with depth {}".format(u, depth)
-                scan_url(u, depth)
+                scan(u, depth)
     else:  # Scan URLs from Mongodb url collection
         urls_count = URLS.count()
         urls_scanned = 0
@@ -79,19 +70,39 @@ def main(urls, depth):
             try:
                 for doc in cursor:
                     print "scanning {} with depth {}".format(doc['url'], depth)
-                    scan_url(doc['url'], depth)
+                    scan(doc['url'], depth)
                     urls_scanned += 1
             except OperationFailure as e:
                 logger.error("Mongodb Operation failure: %s", e)
 
 
+def scan_prioritized(scan, depth, n_domains, urls=None):
+    """
+    Scan the urls, best ranked domains first, and then the best ranked
+    domains of the link graph which still have no feeds.
+    :param urls: urls to scan, by default those of the `urls` collection
+    """
+    if urls is None:
+        urls = [doc['url'] for doc in URLS.find({}, fields=['url'])]
+    for u in linkgraph.prioritize(urls):
+        print "scanning {} with depth {}".format(u, depth)
+        scan(u, depth)
+    with_feeds = set(linkgraph.domain_of(l) for l in FEEDS.distinct('link') if isinstance(l, basestring))
+    with_feeds.update(linkgraph.domain_of(u) for u in urls)
+    for domain in linkgraph.next_domains(n_domains, exclude=with_feeds):
+        print "scanning top ranked domain {} with depth {}".format(domain, depth)
+        scan('http://{}/'.format(domain), depth)
+    linkgraph.update_ranks()
+
+
 def scan_url(url, depth):
     if url.strip().endswith('robots.txt'):
         # Ignore such URLs as they are fruitless.
         print "Skipping {}".format(url)
         return
     u2 = urlscanner.url_scanner(url.strip(), depth)
-    for U in u2:
+    linkgraph.add_links(url, u2)
+    for U in linkgraph.prioritize(u2):
         if U.strip().lower().endswith('robots.txt'):
             continue
         logger.info("searching for feeds in: %s", U)
@@ -101,11 +112,41 @@ def scan_url(url, depth):
             logger.info(str(feeds))
             feedfinder.store_feeds(feeds)
 
+_sites_scanned = set()
+
+
+def scan_sitemaps(url, depth=None):
+    """
+    Find feeds through the robots.txt and sitemaps of the site of `url`, and
+    store its fresh article urls in the URLS collection, tagged 'sitemap'.
+    Each site is scanned only once per run, as many urls share the same host.
+    :param url: any url of the site
+    :param depth: ignored, kept for compatibility with `scan_url`
+    """
+    root = sitemaps.site_root(url.strip())
+    if root in _sites_scanned:
+        return
+    _sites_scanned.add(root)
+    logger.info("searching for feeds in the sitemaps of: %s", root)
+    feeds, fresh = sitemaps.discover(root)
+    logger.info("found %s feeds and %s fresh pages", len(feeds), len(fresh))
+    if feeds:
+        logger.info(str(feeds))
+        feedfinder.store_feeds(feeds)
+    if fresh:
+        feedfinder.store_urls(fresh, 'sitemap')
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Search for feeds on a set of web pages (urls)')
     parser.add_argument('-f', '--file', type=str, default='', help='file with one or more urls to check (one per line)')
     parser.add_argument('-d', '--depth', type=int, default=2, help='Depth of the search, from the initial url')
+    parser.add_argument('-m', '--mode', choices=['crawl', 'sitemap'], default='crawl',
+                        help='crawl the pages with httrack or read the robots.txt and sitemaps of the sites')
+    parser.add_argument('-p', '--prioritize', type=int, default=0, metavar='N',
+                        help='scan the urls of the file or of the collection by the rank of their domains in '
+                             'the link graph, then N top ranked domains without feeds')
 
     args = parser.parse_args()
     # print args.file
-    main(args.file, args.depth)
+    main(args.file, args.depth, args.mode, args.prioritize)
@@ -0,0 +1,171 @@
+#-*- coding:utf-8 -*-
+u"""
+Parsing of downloaded pages and extraction of their text.
+
+A page is parsed once into an lxml tree which is shared by the extractors of
+the crawlers (dates, categories, links) and by Goose, so that Goose neither
+downloads the page again nor parses it a second time.
+
+The engine used for the text is chosen by `settings.EXTRACTION_ENGINE`:
+``goose``, or ``density`` for the faster extractor of `boilerplate`.
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import re
+from collections import namedtuple
+from copy import deepcopy
+
+import goose
+import lxml.html
+from goose.crawler import CrawlCandidate, Crawler
+from lxml.etree import ParserError
+
+import boilerplate
+import logging_mc
+import settings
+
+
+logger = logging_mc.get_logger('extraction')
+
+GOOSE_CONFIG = {'enable_image_fetching': False, 'use_meta_language': False, 'target_language': 'pt'}
+
+ENGINES = ('goose', 'density')
+
+# Result of the extractors other than Goose, with the attributes of goose.Article we use
+Article = namedtuple('Article', ['title', 'cleaned_text', 'top_node'])
+
+# Result of `extract_text`, which can be sent between processes
+Extraction = namedtuple('Extraction', ['title', 'cleaned_text', 'body_selector'])
+
+SELECTOR_DEPTH = 3  # Ancestors of the body node considered to build a selector
+
+_SPACES = re.compile(r'\s+', re.UNICODE)
+
+
+def parse_html(html):
+    """
+    Parse an html document into an lxml tree, or None if it is empty or broken.
+    """
+    try:
+        if isinstance(html, unicode) and html.lstrip().startswith(u'<?xml'):
+            # lxml refuses unicode strings with an encoding declaration
+            return lxml.html.document_fromstring(html.encode('utf8'),
+                                                 parser=lxml.html.HTMLParser(encoding='utf-8'))
+        return lxml.html.document_fromstring(html)
+    except (ParserError, ValueError):
+        return None
+
+
+class _TreeCrawler(Crawler):
+    """
+    Goose crawler working on a tree we already parsed. Goose cleans the
+    document in place, so it gets its own copy of the tree.
+    """
+    def __init__(self, config, tree):
+        super(_TreeCrawler, self).__init__(config)
+        self._tree = tree
+
+    def get_document(self, raw_html):
+        return deepcopy(self._tree)
+
+
+def goose_extract(html, tree=None, url=None):
+    """
+    Run Goose on an html document already downloaded.
+    :param html: the document, as returned by the server
+    :param tree: lxml tree of `html` returned by `parse_html`, parsed again if None
+    :param url: url of the document, used to resolve relative links
+    :return: goose Article
+    """
+    g = goose.Goose(GOOSE_CONFIG)
+    if tree is None:
+        return g.extract(url=url, raw_html=html)
+    try:
+        return _TreeCrawler(g.config, tree).crawl(CrawlCandidate(g.config, url, html))
+    except (UnicodeDecodeError, ValueError) as e:
+        # Goose retries these with its other parsers
+        logger.warning("Goose failed on the parsed tree of %s: %s", url, e)
+        return g.extract(url=url, raw_html=html)
+
+
+def page_title(tree):
+    """
+    Title of a page: its og:title if there is one, else its <title>.
+    """
+    for meta in tree.iter('meta'):
+        if meta.get('property') == 'og:title' and meta.get('content', '').strip():
+            return meta.get('content').strip()
+    title = tree.find('.//title')
+    if title is not None and title.text_content().strip():
+        return _SPACES.sub(u' ', title.text_content()).strip()
+    return u''
+
+
+def density_extract(html, tree=None):
+    """
+    Extract an article with the text density extractor of `boilerplate`.
+    """
+    tree = parse_html(html) if tree is None else tree
+    if tree is None:
+        return Article(u'', u'', None)
+    node, text = boilerplate.extract(tree)
+    return Article(page_title(tree), text, node)
+
+
+def extract_article(html, tree=None, url=None, engine=None):
+    """
+    Extract the title and text of an article with the configured engine.
+    :param html: the document, as returned by the server
+    :param tree: lxml tree of `html` returned by `parse_html`
+    :param url: url of the document
+    :param engine: one of `ENGINES`, `settings.EXTRACTION_ENGINE` by default
+    :return: object with the `title`, `cleaned_text` and `top_node` of the article
+    """
+    engine = settings.EXTRACTION_ENGINE if engine is None else engine
+    if engine == 'density':
+        return density_extract(html, tree)
+    if engine != 'goose':
+        raise ValueError("Unknown extraction engine: {0}".format(engine))
+    return goose_extract(html, tree, url)
+
+
+def page_summary(tree):
+    """
+    Description of a page from its meta tags, u'' if it has none.
+    """
+    for meta in tree.iter('meta'):
+        if (meta.get('name') == 'description' or meta.get('property') == 'og:description') \
+                and meta.get('content', '').strip():
+            return _SPACES.sub(u' ', meta.get('content')).strip()
+    return u''
+
+
+def node_selector(node):
+    """
+    Return a CSS selector for `node` or its closest ancestor with an id or a
+    class, or None if there is none. Tags are left out as Goose renames some
+    of them while cleaning the document.
+    """
+    for _ in xrange(SELECTOR_DEPTH + 1):
+        if node is None or not isinstance(node.tag, basestring):
+            return None
+        if node.get('id', '').strip() and ' ' not in node.get('id').strip():
+            return '#' + node.get('id').strip()
+        classes = node.get('class', '').split()
+        if classes:
+            return ''.join('.' + c for c in classes)
+        node = node.getparent()
+    return None
+
+
+def extract_text(html, tree=None, url=None, engine=None):
+    """
+    Same as `extract_article`, but the body node is replaced by a selector
+    so that the result can be pickled.
+    :return: `Extraction` tuple
+    """
+    article = extract_article(html, tree, url, engine)
+    return Extraction(article.title or u'', article.cleaned_text or u'', node_selector(article.top_node))
@@ -46,45 +46,30 @@ import sgmllib
 import urlparse
 import re
 import argparse
-import logging
 import time
 import datetime
-from logging.handlers import RotatingFileHandler
 import sys
 import os
 
 import requests
 import feedparser
-import pymongo
-from pymongo.errors import DuplicateKeyError
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
-import settings
+import connections
+import logging_mc
 
 
 sys.path.append('/'.join(os.getcwd().split("/")[:-1]))
 
-client = pymongo.MongoClient(settings.MONGOHOST, 27017)
-MCDB = client.MCDB
+MCDB = connections.MCDB
 FEEDS = MCDB.feeds  # Feed collection
+URLS = MCDB.urls  # Collection of urls to extract feeds from
 
 
 ###########################
 #  Setting up Logging
 ###########################
-logger = logging.getLogger("Feedfinder")
-logger.setLevel(logging.DEBUG)
-# create console handler and set level to debug
-ch = logging.StreamHandler()
-ch.setLevel(logging.DEBUG)
-fh = RotatingFileHandler('/tmp/mediacloud.log', maxBytes=5e6, backupCount=3)
-# create formatter
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-# add formatter to ch
-ch.setFormatter(formatter)
-fh.setFormatter(formatter)
-# add ch to logger
-#logger.addHandler(ch)  # uncomment for console output of messages
-logger.addHandler(fh)
+logger = logging_mc.get_logger("Feedfinder", '/tmp/mediacloud.log', console=False)
 
 def get_page(url):
     """
@@ -213,10 +198,10 @@ def isFeed(url):
     try:
         p = feedparser.parse(url)
     except TypeError:  # Sometimes Feedparser fails with a type error here
-        logging.error("Bad url: {}".format(url))
+        logger.error("Bad url: %s", url)
         return 0
     except UnicodeEncodeError:
-        logging.error("Unicode Encode Error")
+        logger.error("Unicode Encode Error")
         return 0
     version = p.get("version")
     return int(version != "")
@@ -316,6 +301,32 @@ def store_feeds(feed_list):
                 return
 
 
+def store_urls(urls, tag):
+    """
+    Upsert urls into the URLS collection, scanned for feeds by extract_feeds,
+    with a single bulk operation, tagging the existing ones with `tag`.
+    :param urls: iterable of urls
+    :param tag: tag of their origin, e.g. a search subject
+    :return: number of new urls
+    """
+    urls = set(urls)
+    if not urls:
+        return 0
+    now = datetime.datetime.now()
+    bulk = URLS.initialize_unordered_bulk_op()
+    for U in urls:
+        bulk.find({'url': U}).upsert().update({'$setOnInsert': {'fetched_on': now},
+                                               '$addToSet': {'tags': tag}})
+    try:
+        result = bulk.execute()
+    except BulkWriteError as e:
+        # Concurrent runs may race on the unique index; the other writes went through.
+        logger.error("Some urls could not be saved: %s", e.details.get('writeErrors'))
+        result = e.details
+    logger.info("%s urls found, %s new", len(urls), result.get('nUpserted', 0))
+    return result.get('nUpserted', 0)
+
+
 def feed(uri):
     #todo: give preference to certain feed formats
     feedlist = feeds(uri)
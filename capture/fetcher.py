@@ -0,0 +1,69 @@
+#-*- coding:utf-8 -*-
+u"""
+Shared HTTP fetching for the crawlers: one pooled session for all threads,
+with requests to each host spaced by a rate limiter. The responses go
+through `warc`, to be captured or replayed.
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import logging_mc
+import warc
+from ratelimit import RateLimiter
+
+
+logger = logging_mc.get_logger('fetcher')
+
+USER_AGENT = "Mozilla/5.0 (compatible; mediacloud_backend)"
+
+
+class Fetcher(object):
+    def __init__(self, pool_size=10, host_interval=0.0, timeout=30):
+        """
+        :param pool_size: number of connections kept open per host
+        :param host_interval: minimum number of seconds between two requests to the same host
+        :param timeout: timeout of each request, in seconds
+        """
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.limiter = RateLimiter(host_interval)
+
+    def get(self, url, **kwargs):
+        """
+        GET `url`, waiting for the turn of its host.
+        :return: requests.Response or None if the request failed
+        """
+        if not warc.replaying():
+            self.limiter.wait(urlparse.urlparse(url).netloc)
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            response = warc.get(url, session=self.session, **kwargs)
+        except requests.RequestException as e:
+            logger.error("Failed to fetch %s: %s", url, e)
+            return None
+        if not response.ok:
+            logger.error("Fetching %s returned HTTP %s", url, response.status_code)
+            return None
+        return response
+
+
+def decode(response):
+    """
+    Return the body of a response as unicode, using the declared encoding.
+    """
+    encoding = response.encoding if response.encoding is not None else 'utf8'
+    try:
+        return response.content.decode(encoding)
+    except (UnicodeDecodeError, LookupError):
+        return response.content.decode('utf8', 'replace')
@@ -0,0 +1,224 @@
+#-*- coding:utf-8 -*-
+u"""
+Freshness of the collection: how long the articles take to reach us.
+
+Two lags are measured for every article stored by the downloader and the
+crawlers, by the consumers of their events in the `outbox`:
+
+- ``publish_to_insert``: from the `published` date of the article to its
+  insertion in the `articles` collection;
+- ``insert_to_index``: from the insertion (the time of its ObjectId) to its
+  indexing in Elasticsearch.
+
+Each lag falls in a logarithmic bucket (four per doubling, from one second
+to about 48 days) counted per source and per hour (UTC) in the process, and the
+counts are added every `config['flush_interval']` seconds to the rollups of
+the `freshness` collection, one document per source, lag and hour::
+
+    {'_id': 'folha.uol.com.br|publish_to_insert|2014-05-02T10',
+     'source': 'folha.uol.com.br', 'kind': 'publish_to_insert',
+     'hour': datetime(2014, 5, 2, 10), 'counts': {'0': 2, '41': 17, ...}}
+
+so the rollups of several processes simply add up, and `percentiles` gives
+the p50/p95/p99 of each source over any period. The Monitor shows them in
+``/freshness``.
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import argparse
+import collections
+import datetime
+import math
+import os
+import threading
+import time
+from multiprocessing import util
+
+import pymongo
+
+import connections
+import logging_mc
+import metrics
+from linkgraph import domain_of
+
+
+logger = logging_mc.get_logger('freshness')
+
+MCDB = connections.MCDB
+FRESHNESS = MCDB.freshness  # Hourly rollups of the lags of the articles per source
+
+
+config = {
+    'flush_interval': 60,  # Maximum seconds the counts stay in the process
+}
+
+KINDS = ('publish_to_insert', 'insert_to_index')
+BUCKETS_PER_DOUBLING = 4
+LAST_BUCKET = 22 * BUCKETS_PER_DOUBLING  # 2 ** 22 seconds, 48.5 days
+
+FRESHNESS_SECONDS = metrics.histogram('mediacloud_freshness_seconds', 'Lags of the articles of all the sources',
+                                      ['kind'], buckets=(60, 300, 900, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600,
+                                                         86400, 3 * 86400, 7 * 86400))
+
+
+def bucket(seconds):
+    """
+    Index of the bucket of a lag: 0 below one second, then bucket i holds
+    the lags from `upper_bound(i - 1)` to `upper_bound(i)`.
+    """
+    if seconds < 1:
+        return 0
+    return min(LAST_BUCKET, int(math.log(seconds, 2) * BUCKETS_PER_DOUBLING) + 1)
+
+
+def upper_bound(index):
+    return 2 ** (float(index) / BUCKETS_PER_DOUBLING)
+
+
+def source_of(article):
+    """
+    The outlet of the crawled articles, the domain of the link of the others.
+    """
+    return article.get('source') or domain_of(article.get('link')) or 'unknown'
+
+
+class LagCounts(object):
+    """
+    Bucket counts of the process waiting to be added to the rollups.
+    """
+    def __init__(self):
+        self.counts = collections.defaultdict(collections.Counter)  # (source, kind, hour) -> bucket -> count
+        self.since = time.time()
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def add(self, source, kind, seconds, at=None):
+        hour = (at or datetime.datetime.utcnow()).replace(minute=0, second=0, microsecond=0)
+        with self._lock:
+            if self._pid != os.getpid():  # inherited from the parent process
+                self.counts, self._pid = collections.defaultdict(collections.Counter), os.getpid()
+            self.counts[source, kind, hour][bucket(seconds)] += 1
+            due = time.time() - self.since >= config['flush_interval']
+        FRESHNESS_SECONDS.labels(kind).observe(seconds)
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            counts = self.counts if self._pid == os.getpid() else {}
+            self.counts, self.since = collections.defaultdict(collections.Counter), time.time()
+        if not counts:
+            return
+        bulk = FRESHNESS.initialize_unordered_bulk_op()
+        for (source, kind, hour), buckets in counts.iteritems():
+            _id = u'{0}|{1}|{2:%Y-%m-%dT%H}'.format(source, kind, hour)
+            bulk.find({'_id': _id}).upsert().update({
+                '$setOnInsert': {'source': source, 'kind': kind, 'hour': hour},
+                '$inc': dict(('counts.{0}'.format(b), n) for b, n in buckets.iteritems())})
+        try:
+            bulk.execute()
+        except pymongo.errors.PyMongoError as e:
+            logger.error("Could not save the freshness of %s sources: %s", len(counts), e)
+
+
+_counts = LagCounts()
+# Runs at exit, also in the workers of multiprocessing pools
+util.Finalize(None, lambda: _counts.flush(), exitpriority=10)
+
+
+def inserted(article, inserted_at, at=None):
+    """
+    Count the lag from publication to insertion of a stored article.
+    :param inserted_at: time of the insertion, in the time reference of the
+                        `published` field (UTC for the feeds, whose dates are
+                        parsed to UTC)
+    :param at: time of the insertion in UTC, whose hour is the one of the
+               rollup; now by default
+    """
+    published = article.get('published')
+    if not isinstance(published, datetime.datetime):
+        return
+    seconds = max(0, (inserted_at - published).total_seconds())
+    _counts.add(source_of(article), 'publish_to_insert', seconds, at)
+
+
+def indexed(article, _id):
+    """
+    Count the lag from insertion to indexing of an article just indexed.
+    :param _id: ObjectId of the article, created at its insertion
+    """
+    now = datetime.datetime.utcnow()
+    seconds = max(0, (now - _id.generation_time.replace(tzinfo=None)).total_seconds())
+    _counts.add(source_of(article), 'insert_to_index', seconds)
+
+
+def flush():
+    """
+    Add the counts of the process to the rollups now.
+    """
+    _counts.flush()
+
+
+def percentile(buckets, p):
+    """
+    Upper bound of the bucket holding the percentile `p` of the counts.
+    :param buckets: dict bucket -> count
+    """
+    total = sum(buckets.itervalues())
+    rank = p / 100. * total
+    seen = 0
+    for index in sorted(buckets):
+        seen += buckets[index]
+        if seen >= rank:
+            return upper_bound(index)
+    return None
+
+
+def percentiles(since, until=None, collection=None):
+    """
+    Freshness of each source over a period.
+    :return: dict source -> kind -> {'count': ..., 'p50': ..., 'p95': ..., 'p99': ...} (seconds)
+    """
+    collection = FRESHNESS if collection is None else collection
+    query = {'hour': {'$gte': since.replace(minute=0, second=0, microsecond=0)}}
+    if until is not None:
+        query['hour']['$lt'] = until
+    merged = collections.defaultdict(collections.Counter)
+    for doc in collection.find(query):
+        merged[doc['source'], doc['kind']].update(dict((int(b), n) for b, n in doc['counts'].iteritems()))
+    result = collections.defaultdict(dict)
+    for (source, kind), buckets in merged.iteritems():
+        result[source][kind] = {'count': sum(buckets.itervalues()), 'p50': percentile(buckets, 50),
+                                'p95': percentile(buckets, 95), 'p99': percentile(buckets, 99)}
+    return result
+
+
+def format_lag(seconds):
+    if seconds is None:
+        return '-'
+    if seconds < 120:
+        return '{0:.0f}s'.format(seconds)
+    if seconds < 7200:
+        return '{0:.0f}min'.format(seconds / 60)
+    if seconds < 172800:
+        return '{0:.1f}h'.format(seconds / 3600)
+    return '{0:.1f}d'.format(seconds / 86400)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print the freshness of each source')
+    parser.add_argument('--hours', type=float, default=24, help='articles stored in the last HOURS hours')
+    args = parser.parse_args()
+
+    report = percentiles(datetime.datetime.utcnow() - datetime.timedelta(hours=args.hours))
+    print '{0:40} {1:>8} {2:>8} {3:>8} {4:>8}   {5:>8} {6:>8} {7:>8}'.format(
+        'source', 'articles', 'p50', 'p95', 'p99', 'index50', 'index95', 'index99')
+    for source, kinds in sorted(report.iteritems(), key=lambda s: -s[1].get('publish_to_insert', {}).get('count', 0)):
+        published = kinds.get('publish_to_insert', {})
+        indexing = kinds.get('insert_to_index', {})
+        print '{0:40} {1:8} {2:>8} {3:>8} {4:>8}   {5:>8} {6:>8} {7:>8}'.format(
+            source[:40], published.get('count', 0), *[format_lag(d.get(p)) for d in (published, indexing)
+                                                      for p in ('p50', 'p95', 'p99')])
@@ -7,25 +7,26 @@ __author__ = 'fccoelho'
 
 from urlparse import unquote
 import argparse
-import datetime
-import time
 import random
 
-import pymongo
-from pymongo.errors import DuplicateKeyError
+import requests
 
 import GoogleScraper
+import connections
+import feedfinder
+import logging_mc
 import settings
+from ratelimit import RateLimiter
+
+logger = logging_mc.get_logger('googlerss')
 
 
 
 
 
 ##### Setup URL Collection ############
-client = pymongo.MongoClient(settings.MONGOHOST, 27017)
-MCDB = client.MCDB
+MCDB = connections.MCDB
 URLS = MCDB.urls  # Collection of urls to extract feeds from
-URLS.ensure_index('url', unique=True)
 ###########
 
 SUBJECTS = ["Brasil", "Economia", "Politica", "ciência", "colunistas", "ambiente", "saúde",
@@ -38,6 +39,8 @@ SUBJECTS = ["Brasil", "Economia", "Politica", "ciência", "colunistas", "ambient
 def main(subject='', results_filter='site', n=5):
     """
     Scrape google search up to the nth page and save the results to a MongoDB collection.
+    Result pages are fetched concurrently and cached in `settings.GOOGLE_CACHE`,
+    so running again the same query doesn't repeat requests.
     :param n:
     """
     if not subject:
@@ -48,23 +51,31 @@ def main(subject='', results_filter='site', n=5):
         q = "{}+RSS".format(subject)
         lang = 'lang_pt'
     print "searching for {}.".format(subject)
-    for o in range(0, n*10, n):
-        urls = GoogleScraper.scrape(q, number_pages=n, offset=o, language=lang)
-        for url in urls:
-            # You can access all parts of the search results like that
-            # url.scheme => URL scheme specifier (Ex: 'http')
-            # url.netloc => Network location part (Ex: 'www.python.org')
-            # url.path => URL scheme specifier (Ex: ''help/Python.html'')
-            # url.params => Parameters for last path element
-            # url.query => Query component
-            #print url
-            #print(unquote(url.geturl()))
-            try:
-                U = unquote(url.geturl()).split("&")[0]#sa=U&ei=")[0]  # Remove googlebot crap
-                URLS.insert({'url': U, 'tags': [subject], 'fetched_on': datetime.datetime.now()})
-            except DuplicateKeyError:
-                pass
-        time.sleep(1)
+    cache = GoogleScraper.ResultCache(settings.GOOGLE_CACHE)
+    try:
+        urls = GoogleScraper.scrape(q, number_pages=n, language=lang, session=requests.Session(), cache=cache,
+                                    rate_limiter=RateLimiter(settings.GOOGLE_INTERVAL),
+                                    threads=settings.GOOGLE_THREADS)
+    finally:
+        cache.close()
+    return save_urls(urls, subject)
+
+
+def clean_url(url):
+    """
+    Rebuild the url of a search result, removing the parameters added by google.
+    :param url: ParseResult as returned by GoogleScraper.scrape
+    """
+    return unquote(url.geturl()).split("&")[0]  # sa=U&ei=")[0]  # Remove googlebot crap
+
+
+def save_urls(urls, subject):
+    """
+    Upsert the urls found into the URLS collection, tagging the existing ones
+    with the subject.
+    :return: number of new urls
+    """
+    return feedfinder.store_urls((clean_url(url) for url in urls), subject)
 
 
 if __name__ == "__main__":
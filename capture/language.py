@@ -0,0 +1,128 @@
+#-*- coding:utf-8 -*-
+u"""
+Language detection of the articles.
+
+The language is detected on a bounded prefix of the extracted text rather
+than on the whole html page. Most sources (a feed, or the domain of an
+outlet) publish in a single language, so the languages detected are counted
+per source in the `source_languages` collection; once `min_samples`
+reliable detections agree the source is considered monolingual and its
+language is used without running the detector, except on one article in
+`recheck_every`, which resets the memo if the language changed.
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import threading
+
+import cld
+
+import connections
+import logging_mc
+
+
+logger = logging_mc.get_logger('language')
+
+MCDB = connections.MCDB
+LANGUAGES = MCDB.source_languages  # Languages detected in the articles of each source
+
+config = {
+    'max_chars': 2000,  # Characters of the text given to the detector
+    'min_samples': 20,  # Reliable detections before a source can be considered monolingual
+    'min_share': 0.95,  # Share of those detections that must agree
+    'recheck_every': 25,  # Articles of a monolingual source between two detections
+}
+
+
+def detect(text):
+    """
+    Detect the language of the beginning of a text.
+    :return: ({"name": "PORTUGUESE", "code": "pt"}, whether the detection is reliable)
+    """
+    prefix = text[:config['max_chars']]
+    if isinstance(prefix, unicode):
+        prefix = prefix.encode('utf8')
+    name, code, reliable, text_bytes, details = cld.detect(prefix)
+    return {"name": name, "code": code}, reliable
+
+
+class LanguageMemo(object):
+    """
+    Memo of the language of each source. A source is either being learned,
+    with the counts of the languages detected, monolingual, with its
+    `language`, or `mixed` when enough samples did not agree.
+    """
+    def __init__(self):
+        self._sources = {}
+        self._lock = threading.Lock()
+
+    def _state(self, source):
+        with self._lock:
+            state = self._sources.get(source)
+        if state is not None:
+            return state
+        doc = LANGUAGES.find_one({'_id': source}) or {}
+        state = {'language': doc.get('language'), 'counts': doc.get('counts', {}),
+                 'mixed': doc.get('mixed', False), 'since_check': 0}
+        with self._lock:
+            return self._sources.setdefault(source, state)
+
+    def language(self, text, source=None):
+        """
+        Return the language of an article of `source`, as {"name": ..., "code": ...}.
+        """
+        if source is None:
+            return detect(text)[0]
+        state = self._state(source)
+        if state['language'] is not None:
+            with self._lock:
+                state['since_check'] += 1
+                check = state['since_check'] >= config['recheck_every']
+                if check:
+                    state['since_check'] = 0
+            if not check:
+                return dict(state['language'])
+            language, reliable = detect(text)
+            if reliable and language['code'] != state['language']['code']:
+                logger.info("%s is no longer only in %s", source, state['language']['name'])
+                self._reset(source, state)
+            return language
+        language, reliable = detect(text)
+        if reliable and not state['mixed']:
+            self._count(source, state, language)
+        return language
+
+    def _count(self, source, state, language):
+        code = language['code']
+        with self._lock:
+            state['counts'][code] = state['counts'].get(code, 0) + 1
+            total = sum(state['counts'].itervalues())
+            update = {'$inc': {'counts.' + code: 1}}
+            if total >= config['min_samples']:
+                if state['counts'][code] >= config['min_share'] * total:
+                    state['language'] = language
+                    update['$set'] = {'language': language}
+                elif max(state['counts'].itervalues()) < config['min_share'] * total:
+                    state['mixed'] = True
+                    update['$set'] = {'mixed': True}
+        LANGUAGES.update({'_id': source}, update, upsert=True)
+
+    def _reset(self, source, state):
+        with self._lock:
+            state.update(language=None, counts={}, mixed=False, since_check=0)
+        LANGUAGES.remove({'_id': source})
+
+
+MEMO = LanguageMemo()
+
+
+def detect_language(text, source=None):
+    """
+    Detect the language of an article from its extracted text.
+    :param text: cleaned text of the article
+    :param source: feed url or domain of the article, to use the language memo
+    :return: {"name": "PORTUGUESE", "code": "pt"}
+    """
+    return MEMO.language(text, source)
@@ -0,0 +1,246 @@
+#-*- coding:utf-8 -*-
+u"""
+Domain level link graph used to prioritize the crawl frontier.
+
+Links between domains found while scanning pages and in the `links` of the
+articles are accumulated in the `domain_edges` collection. The graph is
+loaded as a compressed sparse row (CSR) adjacency and ranked with PageRank,
+warm started from the previous ranks, so that feed discovery can scan the
+most central domains first.
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import argparse
+import datetime
+import urlparse
+from array import array
+
+import pymongo
+
+import connections
+import logging_mc
+
+
+logger = logging_mc.get_logger('linkgraph')
+
+MCDB = connections.MCDB
+EDGES = MCDB.domain_edges  # Weighted links between domains
+RANKS = MCDB.domain_rank  # Last computed rank of each domain
+
+
+config = {
+    'damping': 0.85,
+    'max_iterations': 100,
+    'tolerance': 1e-6,  # L1 change of the rank vector to stop iterating
+}
+
+
+def domain_of(url):
+    """
+    Return the domain of an url, lower cased and without `www.` or port.
+    """
+    if not url:
+        return None
+    netloc = urlparse.urlparse(url.strip() if '://' in url else 'http://' + url.strip()).netloc
+    domain = netloc.lower().rsplit('@', 1)[-1].split(':')[0]
+    if domain.startswith('www.'):
+        domain = domain[4:]
+    return domain or None
+
+
+def add_links(src_url, urls):
+    """
+    Record the links from the page at `src_url` to `urls`, aggregated by domain.
+    Links inside the same domain are ignored.
+    :return: number of distinct domains linked
+    """
+    src = domain_of(src_url)
+    if src is None:
+        return 0
+    counts = {}
+    for u in urls:
+        dst = domain_of(u)
+        if dst is not None and dst != src:
+            counts[dst] = counts.get(dst, 0) + 1
+    if not counts:
+        return 0
+    bulk = EDGES.initialize_unordered_bulk_op()
+    for dst, n in counts.iteritems():
+        bulk.find({'_id': u'{0} {1}'.format(src, dst)}).upsert().update(
+            {'$set': {'src': src, 'dst': dst}, '$inc': {'weight': n}})
+    bulk.execute()
+    return len(counts)
+
+
+def add_article(article):
+    """
+    Record the links of an article (as stored by the downloader) in the graph.
+    """
+    links = [l.get('href') for l in article.get('links', []) if isinstance(l, dict)]
+    return add_links(article.get('link'), links)
+
+
+class LinkGraph(object):
+    """
+    Compact in-memory copy of the domain graph in CSR form: the targets of
+    node `i` are `indices[indptr[i]:indptr[i + 1]]` with the corresponding
+    `weights`.
+    """
+    def __init__(self, edges=()):
+        """
+        :param edges: iterable of (src, dst, weight) tuples
+        """
+        self.domains = []
+        self.index = {}
+        rows = {}
+        for src, dst, weight in edges:
+            i, j = self._node(src), self._node(dst)
+            row = rows.setdefault(i, {})
+            row[j] = row.get(j, 0) + weight
+        self.indptr = array('l', [0])
+        self.indices = array('l')
+        self.weights = array('d')
+        for i in xrange(len(self.domains)):
+            for j, w in sorted(rows.get(i, {}).iteritems()):
+                self.indices.append(j)
+                self.weights.append(float(w))
+            self.indptr.append(len(self.indices))
+
+    @classmethod
+    def load(cls):
+        """
+        Build the graph from the `domain_edges` collection.
+        """
+        cursor = EDGES.find({}, fields=['src', 'dst', 'weight'])
+        return cls((e['src'], e['dst'], e.get('weight', 1)) for e in cursor)
+
+    def _node(self, domain):
+        i = self.index.get(domain)
+        if i is None:
+            i = self.index[domain] = len(self.domains)
+            self.domains.append(domain)
+        return i
+
+    def __len__(self):
+        return len(self.domains)
+
+    def pagerank(self, previous=None, damping=None, max_iterations=None, tolerance=None):
+        """
+        Weighted PageRank by power iteration. Dangling domains spread their
+        rank uniformly.
+        :param previous: dict domain -> rank of an earlier run used as the
+                         starting vector, so that few iterations are needed
+                         after incremental updates of the graph.
+        :return: dict domain -> rank (ranks sum to 1)
+        """
+        damping = config['damping'] if damping is None else damping
+        max_iterations = config['max_iterations'] if max_iterations is None else max_iterations
+        tolerance = config['tolerance'] if tolerance is None else tolerance
+        n = len(self.domains)
+        if n == 0:
+            return {}
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+        out_weight = [sum(weights[indptr[i]:indptr[i + 1]]) for i in xrange(n)]
+
+        previous = previous or {}
+        rank = [previous.get(d, 1.0 / n) for d in self.domains]
+        total = sum(rank)
+        rank = [r / total for r in rank]
+        for iteration in xrange(max_iterations):
+            dangling = sum(rank[i] for i in xrange(n) if out_weight[i] == 0)
+            base = (1.0 - damping + damping * dangling) / n
+            new_rank = [base] * n
+            for i in xrange(n):
+                if out_weight[i] == 0:
+                    continue
+                share = damping * rank[i] / out_weight[i]
+                for k in xrange(indptr[i], indptr[i + 1]):
+                    new_rank[indices[k]] += share * weights[k]
+            delta = sum(abs(a - b) for a, b in zip(new_rank, rank))
+            rank = new_rank
+            if delta < tolerance:
+                break
+        logger.info("PageRank of %s domains converged after %s iterations", n, iteration + 1)
+        return dict(zip(self.domains, rank))
+
+
+def update_ranks():
+    """
+    Recompute the rank of every domain, starting from the stored ranks, and
+    save them in the `domain_rank` collection.
+    """
+    previous = dict((r['_id'], r['rank']) for r in RANKS.find({}, fields=['rank']))
+    ranks = LinkGraph.load().pagerank(previous)
+    if not ranks:
+        return ranks
+    now = datetime.datetime.now()
+    bulk = RANKS.initialize_unordered_bulk_op()
+    for domain, rank in ranks.iteritems():
+        bulk.find({'_id': domain}).upsert().update({'$set': {'rank': rank, 'updated': now}})
+    bulk.execute()
+    return ranks
+
+
+def get_ranks(domains=None):
+    """
+    Return the stored ranks, as a dict domain -> rank.
+    :param domains: restrict the result to these domains
+    """
+    query = {} if domains is None else {'_id': {'$in': list(domains)}}
+    return dict((r['_id'], r['rank']) for r in RANKS.find(query, fields=['rank']))
+
+
+def prioritize(urls, ranks=None):
+    """
+    Sort urls so that the pages of the best ranked domains come first and,
+    within a domain, shallower pages (home and sections) before deeper ones.
+    """
+    urls = list(urls)
+    if ranks is None:
+        ranks = get_ranks(set(domain_of(u) for u in urls))
+
+    def key(u):
+        path = urlparse.urlparse(u.strip()).path
+        return -ranks.get(domain_of(u), 0.0), len([p for p in path.split('/') if p])
+    return sorted(urls, key=key)
+
+
+def next_domains(n, exclude=()):
+    """
+    Return the `n` best ranked domains not in `exclude`.
+    """
+    exclude = set(exclude)
+    domains = []
+    for r in RANKS.find({}, fields=['_id'], sort=[("rank", pymongo.DESCENDING)]):
+        if r['_id'] not in exclude:
+            domains.append(r['_id'])
+            if len(domains) == n:
+                break
+    return domains
+
+
+def build_from_articles(articles):
+    """
+    Add the links of every article in the collection to the graph.
+    """
+    count = 0
+    for article in articles.find({'links': {'$exists': True}}, fields=['link', 'links']):
+        add_article(article)
+        count += 1
+    logger.info("Links of %s articles added to the graph", count)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Maintain the domain link graph and its ranks')
+    parser.add_argument('-b', '--build', action='store_true', help='add the links of all stored articles to the graph')
+    parser.add_argument('-t', '--top', type=int, default=20, help='number of top ranked domains to print')
+    args = parser.parse_args()
+
+    if args.build:
+        build_from_articles(MCDB.articles)
+    ranks = update_ranks()
+    for domain, rank in sorted(ranks.iteritems(), key=lambda r: -r[1])[:args.top]:
+        print "{0:.6f}\t{1}".format(rank, domain)
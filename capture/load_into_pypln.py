@@ -12,46 +12,43 @@ import time
 
 import pymongo
 
-import logging
-from logging.handlers import RotatingFileHandler
 from multiprocessing import Pool
 
+import connections
+import logging_mc
+import metrics
 import nlp
-import settings
+import profiling
 
 
 ###########################
 #  Setting up Logging
 ###########################
-logger = logging.getLogger("load_into_pypln")
-logger.setLevel(logging.DEBUG)
-# create console handler and set level to debug
-fh = RotatingFileHandler('/tmp/load_pypln.log', maxBytes=5e6, backupCount=3)
-# create formatter
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-fh.setFormatter(formatter)
-# logger.addHandler(ch)  # uncomment for console output of messages
-logger.addHandler(fh)
+logger = logging_mc.get_logger("load_into_pypln", '/tmp/load_pypln.log', console=False)
 
 
 ## Media Cloud database setup
-client = pymongo.MongoClient(host=settings.MONGOHOST)
-articles = client.MCDB.articles # articles collection
-pypln_temp = client.MCDB.pypln_temp # pypln_temp temporary collection
-articles_analysis = client.MCDB.articles_analysis # articles_analysis collection
+articles = connections.MCDB.articles # articles collection
+pypln_temp = connections.MCDB.pypln_temp # pypln_temp temporary collection
+articles_analysis = connections.MCDB.articles_analysis # articles_analysis collection
 
-articles.ensure_index('status')
 
 # Defines status codes
 SENT_TO_PYPLN = 'sent_to_pypln'
 
+config = {
+    'batch_size': 10000,  # Articles read per query
+}
+
+
 def load_document(data):
     article, corpus = data
     _id = article['_id']
     logger.debug('Sending article with id {}'.format(_id))
     start_time = time.time()
     try:
-        pypln_document = nlp.send_to_pypln(article, corpus)
+        with metrics.stage('pypln_upload', article.get('trace_id')):
+            pypln_document = nlp.send_to_pypln(article, corpus)
     except RuntimeError as exc:
         logger.warn('Article with id {} got an error '
                 'when uploading'.format(_id), exc_info=exc)
@@ -61,7 +58,7 @@ def load_document(data):
 
     logger.debug('Inserting article with id {} into '
             'temporary collection'.format(_id))
-    pypln_temp.insert({'pypln_url': pypln_document.url, 'articles_id': _id})
+    pypln_temp.insert({'pypln_url': pypln_document.url, 'articles_id': _id, 'trace_id': article.get('trace_id')})
 
 
     logger.debug('Updating status for article with '
@@ -89,14 +86,15 @@ def load(skip, limit=0):
         count = articles.count()
     else:
         count = limit
-    cursor = articles.find(filter_, limit=10000, **find_kwargs)
+    cursor = articles.find(filter_, limit=config['batch_size'], **find_kwargs)
     logger.debug('{} articles to be sent'.format(count))
-    P = Pool()
+    # Each worker saves its own metrics; only the parent serves its metrics over HTTP
+    P = Pool(initializer=metrics.start_worker, initargs=('load_into_pypln',))
     while articles_sent < count:
-        P.map(load_document, ((article, corpus) for article in cursor))
-        articles_sent += 10000
+        profiling.pool_map(P, load_document, ((article, corpus) for article in cursor))
+        articles_sent += config['batch_size']
         logger.debug('{}/{} documents sent.'.format(articles_sent, count))
-        cursor = articles.find(filter_, limit=10000, **find_kwargs)
+        cursor = articles.find(filter_, limit=config['batch_size'], **find_kwargs)
     P.close()
     P.join()
 
@@ -116,4 +114,6 @@ if __name__ == "__main__":
                         help="Adds skip=N to the mongo query")
     args = parser.parse_args()
 
+    metrics.start('load_into_pypln')
+    profiling.install('load_into_pypln')
     load(args.skip, args.limit)
@@ -1,32 +1,268 @@
+#-*- coding:utf-8 -*-
+u"""
+Logging of the capture processes.
+
+The loggers returned by `get_logger` (and the root logger configured by
+`setup`) don't write anything on the thread that logs: their records are
+put on a queue, and a single writer thread per process formats them and
+writes them to the console and the log files. A logging call of a fetch
+thread thus costs the creation of the record and a non-blocking put; when
+the writer falls `settings.LOG_QUEUE_SIZE` records behind, new records are
+dropped and counted instead of blocking the thread, and the writer logs how
+many were lost. Each log file has a single handler per process, whatever
+the number of loggers writing to it.
+
+The same message, i.e. the same format string of a logger at the same
+level, is written at most `settings.LOG_RATE_LIMIT` times every
+`settings.LOG_RATE_PERIOD` seconds; the writer then logs how many were
+suppressed. Log with arguments (``logger.error("Failed to fetch %s", url)``)
+rather than with an already formatted string, so that the repetitions are
+recognized and the formatting happens on the writer thread.
+
+The writer thread is started by the first record of each process, forked
+ones included, and the records still queued are written when the process
+exits.
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import atexit
 import logging
+import os
+import Queue
+import threading
+import time
 from logging.handlers import RotatingFileHandler
+from multiprocessing import util
+
+import settings
 
-def get_logger( source ):
+
+FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_STOP = object()  # Tells the writer to exit
+_lock = threading.Lock()
+_queue = None
+_writer = None
+_pid = None
+_dropped = 0
+_files = {}  # path -> file handler shared by the loggers writing to it
+_limiters = []
+
+
+class RateLimiter(logging.Filter):
     """
-    Responsable for save logs of operations
-    :return: logger configured based on source
-    :rtype: logging.getLogger( source)
-    
-    """ 
+    Lets through `limit` records of each message every `period` seconds.
+    """
+    def __init__(self, limit, period):
+        logging.Filter.__init__(self)
+        self.limit = limit
+        self.period = period
+        self.windows = {}  # (logger, level, format string) -> [start of the window, records, first record]
+        self.pending = []  # summaries of the windows replaced by `filter`
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not self.limit or not isinstance(record.msg, basestring):
+            return True
+        key = (record.name, record.levelno, record.msg)
+        with self._lock:
+            window = self.windows.get(key)
+            if window is None or record.created - window[0] >= self.period:
+                if window is not None and window[1] > self.limit:
+                    self.pending.append(window)
+                self.windows[key] = [record.created, 1, record]
+                return True
+            window[1] += 1
+            return window[1] <= self.limit
+
+    def expire(self, now=None):
+        """
+        Forget the windows older than the period.
+        :return: records telling how many records of these windows were suppressed
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            expired, self.pending = self.pending, []
+            for key, window in self.windows.items():
+                if now - window[0] >= self.period:
+                    del self.windows[key]
+                    if window[1] > self.limit:
+                        expired.append(window)
+        return [self._summary(window) for window in expired]
+
+    def _summary(self, window):
+        start, count, first = window
+        try:
+            message = first.getMessage()
+        except Exception:
+            message = repr(first.msg)
+        return logging.makeLogRecord(dict(
+            first.__dict__, args=(count - self.limit, self.period, message), exc_info=None, exc_text=None,
+            created=time.time(), msg="%s similar messages suppressed in %s s, the first was: %s"))
+
+
+class QueueHandler(logging.Handler):
+    """
+    Puts the records on the queue of the writer thread, which passes them
+    to `targets`.
+    """
+    def __init__(self, targets):
+        logging.Handler.__init__(self)
+        self.targets = tuple(targets)
+
+    def handle(self, record):
+        # without the lock of the handler: the queue is thread safe
+        if self.filter(record):
+            self.emit(record)
+            return True
+        return False
+
+    def emit(self, record):
+        _put((self.targets, record))
+
 
+def _put(item):
+    global _dropped
+    if _pid != os.getpid():
+        _start()
+    try:
+        _queue.put_nowait(item)
+    except Queue.Full:
+        _dropped += 1
 
-    logger = logging.getLogger(source)
-    logger.setLevel(logging.DEBUG)
 
-# create stream handler and set level to debug
-    stream_handler = logging.StreamHandler()
-    stream_handler.setLevel(logging.DEBUG)
-    file_handler = RotatingFileHandler(    '/tmp/mediacloud_{0}.log'.format(source), maxBytes=5e6, backupCount=3)
+def _write(targets, record):
+    for handler in targets:
+        if record.levelno >= handler.level:
+            handler.handle(record)
 
-# create formatter
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-# add formatter to stream_handler
-    stream_handler.setFormatter(formatter)
-    file_handler.setFormatter(formatter)
+def _run(queue):
+    global _dropped
+    next_check = time.time() + 1
+    while True:
+        try:
+            item = queue.get(timeout=1)
+        except Queue.Empty:
+            item = None
+        if item is _STOP:
+            break
+        if item is not None:
+            _write(*item)
+        if time.time() >= next_check:
+            next_check = time.time() + 1
+            for limiter, targets in _limiters:
+                for record in limiter.expire():
+                    _write(targets, record)
+            if _dropped:
+                dropped, _dropped = _dropped, 0
+                record = logging.makeLogRecord({'name': 'logging_mc', 'levelno': logging.WARNING,
+                                                'levelname': 'WARNING',
+                                                'msg': "%s log records dropped, the writer was behind",
+                                                'args': (dropped,)})
+                for handler in _files.values():
+                    _write((handler,), record)
 
-# add stream_handler to logger
-    logger.addHandler(stream_handler)  # uncomment for console output of messages
-    logger.addHandler(file_handler)
-    
-    return logger
\ No newline at end of file
+
+def _start():
+    """
+    Start the writer thread of the process, replacing the one inherited
+    from the parent after a fork.
+    """
+    global _lock, _queue, _writer, _pid
+    if _pid is not None and _pid != os.getpid():
+        # the parent's threads may have held these locks at the fork
+        _lock = threading.Lock()
+        for handler in _handlers():
+            handler.createLock()
+        for limiter, targets in _limiters:
+            limiter._lock = threading.Lock()
+    with _lock:
+        if _pid == os.getpid():
+            return
+        _queue = Queue.Queue(settings.LOG_QUEUE_SIZE)
+        _writer = threading.Thread(target=_run, args=(_queue,), name='logging_mc')
+        _writer.daemon = True
+        _writer.start()
+        _pid = os.getpid()
+        # the workers of multiprocessing pools don't run the atexit functions
+        util.Finalize(None, flush, exitpriority=10)
+
+
+def _handlers():
+    handlers = set(_files.values())
+    for limiter, targets in _limiters:
+        handlers.update(targets)
+    return handlers
+
+
+def flush(timeout=10):
+    """
+    Write the queued records and stop the writer thread; the next record
+    starts a new one.
+    """
+    global _pid
+    with _lock:
+        if _pid != os.getpid() or not _writer.is_alive():
+            return
+        _pid = None
+        _queue.put(_STOP)
+    _writer.join(timeout)
+    for handler in _handlers():
+        handler.flush()
+
+atexit.register(flush)
+
+
+def _file_handler(path, fmt):
+    with _lock:
+        handler = _files.get(path)
+        if handler is None:
+            handler = _files[path] = RotatingFileHandler(path, maxBytes=5e6, backupCount=3)
+            handler.setFormatter(logging.Formatter(fmt))
+        return handler
+
+
+def _attach(logger, filename, fmt, console, stream=None):
+    if any(isinstance(h, QueueHandler) for h in logger.handlers):
+        return logger
+    targets = [_file_handler(filename, fmt)]
+    if console:
+        stream_handler = logging.StreamHandler(stream)
+        stream_handler.setFormatter(logging.Formatter(fmt))
+        targets.append(stream_handler)
+    handler = QueueHandler(targets)
+    limiter = RateLimiter(settings.LOG_RATE_LIMIT, settings.LOG_RATE_PERIOD)
+    handler.addFilter(limiter)
+    _limiters.append((limiter, handler.targets))
+    logger.addHandler(handler)
+    logger.setLevel(getattr(logging, settings.LOG_LEVEL))
+    return logger
+
+
+def get_logger(source, filename=None, fmt=FORMAT, console=True):
+    """
+    Responsable for save logs of operations
+    :param source: name of the logger
+    :param filename: log file, /tmp/mediacloud_<source>.log by default
+    :param fmt: format of the records
+    :param console: whether to log to stderr too
+    :return: logger configured based on source
+    :rtype: logging.getLogger( source)
+    """
+    filename = filename or '/tmp/mediacloud_{0}.log'.format(source)
+    return _attach(logging.getLogger(source), filename, fmt, console)
+
+
+def setup(filename, fmt=FORMAT, console=False, stream=None):
+    """
+    Route the records of the root logger, i.e. of the module level
+    functions of `logging`, through the writer thread. Replaces
+    `logging.basicConfig` in the scripts.
+    :param stream: stream of the console output, stderr by default
+    :return: the root logger
+    """
+    return _attach(logging.getLogger(), filename, fmt, console, stream)
@@ -0,0 +1,224 @@
+#-*- coding:utf-8 -*-
+u"""
+Memory diagnostics of the daemon processes.
+
+`install` makes a process:
+
+- log its resident memory every `settings.MEMORY_RSS_INTERVAL` seconds, and
+  export it as the ``mediacloud_rss_bytes`` gauge of `metrics`;
+- write a report to `settings.MEMORY_DIRECTORY` on SIGUSR1::
+
+      kill -USR1 <pid>
+
+  and every time it grows by `settings.MEMORY_REPORT_GROWTH` bytes since
+  the last report. The same report is served in ``/memory`` of the metrics
+  server when `settings.METRICS_PORT` is set.
+
+A report shows what grew since the previous one: the number of objects of
+each type followed by the garbage collector, and the size of the lists,
+dicts and sets held by the globals of the modules of this project (one
+level into dicts and objects), e.g. ``language.MEMO._sources``, which is
+where state accumulating for the life of a process usually lives.
+
+Python 2 has no tracemalloc, hence these two views instead of the
+allocation sites.
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import collections
+import datetime
+import gc
+import os
+import resource
+import signal
+import sys
+import threading
+import time
+
+import logging_mc
+import metrics
+import settings
+
+
+logger = logging_mc.get_logger('memory')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONTAINERS = (list, dict, set, frozenset, collections.deque)
+TOP = 30  # Lines of each section of a report
+
+RSS_BYTES = metrics.gauge('mediacloud_rss_bytes', 'Resident memory of the process')
+
+
+def rss():
+    """
+    Resident memory of the process in bytes, or its peak where /proc is missing.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except IOError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def type_counts():
+    """
+    :return: Counter type name -> number of objects followed by the gc
+    """
+    counts = collections.Counter()
+    for obj in gc.get_objects():
+        counts[type(obj).__name__] += 1
+    return counts
+
+
+def _project_modules():
+    for name, module in sys.modules.items():
+        path = getattr(module, '__file__', None)
+        if module is not None and path and os.path.abspath(path).startswith(ROOT):
+            yield name, module
+
+
+def _containers(path, value, depth):
+    if isinstance(value, CONTAINERS):
+        yield path, len(value)
+        if depth and isinstance(value, dict) and len(value) <= 100:
+            for key, item in value.items():
+                if isinstance(key, basestring):
+                    for found in _containers(u'{0}[{1!r}]'.format(path, key), item, depth - 1):
+                        yield found
+    elif depth and hasattr(value, '__dict__') and getattr(type(value), '__module__', None) in sys.modules \
+            and not isinstance(value, type):
+        module = sys.modules[type(value).__module__]
+        if os.path.abspath(getattr(module, '__file__', None) or '/').startswith(ROOT):
+            for attr, item in vars(value).items():
+                for found in _containers(u'{0}.{1}'.format(path, attr), item, depth - 1):
+                    yield found
+
+
+def module_containers(depth=1):
+    """
+    Sizes of the containers held by the globals of the modules of the project.
+    :return: dict path -> number of items
+    """
+    sizes = {}
+    for name, module in _project_modules():
+        for attr, value in vars(module).items():
+            if attr.startswith('__'):
+                continue
+            for path, size in _containers(u'{0}.{1}'.format(name, attr), value, depth):
+                sizes[path] = size
+    return sizes
+
+
+class MemoryTracker(object):
+    """
+    Reports of the memory of the process, each compared to the previous one.
+    """
+    def __init__(self, name, directory=None):
+        self.name = name
+        self.directory = settings.MEMORY_DIRECTORY if directory is None else directory
+        self.previous = None  # (time, rss, type counts, container sizes) of the last report
+        self._lock = threading.Lock()
+        self.requested = threading.Event()  # set by SIGUSR1, acted on by `watch`
+
+    def report(self):
+        """
+        :return: text of a report of what grew since the previous one
+        """
+        with self._lock:
+            gc.collect()
+            now, current, types, containers = datetime.datetime.now(), rss(), type_counts(), module_containers()
+            before = self.previous or (now, current, collections.Counter(), {})
+            self.previous = (now, current, types, containers)
+        lines = [u'Memory of {0} (pid {1}) at {2:%Y-%m-%d %H:%M:%S}'.format(self.name, os.getpid(), now),
+                 u'RSS {0:.1f} MB ({1:+.1f} MB since {2:%Y-%m-%d %H:%M:%S})'.format(
+                     current / 1048576., (current - before[1]) / 1048576., before[0]),
+                 u'', u'{0:40} {1:>10} {2:>10}'.format(u'objects followed by the gc', u'count', u'change')]
+        growth = sorted(types, key=lambda t: (types[t] - before[2].get(t, 0), types[t]), reverse=True)
+        for type_name in growth[:TOP]:
+            lines.append(u'{0:40} {1:10} {2:+10}'.format(type_name[:40], types[type_name],
+                                                         types[type_name] - before[2].get(type_name, 0)))
+        lines += [u'', u'{0:60} {1:>10} {2:>10}'.format(u'containers of the modules', u'items', u'change')]
+        growth = sorted(containers, key=lambda p: (containers[p] - before[3].get(p, 0), containers[p]),
+                        reverse=True)
+        for path in growth[:TOP]:
+            lines.append(u'{0:60} {1:10} {2:+10}'.format(path[-60:], containers[path],
+                                                         containers[path] - before[3].get(path, 0)))
+        return u'\n'.join(lines) + u'\n'
+
+    def write_report(self):
+        """
+        Write a report to the memory directory.
+        :return: path of the report
+        """
+        text = self.report()
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        path = os.path.join(self.directory, '{0}-{1}-{2:%Y%m%d%H%M%S}.txt'.format(
+            self.name, os.getpid(), datetime.datetime.now()))
+        with open(path, 'w') as f:
+            f.write(text.encode('utf8'))
+        logger.info("Memory report of %s written to %s", self.name, path)
+        return path
+
+    def watch(self, interval, growth):
+        """
+        Write a report when one is requested (SIGUSR1), and log the RSS every
+        `interval` seconds, if set, writing a report when it grew by `growth`
+        bytes since the last one.
+        """
+        reported = rss()
+        deadline = time.time() + interval if interval else None
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.time())
+            if self.requested.wait(timeout):
+                self.requested.clear()
+                self._try_write_report()
+                reported = rss()
+                continue
+            deadline += interval
+            current = rss()
+            RSS_BYTES.set(current)
+            logger.info("RSS of %s: %.1f MB", self.name, current / 1048576.)
+            if growth and current - reported >= growth:
+                self._try_write_report()
+                reported = current
+
+    def _try_write_report(self):
+        try:
+            self.write_report()
+        except (IOError, OSError) as e:
+            logger.error("Could not write the memory report: %s", e)
+
+
+_tracker = None
+
+
+def _request_report(signum, frame):
+    # the report walks all the objects: done by the watcher thread, not here
+    if _tracker is not None:
+        _tracker.requested.set()
+
+
+def install(name):
+    """
+    Start the memory diagnostics of the process. Must be called from the
+    main thread.
+    :param name: name of the process, prefix of the reports
+    :return: the tracker
+    """
+    global _tracker
+    if _tracker is not None:
+        return _tracker
+    _tracker = MemoryTracker(name)
+    _tracker.report()  # baseline of the first report
+    RSS_BYTES.set(rss())
+    signal.signal(signal.SIGUSR1, _request_report)
+    metrics.add_page('/memory', _tracker.report)
+    thread = threading.Thread(target=_tracker.watch, args=(settings.MEMORY_RSS_INTERVAL,
+                                                           settings.MEMORY_REPORT_GROWTH), name='memory')
+    thread.daemon = True
+    thread.start()
+    return _tracker
@@ -0,0 +1,405 @@
+#-*- coding:utf-8 -*-
+u"""
+Metrics of the capture processes: counters, gauges and latency histograms.
+
+The stages of the pipeline are timed with `stage`::
+
+    with metrics.stage('article_fetch'):
+        r = warc.get(url, timeout=30)
+
+which observes the time in the ``mediacloud_stage_seconds`` histogram and
+counts the exceptions in ``mediacloud_stage_errors_total``, both labeled by
+stage; failures that don't raise are counted with `error`. Recording an
+event takes a lock and a few additions, a couple of microseconds. Given the
+trace id of an article, the stage is also recorded as a span of its trace
+(see `tracing`).
+
+`start` exposes the metrics of the process in the Prometheus text format on
+``http://127.0.0.1:<settings.METRICS_PORT>/metrics`` and saves a snapshot
+of them in the `metrics` collection every `settings.METRICS_FLUSH_INTERVAL`
+seconds, and once more at exit. The workers of a multiprocessing pool
+inherit the metrics and the `start` of their parent: `start_worker`, as the
+initializer of the pool, makes each of them count from zero and save its own
+snapshots.
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import bisect
+import datetime
+import os
+import socket
+import threading
+import time
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from multiprocessing import util
+
+import pymongo
+
+import connections
+import logging_mc
+import settings
+import tracing
+
+
+logger = logging_mc.get_logger('metrics')
+
+MCDB = connections.MCDB
+METRICS = MCDB.metrics  # Snapshots of the metrics of the capture processes
+
+INF = float('inf')
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, INF)
+
+
+class _Value(object):
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def reset(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+
+class _Buckets(object):
+    __slots__ = ('bounds', 'counts', 'sum', '_lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def reset(self):
+        self.counts = [0] * len(self.bounds)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+
+class _Metric(object):
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labels)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _new(self):
+        return _Value()
+
+    def labels(self, *values):
+        """
+        Return the child of the metric for the label values, to record on it.
+        """
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new())
+        return child
+
+    def _label_text(self, values, extra=()):
+        pairs = zip(self.labelnames, values) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join('{0}="{1}"'.format(k, str(v).replace('\\', r'\\').replace('"', r'\"'))
+                              for k, v in pairs) + '}'
+
+    def samples(self):
+        """
+        :return: list of (name, label text, value)
+        """
+        return [(self.name, self._label_text(values), child.value)
+                for values, child in sorted(self._children.items())]
+
+    def snapshot(self):
+        return dict((','.join(values) or '_', child.value) for values, child in self._children.items())
+
+    def reset(self):
+        self._lock = threading.Lock()
+        for child in self._children.values():
+            child.reset()
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labels)
+        self.buckets = tuple(buckets) if buckets[-1] == INF else tuple(buckets) + (INF,)
+
+    def _new(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def samples(self):
+        samples = []
+        for values, child in sorted(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = '+Inf' if bound == INF else repr(bound)
+                samples.append((self.name + '_bucket', self._label_text(values, [('le', le)]), cumulative))
+            samples.append((self.name + '_sum', self._label_text(values), total))
+            samples.append((self.name + '_count', self._label_text(values), cumulative))
+        return samples
+
+    def snapshot(self):
+        snapshot = {}
+        for values, child in self._children.items():
+            with child._lock:
+                snapshot[','.join(values) or '_'] = {'counts': list(child.counts), 'sum': child.sum}
+        return snapshot
+
+
+class Registry(object):
+    def __init__(self):
+        self.metrics = []
+        self._names = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        Add a metric, or return the one already registered with its name.
+        """
+        with self._lock:
+            if metric.name not in self._names:
+                self._names[metric.name] = metric
+                self.metrics.append(metric)
+            return self._names[metric.name]
+
+    def render(self):
+        """
+        The metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP {0} {1}'.format(metric.name, metric.documentation))
+            lines.append('# TYPE {0} {1}'.format(metric.name, metric.kind))
+            for name, labels, value in metric.samples():
+                lines.append('{0}{1} {2}'.format(name, labels, _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        return dict((metric.name, {'type': metric.kind, 'values': metric.snapshot()}) for metric in self.metrics)
+
+    def reset(self):
+        """
+        Set all the values back to zero, e.g. in a forked process.
+        """
+        self._lock = threading.Lock()
+        for metric in self.metrics:
+            metric.reset()
+
+
+def _format_value(value):
+    if value == INF:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labels=()):
+    return REGISTRY.register(Counter(name, documentation, labels))
+
+
+def gauge(name, documentation, labels=()):
+    return REGISTRY.register(Gauge(name, documentation, labels))
+
+
+def histogram(name, documentation, labels=(), buckets=BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labels, buckets))
+
+
+STAGE_SECONDS = histogram('mediacloud_stage_seconds', 'Time spent in each stage of the pipeline', ['stage'])
+STAGE_ERRORS = counter('mediacloud_stage_errors_total', 'Failures in each stage of the pipeline', ['stage'])
+ARTICLES_STORED = counter('mediacloud_articles_stored_total', 'Articles inserted in MongoDB', ['process'])
+IN_FLIGHT = gauge('mediacloud_in_flight', 'Feeds or outlet pages being processed', ['process'])
+
+
+class stage(object):
+    """
+    Context manager timing a stage of the pipeline, as a span of `trace` if given.
+    """
+    __slots__ = ('name', 'trace', 't0')
+
+    def __init__(self, name, trace=None):
+        self.name = name
+        self.trace = trace
+
+    def __enter__(self):
+        self.t0 = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.time() - self.t0
+        STAGE_SECONDS.labels(self.name).observe(seconds)
+        if exc_type is not None:
+            STAGE_ERRORS.labels(self.name).inc()
+        if self.trace is not None:
+            tracing.record(self.trace, self.name, self.t0, seconds, exc_type is not None)
+        return False
+
+
+def error(name):
+    """
+    Count a failure of a stage that did not raise.
+    """
+    STAGE_ERRORS.labels(name).inc()
+
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+PAGES = {}  # path -> function returning the text of another page of the metrics server
+
+
+def add_page(path, function):
+    """
+    Serve the text returned by `function` in `path` of the metrics server.
+    """
+    PAGES[path] = function
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path in ('/', '/metrics'):
+            body, content_type = REGISTRY.render(), 'text/plain; version=0.0.4; charset=utf-8'
+        elif path in PAGES:
+            body, content_type = PAGES[path](), 'text/plain; charset=utf-8'
+        else:
+            self.send_error(404)
+            return
+        if isinstance(body, unicode):
+            body = body.encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_http_server(port, address='127.0.0.1'):
+    """
+    Serve the metrics in a background thread.
+    :return: the server
+    """
+    server = _ThreadingServer((address, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics-http')
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def flush(process):
+    """
+    Save a snapshot of the metrics of the process in the `metrics` collection.
+    """
+    METRICS.insert({'process': process, 'host': socket.gethostname(), 'pid': os.getpid(),
+                    'time': datetime.datetime.now(), 'metrics': REGISTRY.snapshot()})
+
+
+def _try_flush(process):
+    try:
+        flush(process)
+    except pymongo.errors.PyMongoError as e:
+        logger.error("Could not save the metrics: %s", e)
+
+
+def _flush_loop(process, interval):
+    while True:
+        time.sleep(interval)
+        _try_flush(process)
+
+
+_started = set()
+
+
+def start(process, port=None, flush_interval=None):
+    """
+    Expose the metrics over HTTP and save them periodically, as configured
+    in settings. Does nothing if already started.
+    :param process: name of the process, e.g. 'downloader'
+    """
+    port = settings.METRICS_PORT if port is None else port
+    flush_interval = settings.METRICS_FLUSH_INTERVAL if flush_interval is None else flush_interval
+    if process in _started:
+        return
+    _started.add(process)
+    if port:
+        try:
+            start_http_server(port)
+            logger.info("Metrics of %s served on port %s", process, port)
+        except socket.error as e:
+            logger.error("Could not serve the metrics on port %s: %s", port, e)
+    if flush_interval:
+        thread = threading.Thread(target=_flush_loop, args=(process, flush_interval), name='metrics-flush')
+        thread.daemon = True
+        thread.start()
+        # Runs at exit, also in the workers of multiprocessing pools
+        util.Finalize(None, _try_flush, args=(process,), exitpriority=10)
+
+
+def start_worker(process, flush_interval=None):
+    """
+    Initializer of the workers of a multiprocessing pool: count from zero and
+    save the metrics of the worker, which are not served over HTTP.
+    :param process: name of the process, e.g. 'load_into_pypln'
+    """
+    REGISTRY.reset()
+    _started.clear()
+    start(process, port=0, flush_interval=flush_interval)
@@ -7,19 +7,12 @@ This Module handles the pushing of mediacloud articles into a PyPLN corpus.
 import zlib
 import cPickle as CP
 
-import pymongo
-from pypln.api import PyPLN
+import connections
 
-import settings
 
-
-client = pymongo.MongoClient(settings.MONGOHOST, 27017)
-MCDB = client.MCDB
+MCDB = connections.MCDB
 FEEDS = MCDB.feeds  # Feed collection
 ARTICLES = MCDB.articles  # Article Collection
-pypln = PyPLN(settings.PYPLNHOST, settings.PYPLN_CREDENTIALS)
-
-ARTICLES.ensure_index([("pypln_url", pymongo.ASCENDING)], sparse=True)
 
 
 def get_corpus(corpus_name='MC_articles'):
@@ -27,9 +20,9 @@ def get_corpus(corpus_name='MC_articles'):
     Return the existing Mediacloud corpus or create it and return.
     """
     try:
-        article_corpus = pypln.add_corpus(name=corpus_name, description='MediaCloud Articles')
+        article_corpus = connections.pypln().add_corpus(name=corpus_name, description='MediaCloud Articles')
     except RuntimeError:
-        article_corpus = [c for c in pypln.corpora() if c.name == corpus_name][0]
+        article_corpus = [c for c in connections.pypln().corpora() if c.name == corpus_name][0]
 
     return article_corpus
 
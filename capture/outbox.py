@@ -0,0 +1,292 @@
+#-*- coding:utf-8 -*-
+u"""
+Outbox of the articles stored, read by the stages downstream of the ingest.
+
+The downloader and the crawlers append an event to the `outbox` collection
+for the articles they store, and go on fetching::
+
+    {'_id': ObjectId(...), 'article': ObjectId(...), 'source': 'folha.uol.com.br',
+     'published': datetime(...), 'inserted': datetime(...), 'created': datetime(...),
+     'trace_id': '...'}
+
+Each consumer reads the events in the order of their ObjectId, from its own
+offset saved in `outbox_offsets`, so that it reads only the new work, and a
+slow or stopped consumer falls behind without slowing the capture or the
+other consumers:
+
+- ``elastic`` indexes the articles in Elasticsearch;
+- ``pypln`` uploads the articles to PyPLN;
+- ``rollups`` counts the lags of the articles in the freshness rollups.
+
+::
+
+    python capture/outbox.py consume elastic
+    python capture/outbox.py status
+
+A batch is handled before the offset moves past it, so a consumer that
+stops replays at most one batch. Only one process should run each
+consumer. The ObjectIds of several processes are only ordered by their
+second, so the consumers leave the events of the last
+`settings.OUTBOX_SETTLE` seconds for their next read, by which time the
+events of a second are all inserted.
+
+The Sphinx delta index (`indexing/sphinx.conf`) holds the articles stored
+since the ``sphinx`` offset, which ``sphinx-mark`` moves forward when the
+main index is rebuilt (`indexing/index_on_sphinx.sh`).
+
+The events expire after `settings.OUTBOX_RETENTION` days (TTL index, see
+`connections`). The articles stored before the outbox are still found by
+``load_into_pypln.py`` and ``indexing/index_elastic.py``.
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import argparse
+import datetime
+import os
+import sys
+import time
+
+import pymongo
+from bson.objectid import ObjectId
+
+import connections
+import freshness
+import logging_mc
+import metrics
+import settings
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+logger = logging_mc.get_logger('outbox')
+
+MCDB = connections.MCDB
+OUTBOX = MCDB.outbox  # Events of the articles stored, in the order of their ObjectId
+OFFSETS = MCDB.outbox_offsets  # Last event handled by each consumer
+ARTICLES = MCDB.articles  # Article Collection
+
+config = {
+    'batch_size': 500,  # Events handled at once by a consumer
+    'interval': 5,  # Seconds a consumer waits when there are no events
+    'delta_margin': 60,  # Seconds before the sphinx offset from which the Sphinx delta reads the articles
+}
+
+EVENTS = metrics.counter('mediacloud_outbox_events_total', 'Events of the outbox handled', ['consumer'])
+LAG = metrics.gauge('mediacloud_outbox_lag_seconds', 'Age of the last event handled by a consumer behind',
+                    ['consumer'])
+
+
+def event(article, inserted_at):
+    """
+    :param article: article just stored
+    :param inserted_at: time of the insertion, in the time reference of its
+                        `published` field (see `freshness.inserted`)
+    :return: the event of the article
+    """
+    published = article.get('published')
+    return {'article': article['_id'], 'source': freshness.source_of(article),
+            'published': published if isinstance(published, datetime.datetime) else None,
+            'inserted': inserted_at, 'created': datetime.datetime.utcnow(), 'trace_id': article.get('trace_id')}
+
+
+def publish(events):
+    """
+    Append the events to the outbox. The failures are logged: the articles
+    are stored, and the consumers only miss them.
+    """
+    if not events:
+        return
+    try:
+        with metrics.stage('outbox_write'):
+            OUTBOX.insert(events, w=1)
+    except pymongo.errors.PyMongoError as e:
+        logger.error("Could not publish the events of %s articles: %s", len(events), e)
+
+
+def settled():
+    """
+    :return: ObjectId before which all the events are inserted
+    """
+    return ObjectId.from_datetime(datetime.datetime.utcnow() - datetime.timedelta(seconds=settings.OUTBOX_SETTLE))
+
+
+def articles_of(events, fields=None):
+    """
+    :return: the stored articles of the events, in their order
+    """
+    ids = [e['article'] for e in events]
+    found = dict((a['_id'], a) for a in ARTICLES.find({'_id': {'$in': ids}}, fields=fields))
+    return [found[_id] for _id in ids if _id in found]
+
+
+class Consumer(object):
+    """
+    Reads the events after its offset and passes them to `handle` by batches.
+    """
+    def __init__(self, name, handle=None, batch_size=None):
+        self.name = name
+        self.handle = handle
+        self.batch_size = config['batch_size'] if batch_size is None else batch_size
+
+    def offset(self):
+        """
+        :return: ObjectId of the last event handled, None before the first one
+        """
+        doc = OFFSETS.find_one({'_id': self.name})
+        return doc['offset'] if doc else None
+
+    def commit(self, offset):
+        OFFSETS.update({'_id': self.name}, {'$set': {'offset': offset, 'updated': datetime.datetime.utcnow()}},
+                       upsert=True)
+
+    def pending(self, limit=0):
+        """
+        :return: the settled events after the offset, oldest first
+        """
+        spec = {'$lt': settled()}
+        offset = self.offset()
+        if offset is not None:
+            spec['$gt'] = offset
+        return list(OUTBOX.find({'_id': spec}, sort=[('_id', pymongo.ASCENDING)], limit=limit))
+
+    def poll(self):
+        """
+        Handle the next batch of events.
+        :return: number of events handled
+        """
+        events = self.pending(self.batch_size)
+        if events:
+            self.handle(events)
+            self.commit(events[-1]['_id'])
+            EVENTS.labels(self.name).inc(len(events))
+        if len(events) == self.batch_size:  # behind
+            created = events[-1]['_id'].generation_time.replace(tzinfo=None)
+            LAG.labels(self.name).set((datetime.datetime.utcnow() - created).total_seconds())
+        else:
+            LAG.labels(self.name).set(0)
+        return len(events)
+
+    def run(self, once=False):
+        """
+        Handle the events as they come, or until there are no more if `once`.
+        A batch that fails is tried again after `config['interval']` seconds.
+        """
+        logger.info("Consumer %s starting after %s", self.name, self.offset())
+        while True:
+            try:
+                handled = self.poll()
+            except Exception as e:
+                logger.exception("Consumer %s failed: %s", self.name, e)
+                handled = 0
+            if handled < self.batch_size:
+                if once:
+                    return
+                time.sleep(config['interval'])
+
+
+def index_on_elastic(events):
+    import downloader
+    from elasticsearch.exceptions import RequestError
+    fields = settings.ELASTIC_ARTICLE_FIELDS + ['source', 'trace_id']
+    for article in articles_of(events, fields):
+        try:
+            downloader.index_article_on_elastic(article, article['_id'])
+        except RequestError as e:  # rejected document, the other errors stop the batch
+            logger.error("Could not index %s: %s", article['_id'], e)
+
+
+_corpus = None
+
+
+def upload_to_pypln(events):
+    global _corpus
+    import load_into_pypln
+    import nlp
+    if _corpus is None:
+        _corpus = nlp.get_corpus()
+    for article in articles_of(events, {'link_content': False}):
+        load_into_pypln.load_document((article, _corpus))
+
+
+def count_lags(events):
+    for e in events:
+        freshness.inserted(e, e['inserted'], e['created'])
+
+
+CONSUMERS = {
+    'elastic': index_on_elastic,
+    'pypln': upload_to_pypln,
+    'rollups': count_lags,
+}
+
+
+def consume(name, once=False, batch_size=None):
+    Consumer(name, CONSUMERS[name], batch_size).run(once)
+
+
+def sphinx_delta(fields, attrs):
+    """
+    Write the articles stored since the ``sphinx`` offset as the XML of a
+    Sphinx xmlpipe2 source, on stdout. They are read by `_id` range, from
+    `config['delta_margin']` seconds before the offset since the ObjectId of
+    an article is created a little before its event; the articles of the
+    margin also in the main index are replaced by the delta.
+    """
+    from indexing import mongo2sphinx
+    offset = Consumer('sphinx').offset()
+    spec = {}
+    if offset is not None:
+        since = offset.generation_time - datetime.timedelta(seconds=config['delta_margin'])
+        spec = {'_id': {'$gte': ObjectId.from_datetime(since)}}
+    mongo2sphinx.query(MCDB.name, 'articles', fields, attrs, settings.MONGOHOST, spec=spec, id_field='sphinx_id')
+
+
+def sphinx_mark():
+    """
+    Move the ``sphinx`` offset to the last settled event, before rebuilding
+    the main index.
+    """
+    last = list(OUTBOX.find({'_id': {'$lt': settled()}}, fields=['_id'], sort=[('_id', pymongo.DESCENDING)],
+                            limit=1))
+    if last:
+        Consumer('sphinx').commit(last[0]['_id'])
+
+
+def print_status():
+    """
+    Print the offset and the events pending of each consumer.
+    """
+    print u'{0:10} {1:>26} {2:>10}'.format(u'consumer', u'offset', u'pending')
+    for name in sorted(CONSUMERS.keys() + ['sphinx']):
+        consumer = Consumer(name)
+        offset = consumer.offset()
+        spec = {'_id': {'$gt': offset}} if offset is not None else {}
+        date = u'{0:%Y-%m-%d %H:%M:%S} UTC'.format(offset.generation_time) if offset else u'-'
+        print u'{0:10} {1:>26} {2:>10}'.format(name, date, OUTBOX.find(spec).count())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Consumers of the outbox of the articles stored")
+    subparsers = parser.add_subparsers(dest='command')
+    consumer_parser = subparsers.add_parser('consume', help="run a consumer")
+    consumer_parser.add_argument('name', choices=sorted(CONSUMERS))
+    consumer_parser.add_argument('--once', action='store_true', help="stop when there are no more events")
+    consumer_parser.add_argument('-b', '--batch-size', type=int, default=None, help="events handled at once")
+    subparsers.add_parser('status', help="print the offset of each consumer")
+    delta_parser = subparsers.add_parser('sphinx-delta', help="write the XML of the Sphinx delta index")
+    delta_parser.add_argument('--fields', '-f', required=True, nargs='+', help="fields to be indexed")
+    delta_parser.add_argument('--attrs', '-a', required=True, nargs='+', help="extra attributes")
+    subparsers.add_parser('sphinx-mark', help="start a new Sphinx delta, before rebuilding the main index")
+    args = parser.parse_args()
+    if args.command == 'consume':
+        metrics.start('outbox_' + args.name)
+        consume(args.name, args.once, args.batch_size)
+    elif args.command == 'status':
+        print_status()
+    elif args.command == 'sphinx-delta':
+        sphinx_delta(args.fields, args.attrs)
+    elif args.command == 'sphinx-mark':
+        sphinx_mark()
@@ -0,0 +1,227 @@
+#-*- coding:utf-8 -*-
+u"""
+Opt-in sampling profiler for the long-running jobs.
+
+A background thread looks at the stacks of all the threads of the process
+(`sys._current_frames`) every `settings.PROFILE_INTERVAL` seconds and counts
+them. Every `settings.PROFILE_DUMP_INTERVAL` seconds, and when the profiling
+stops, the counts are written in the collapsed format of the flame graph
+tools, one line per stack::
+
+    <module>(downloader.py:1);parallel_fetch(downloader.py:288);... 42
+
+to ``<settings.PROFILE_DIRECTORY>/<job>-<pid>-<start time>.collapsed``, e.g.
+for ``flamegraph.pl downloader-1234-20140502100000.collapsed > flame.svg``.
+The processes forked by multiprocessing (pool workers, extraction workers)
+keep sampling in their own file. A sample of 50 threads takes under a
+millisecond, so at the default rate the profiler costs 1-2% of a core and
+can stay enabled in production.
+
+The jobs that call `install` are profiled from the start when the
+``MEDIACLOUD_PROFILE`` environment variable is set::
+
+    MEDIACLOUD_PROFILE=1 python capture/downloader.py
+
+and SIGUSR2 starts or stops the profiling of a running process::
+
+    kill -USR2 <pid>
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import atexit
+import collections
+import datetime
+import multiprocessing
+import os
+import signal
+import sys
+import thread
+import threading
+import time
+from multiprocessing import util
+
+import logging_mc
+import settings
+
+
+logger = logging_mc.get_logger('profiling')
+
+MAX_DEPTH = 100  # Frames kept from the innermost one
+WAIT = 1  # Seconds the main thread blocks at a time on a pool
+
+
+class SamplingProfiler(object):
+    def __init__(self, name, directory=None, interval=None, dump_interval=None):
+        self.name = name
+        self.directory = settings.PROFILE_DIRECTORY if directory is None else directory
+        self.interval = settings.PROFILE_INTERVAL if interval is None else interval
+        self.dump_interval = settings.PROFILE_DUMP_INTERVAL if dump_interval is None else dump_interval
+        self.running = False
+        self.path = None
+        self.samples = 0
+        self._counts = collections.Counter()  # stack (outermost frame first) -> samples
+        self._labels = {}  # code object -> frame label
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _label(self, code):
+        label = '{0}({1}:{2})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+        self._labels[code] = label
+        return label
+
+    def sample(self):
+        """
+        Count the current stack of every thread but the profiler's.
+        """
+        own = thread.get_ident()
+        labels = self._labels
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                code = frame.f_code
+                stack.append(labels.get(code) or self._label(code))
+                frame = frame.f_back
+            stack.reverse()
+            stacks.append(tuple(stack))
+        with self._lock:
+            self._counts.update(stacks)
+            self.samples += 1
+
+    def dump(self):
+        """
+        Write the counts in the collapsed format, replacing the previous dump.
+        """
+        with self._lock:
+            counts = self._counts.items()
+        if not counts or self.path is None:
+            return
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        with open(self.path + '.tmp', 'w') as f:
+            for stack, count in sorted(counts):
+                f.write('{0} {1}\n'.format(';'.join(stack), count))
+        os.rename(self.path + '.tmp', self.path)
+
+    def _run(self):
+        next_dump = time.time() + self.dump_interval
+        while self.running:
+            time.sleep(self.interval)
+            self.sample()
+            if time.time() >= next_dump:
+                self.dump()
+                next_dump = time.time() + self.dump_interval
+        self.dump()
+
+    def start(self):
+        """
+        Start sampling in a new file.
+        """
+        if self.running:
+            return
+        if self._thread is not None and self._thread.is_alive():  # writing the dump of the previous run
+            self._thread.join(self.interval + 5)
+        self._counts, self.samples = collections.Counter(), 0
+        self.path = os.path.join(self.directory, '{0}-{1}-{2:%Y%m%d%H%M%S}.collapsed'.format(
+            self.name, os.getpid(), datetime.datetime.now()))
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name='profiler')
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info("Profiling %s every %s s in %s", self.name, self.interval, self.path)
+
+    def stop(self):
+        """
+        Stop sampling; the profiler thread writes the last dump as it exits.
+        """
+        if self.running:
+            self.running = False
+            logger.info("Stopped profiling %s after %s samples", self.name, self.samples)
+
+    def toggle(self):
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def close(self):
+        """
+        Stop sampling and wait for the last dump.
+        """
+        thread_ = self._thread
+        self.stop()
+        if thread_ is not None and thread_.is_alive() and thread_ is not threading.current_thread():
+            thread_.join(self.interval + 5)
+
+    def _after_fork(self):
+        # the thread and the counts stay in the parent process
+        self._lock = threading.Lock()
+        self._thread = None
+        util.Finalize(self, self.close, exitpriority=10)
+        if self.running:
+            self.running = False
+            self.start()
+
+
+_profiler = None
+
+
+def pool_map(pool, function, iterable):
+    """
+    `pool.map` that lets the signal handlers run while it waits. On Python 2
+    a wait without timeout blocks the main thread uninterruptibly, so
+    SIGUSR2 (and the SIGUSR1 of `memory`) would wait for the whole batch.
+    :param pool: multiprocessing or thread pool
+    :return: the results of `function`, in the order of `iterable`
+    """
+    result = pool.map_async(function, iterable)
+    while True:
+        try:
+            return result.get(WAIT)
+        except multiprocessing.TimeoutError:
+            continue
+
+
+def interruptible(results):
+    """
+    Iterate over the results of `pool.imap`/`pool.imap_unordered` with the
+    signal handlers running while it waits, as `pool_map`.
+    """
+    while True:
+        try:
+            yield results.next(WAIT)
+        except multiprocessing.TimeoutError:
+            continue
+        except StopIteration:
+            return
+
+
+def _toggle(signum, frame):
+    if _profiler is not None:
+        _profiler.toggle()
+
+
+def install(name):
+    """
+    Let SIGUSR2 toggle the profiling of the process, and start it now if
+    the MEDIACLOUD_PROFILE environment variable is set. Must be called from
+    the main thread.
+    :param name: name of the job, prefix of the files written
+    :return: the profiler
+    """
+    global _profiler
+    if _profiler is None:
+        _profiler = SamplingProfiler(name)
+        util.register_after_fork(_profiler, SamplingProfiler._after_fork)
+        atexit.register(_profiler.close)
+        # the workers of multiprocessing pools don't run the atexit functions
+        util.Finalize(_profiler, _profiler.close, exitpriority=10)
+        signal.signal(signal.SIGUSR2, _toggle)
+    if os.environ.get('MEDIACLOUD_PROFILE'):
+        _profiler.start()
+    return _profiler
@@ -0,0 +1,40 @@
+#-*- coding:utf-8 -*-
+u"""
+Thread-safe rate limiting of requests.
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import threading
+import time
+
+
+class RateLimiter(object):
+    """
+    Spaces the calls to `wait` by at least `interval` seconds, independently
+    for each key (e.g. per host). Each caller reserves its slot while holding
+    the lock and sleeps outside of it, so waiting threads don't block each other.
+    """
+    def __init__(self, interval):
+        """
+        :param interval: minimum number of seconds between two calls with the same key
+        """
+        self.interval = interval
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, key=None):
+        """
+        Block until the next slot for `key` is due.
+        :return: number of seconds waited
+        """
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next_slot.get(key, now))
+            self._next_slot[key] = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        return max(delay, 0)
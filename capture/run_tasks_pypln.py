@@ -7,18 +7,16 @@ based on distributed message passing. You can run the Celery worker by executing
 
 """
 
-import pymongo
-import settings
+import connections
 from tasks_pypln import fetch_property
 from multiprocessing import Pool
 
 
 
 ## Media Cloud database setup
-client = pymongo.MongoClient(host=settings.MONGOHOST)
-articles = client.MCDB.articles # articles collection
-pypln_temp = client.MCDB.pypln_temp # pypln_temp temporary collection
-articles_analysis = client.MCDB.articles_analysis # articles_analysis collection
+articles = connections.MCDB.articles # articles collection
+pypln_temp = connections.MCDB.pypln_temp # pypln_temp temporary collection
+articles_analysis = connections.MCDB.articles_analysis # articles_analysis collection
 
 
 def send_to_queue(article):
@@ -1,34 +1,23 @@
 __author__ = 'elisa'
 
 
-import pymongo
 import datetime
 
-import logging
-from logging.handlers import RotatingFileHandler
-
+import connections
+import logging_mc
 import settings
 from pypln.api import Document
 
 ###########################
 #  Setting up Logging
 ###########################
-logger = logging.getLogger("load_into_pypln")
-logger.setLevel(logging.DEBUG)
-# create console handler and set level to debug
-fh = RotatingFileHandler('/tmp/search_pypln.log', maxBytes=5e6, backupCount=3)
-# create formatter
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-fh.setFormatter(formatter)
-# logger.addHandler(ch)  # uncomment for console output of messages
-logger.addHandler(fh)
+logger = logging_mc.get_logger("search_pypln", '/tmp/search_pypln.log', console=False)
 
 
 ## Media Cloud database setup
-client = pymongo.MongoClient(host=settings.MONGOHOST)
-articles = client.MCDB.articles # articles collection
-pypln_temp = client.MCDB.pypln_temp # pypln_temp temporary collection
-articles_analysis = client.MCDB.articles_analysis # articles_analysis collection
+articles = connections.MCDB.articles # articles collection
+pypln_temp = connections.MCDB.pypln_temp # pypln_temp temporary collection
+articles_analysis = connections.MCDB.articles_analysis # articles_analysis collection
 
 
 def main():
@@ -11,6 +11,7 @@ __docformat__ = 'restructuredtext en'
 # Storage and Indexing configuration
 ##########
 MONGOHOST = "localhost"
+MONGO_POOL_SIZE = 100  # Connections of the MongoClient shared by the threads of a process (see capture/connections.py)
 
 ##########
 # NLP Configuration
@@ -29,3 +30,71 @@ ELASTIC_ARTICLE_FIELDS = ['summary', 'title', 'cleaned_text', 'link', 'links', '
 # Celery configuration
 ##########
 CELERY_RESULT_BACKEND = 'mongodb://172.16.4.51:27017/'
+
+##########
+# Text extraction configuration
+##########
+EXTRACTION_ENGINE = "goose"  # "goose" or "density" (faster, see capture/boilerplate.py)
+EXTRACTION_WATCHDOG = True  # Run the engine in worker processes killed when a page takes too long; the
+                            # pages are then parsed in the workers, not in the fetch threads
+EXTRACTION_PROCESSES = 4
+EXTRACTION_WALL_TIME = 30  # Seconds a page may take
+EXTRACTION_CPU_TIME = 20  # CPU seconds a page may use
+REEXTRACTION_TIME = 300  # Seconds add_cleaned_text.py may spend on a page flagged reextract
+
+##########
+# Google search configuration
+##########
+GOOGLE_CACHE = "/tmp/mediacloud_google_cache"  # shelve file with the result pages already fetched
+GOOGLE_INTERVAL = 1.0  # Minimum number of seconds between two requests to google
+GOOGLE_THREADS = 4
+
+##########
+# Outlet crawlers configuration
+##########
+CRAWLER_THREADS = 20  # Fetching threads shared by all the outlets
+CRAWLER_HOST_INTERVAL = 0.2  # Minimum number of seconds between two requests to the same host
+BACKFILL_THREADS = 20  # Archive partitions crawled at the same time
+BACKFILL_HOST_INTERVAL = 0.25  # Spacing of the requests to each host during a backfill
+
+##########
+# WARC capture configuration
+##########
+WARC_DIRECTORY = None  # Directory where the fetched pages are archived (see capture/warc.py), None to disable
+WARC_MAX_SIZE = 1024 ** 3  # Bytes of a WARC file before starting the next one
+
+##########
+# Outbox configuration
+##########
+OUTBOX_RETENTION = 7  # Days the events of the articles stored are kept (see capture/outbox.py)
+OUTBOX_SETTLE = 5  # Seconds before the consumers read an event, so that the events of a second are all inserted
+
+##########
+# Logging configuration
+##########
+LOG_LEVEL = "INFO"  # Level of the loggers of capture/logging_mc.py, DEBUG to follow each article
+LOG_QUEUE_SIZE = 10000  # Records waiting for the writer thread before new ones are dropped
+LOG_RATE_LIMIT = 10  # Records of the same message written per period, 0 to disable the limit
+LOG_RATE_PERIOD = 60  # Seconds of the period of the rate limit
+
+##########
+# Metrics configuration
+##########
+METRICS_PORT = None  # Local port serving the metrics of a capture process (see capture/metrics.py), None to disable
+METRICS_FLUSH_INTERVAL = 60  # Seconds between the snapshots saved in the metrics collection, 0 to disable
+TRACE_SAMPLE_RATE = 0.01  # Fraction of the articles whose ingest is traced (see capture/tracing.py)
+TRACE_RETENTION = 7  # Days the spans of the traces are kept
+
+##########
+# Profiling configuration
+##########
+PROFILE_DIRECTORY = "/tmp/mediacloud_profiles"  # Collapsed stacks written by the sampling profiler (see capture/profiling.py)
+PROFILE_INTERVAL = 0.05  # Seconds between two samples of the stacks
+PROFILE_DUMP_INTERVAL = 60  # Seconds between two dumps of the collapsed stacks
+
+##########
+# Memory diagnostics configuration
+##########
+MEMORY_DIRECTORY = "/tmp/mediacloud_memory"  # Memory reports of the processes (see capture/memory.py)
+MEMORY_RSS_INTERVAL = 300  # Seconds between two logs of the resident memory, 0 to disable
+MEMORY_REPORT_GROWTH = 256 * 1024 ** 2  # Growth of the resident memory in bytes that writes a report, 0 to disable
@@ -0,0 +1,278 @@
+#-*- coding:utf-8 -*-
+u"""
+Discovery of pages and feeds through robots.txt and XML sitemaps.
+
+Most news sites list their sitemaps (often Google News sitemaps) in
+robots.txt, so a handful of requests is enough to learn the sections of a
+site and its freshest articles, without crawling it with httrack.
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import datetime
+import threading
+import time
+import urlparse
+import zlib
+from collections import namedtuple
+from robotparser import RobotFileParser
+
+import requests
+from dateutil.parser import parse
+from lxml import etree
+
+import feedfinder
+import logging_mc
+
+
+logger = logging_mc.get_logger('sitemaps')
+
+config = {
+    'robots_ttl': 6 * 3600,  # Seconds a cached robots.txt is considered valid
+    'timeout': 30,
+    'max_sitemaps': 20,  # Sitemaps fetched per host (indexes included)
+    'max_sections': 10,  # Section pages handed to feedfinder per host
+    'fresh_days': 2,  # Age of the pages considered fresh
+    'chunk_size': 16 * 1024,
+}
+
+USER_AGENT = "Mozilla/5.0 (compatible; mediacloud_backend)"
+
+SitemapEntry = namedtuple('SitemapEntry', ['kind', 'loc', 'lastmod'])
+
+
+class RobotsCache(object):
+    """
+    Per host cache of parsed robots.txt files.
+    """
+    def __init__(self, ttl=None):
+        self.ttl = config['robots_ttl'] if ttl is None else ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        """
+        Return the `(parser, sitemaps)` pair for the host of `url`, fetching
+        robots.txt only if it is not cached or has expired.
+        """
+        root = site_root(url)
+        with self._lock:
+            entry = self._entries.get(root)
+        if entry is not None and time.time() - entry[0] < self.ttl:
+            return entry[1], entry[2]
+        parser, sitemaps = fetch_robots(root)
+        with self._lock:
+            self._entries[root] = (time.time(), parser, sitemaps)
+        return parser, sitemaps
+
+    def can_fetch(self, url):
+        parser, _ = self.get(url)
+        return parser.can_fetch(USER_AGENT, url)
+
+    def sitemaps(self, url):
+        return self.get(url)[1]
+
+
+ROBOTS = RobotsCache()
+
+
+def site_root(url):
+    """
+    Return scheme://host/ for an url (with or without scheme).
+    """
+    parsed = urlparse.urlparse(feedfinder.makeFullURI(url))
+    return '{0}://{1}/'.format(parsed.scheme, parsed.netloc.lower())
+
+
+def fetch_robots(root):
+    """
+    Fetch and parse the robots.txt of a site.
+    :param root: site root as returned by `site_root`
+    :return: RobotFileParser instance and the list of sitemap urls declared
+    """
+    robots_url = urlparse.urljoin(root, '/robots.txt')
+    parser = RobotFileParser(robots_url)
+    lines = []
+    try:
+        r = requests.get(robots_url, timeout=config['timeout'], headers={'User-Agent': USER_AGENT})
+        if r.status_code in (401, 403):
+            parser.disallow_all = True
+        elif r.ok:
+            lines = r.text.splitlines()
+    except requests.RequestException as e:
+        logger.error("Failed to fetch %s: %s", robots_url, e)
+    parser.parse(lines)
+    return parser, parse_robots_sitemaps(lines, root)
+
+
+def parse_robots_sitemaps(lines, root):
+    """
+    Extract the `Sitemap:` declarations from the lines of a robots.txt
+    """
+    sitemaps = []
+    for line in lines:
+        line = line.split('#', 1)[0].strip()
+        if not line.lower().startswith('sitemap:'):
+            continue
+        loc = urlparse.urljoin(root, line.split(':', 1)[1].strip())
+        if loc not in sitemaps:
+            sitemaps.append(loc)
+    return sitemaps
+
+
+class _GunzipStream(object):
+    """
+    File-like wrapper decompressing a gzipped stream on the fly, as
+    gzip.GzipFile needs to seek in the underlying file.
+    """
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def read(self, size=-1):
+        while True:
+            chunk = self.fileobj.read(config['chunk_size'])
+            if not chunk:
+                return self._decompressor.flush()
+            data = self._decompressor.decompress(chunk)
+            if data:
+                return data
+
+
+def _open_stream(url):
+    r = requests.get(url, timeout=config['timeout'], stream=True, headers={'User-Agent': USER_AGENT})
+    if not r.ok:
+        r.close()
+        logger.warning("Sitemap %s returned HTTP %s", url, r.status_code)
+        return None, None
+    r.raw.decode_content = True
+    stream = r.raw
+    if url.lower().endswith('.gz') and 'gzip' not in r.headers.get('content-encoding', ''):
+        stream = _GunzipStream(stream)
+    return r, stream
+
+
+def _parse_lastmod(value):
+    if not value:
+        return None
+    try:
+        date = parse(value.strip())
+    except (ValueError, TypeError, OverflowError):
+        return None
+    if date.tzinfo is not None:
+        date = (date - date.utcoffset()).replace(tzinfo=None)
+    return date
+
+
+def iter_sitemap(stream):
+    """
+    Incrementally parse a sitemap or sitemap index, yielding a
+    `SitemapEntry` per `<url>` or `<sitemap>` element. Elements are
+    discarded as soon as they are parsed so memory use does not depend on
+    the size of the sitemap.
+    :param stream: file-like object with the XML document
+    """
+    context = etree.iterparse(stream, events=('end',), huge_tree=True)
+    for _, elem in context:
+        kind = etree.QName(elem).localname if isinstance(elem.tag, basestring) else None
+        if kind not in ('url', 'sitemap'):
+            continue
+        loc, lastmod = None, None
+        for child in elem.iter():
+            if not isinstance(child.tag, basestring):
+                continue
+            name = etree.QName(child).localname
+            if name == 'loc' and child.text:
+                loc = child.text.strip()
+            elif name in ('lastmod', 'publication_date') and child.text and lastmod is None:
+                lastmod = _parse_lastmod(child.text)
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+        if loc:
+            yield SitemapEntry(kind, loc, lastmod)
+    del context
+
+
+def iter_site_urls(url, max_sitemaps=None):
+    """
+    Walk the sitemaps declared in the robots.txt of the site of `url`
+    (or /sitemap.xml if there are none), yielding the page entries found.
+    Sitemap indexes are followed newest first, and news sitemaps before the
+    others, up to `max_sitemaps` fetches.
+    """
+    max_sitemaps = config['max_sitemaps'] if max_sitemaps is None else max_sitemaps
+    pending = list(ROBOTS.sitemaps(url)) or [urlparse.urljoin(site_root(url), '/sitemap.xml')]
+    pending.sort(key=lambda u: 'news' not in u.lower())
+    pending = [(u, None) for u in pending]
+    visited = set()
+    while pending and len(visited) < max_sitemaps:
+        sitemap_url, _ = pending.pop(0)
+        if sitemap_url in visited:
+            continue
+        visited.add(sitemap_url)
+        children = []
+        try:
+            response, stream = _open_stream(sitemap_url)
+            if stream is None:
+                continue
+            try:
+                for entry in iter_sitemap(stream):
+                    if entry.kind == 'sitemap':
+                        children.append((entry.loc, entry.lastmod))
+                    else:
+                        yield entry
+            finally:
+                response.close()
+        except (requests.RequestException, etree.XMLSyntaxError, zlib.error) as e:
+            logger.error("Failed to read sitemap %s: %s", sitemap_url, e)
+        children.sort(key=lambda c: ('news' in c[0].lower(), c[1] or datetime.datetime.min), reverse=True)
+        pending.extend(children)
+
+
+def section_url(url):
+    """
+    Return the url of the section of a page, i.e. the first level of its path.
+    """
+    parsed = urlparse.urlparse(url)
+    path = [p for p in parsed.path.split('/') if p]
+    if len(path) < 2:
+        return None
+    return '{0}://{1}/{2}/'.format(parsed.scheme, parsed.netloc, path[0])
+
+
+def discover(url, max_sections=None, fresh_days=None):
+    """
+    Discover the feeds and the fresh article urls of the site of `url`
+    using only its robots.txt and sitemaps.
+    :param url: any url of the site
+    :param max_sections: maximum number of section pages scanned for feeds
+    :param fresh_days: maximum age, in days, of the article urls returned
+    :return: (list of feed urls, list of fresh article urls)
+    """
+    max_sections = config['max_sections'] if max_sections is None else max_sections
+    fresh_days = config['fresh_days'] if fresh_days is None else fresh_days
+    oldest = datetime.datetime.utcnow() - datetime.timedelta(days=fresh_days)
+    root = site_root(url)
+    candidate_feeds = set()
+    sections = []
+    fresh = []
+    for entry in iter_site_urls(url):
+        if feedfinder.isFeedLink(entry.loc):
+            candidate_feeds.add(entry.loc)
+            continue
+        if entry.lastmod is not None and entry.lastmod >= oldest:
+            fresh.append(entry.loc)
+        section = section_url(entry.loc)
+        if section is not None and section not in sections:
+            sections.append(section)
+
+    feeds = set(f for f in candidate_feeds if feedfinder.isFeed(f))
+    for page in [root] + sections[:max_sections]:
+        if not ROBOTS.can_fetch(page):
+            continue
+        feeds.update(feedfinder.feeds(page))
+    logger.info("%s: %s feeds and %s fresh pages found through sitemaps", root, len(feeds), len(fresh))
+    return sorted(feeds), fresh
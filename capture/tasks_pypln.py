@@ -1,14 +1,15 @@
 from celery import Celery
 import pypln.api
-import pymongo
+import connections
 import settings
+import metrics
+import tracing
 from requests import ConnectionError
 
 ## Media Cloud database setup
-client = pymongo.MongoClient(host=settings.MONGOHOST)
-articles = client.MCDB.articles # articles collection
-pypln_temp = client.MCDB.pypln_temp # pypln_temp temporary collection
-articles_analysis = client.MCDB.articles_analysis # articles_analysis collection
+articles = connections.MCDB.articles # articles collection
+pypln_temp = connections.MCDB.pypln_temp # pypln_temp temporary collection
+articles_analysis = connections.MCDB.articles_analysis # articles_analysis collection
 
 
 app = Celery('tasks', backend=settings.CELERY_RESULT_BACKEND)
@@ -17,15 +18,16 @@ app = Celery('tasks', backend=settings.CELERY_RESULT_BACKEND)
 def fetch_property(self, _id):
     article = pypln_temp.find_one({"_id": _id})
 
-    pypln_document = pypln.api.Document.from_url(article["pypln_url"],
-                                                 settings.PYPLN_CREDENTIALS)
+    with metrics.stage('pypln_properties', article.get('trace_id')):
+        pypln_document = pypln.api.Document.from_url(article["pypln_url"],
+                                                     settings.PYPLN_CREDENTIALS)
 
-    properties = {}
-    for property_name in pypln_document.properties:
-        try:
-            properties[property_name] = pypln_document.get_property(property_name)
-        except (RuntimeError, ConnectionError) as exc:
-            raise self.retry(exc=exc)
+        properties = {}
+        for property_name in pypln_document.properties:
+            try:
+                properties[property_name] = pypln_document.get_property(property_name)
+            except (RuntimeError, ConnectionError) as exc:
+                raise self.retry(exc=exc)
 
     # Check the properties dict to know if PyPLn has finished the analysis.
 
@@ -42,3 +44,5 @@ def fetch_property(self, _id):
 
     pypln_temp.update({"articles_id": article["articles_id"]},
                       {"$set": {'status': doc_status}})
+    # The workers of celery may not exit cleanly
+    tracing.flush()
@@ -0,0 +1,228 @@
+#-*- coding:utf-8 -*-
+u"""
+Sampled traces of the ingest of the articles.
+
+Each article gets a trace id (its ``trace_id`` field) when it is discovered
+in a feed or an outlet page, and every stage it goes through records a span:
+fetch of the feed and of the page, extraction, language detection, MongoDB
+write, Elasticsearch indexing, upload to PyPLN and fetch of the PyPLN
+analysis. The spans are timed by `metrics.stage`::
+
+    with metrics.stage('extraction', article['trace_id']):
+        ...
+
+Only the traces whose id falls in `settings.TRACE_SAMPLE_RATE` are kept, the
+decision depending only on the id, so every process agrees on it. Their
+spans are buffered and saved in batches in the `traces` collection, where
+they expire after `settings.TRACE_RETENTION` days (once the indexes are
+created, see `connections`).
+
+The slowest traces and the time of each stage are printed with::
+
+    python capture/tracing.py slowest --hours 24
+    python capture/tracing.py stages
+    python capture/tracing.py show <trace id>
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import argparse
+import collections
+import datetime
+import os
+import socket
+import threading
+import time
+import uuid
+from multiprocessing import util
+
+import pymongo
+
+import connections
+import logging_mc
+import settings
+
+
+logger = logging_mc.get_logger('tracing')
+
+MCDB = connections.MCDB
+TRACES = MCDB.traces  # Sampled spans of the ingest of the articles
+
+
+config = {
+    'sample_rate': settings.TRACE_SAMPLE_RATE,
+    'batch_size': 100,  # Spans buffered before saving them
+    'flush_interval': 10,  # Maximum seconds a span stays in the buffer
+}
+
+
+def new_trace():
+    """
+    Return a new trace id.
+    """
+    return uuid.uuid4().hex
+
+
+def sampled(trace):
+    """
+    Whether the spans of the trace are kept.
+    """
+    return trace is not None and int(trace[:8], 16) < config['sample_rate'] * 0x100000000
+
+
+class SpanBuffer(object):
+    """
+    Spans of the process waiting to be saved.
+    """
+    def __init__(self):
+        self.spans = []
+        self.oldest = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _take(self, force):
+        with self._lock:
+            if self._pid != os.getpid():  # inherited from the parent process
+                self.spans, self._pid = [], os.getpid()
+            if not self.spans or not (force or len(self.spans) >= config['batch_size'] or
+                                      time.time() - self.oldest >= config['flush_interval']):
+                return []
+            spans, self.spans = self.spans, []
+            return spans
+
+    def add(self, span):
+        with self._lock:
+            if not self.spans:
+                self.oldest = time.time()
+            self.spans.append(span)
+        self.flush(force=False)
+
+    def flush(self, force=True):
+        spans = self._take(force)
+        if not spans:
+            return
+        try:
+            TRACES.insert(spans, w=0)
+        except pymongo.errors.PyMongoError as e:
+            logger.error("Could not save %s spans: %s", len(spans), e)
+
+
+_buffer = SpanBuffer()
+# Runs at exit, also in the workers of multiprocessing pools
+util.Finalize(None, lambda: _buffer.flush(), exitpriority=10)
+
+_process = '{0}:{1}'.format(socket.gethostname(), os.getpid())
+
+
+def record(trace, stage, start, seconds, error=False):
+    """
+    Record a span of a sampled trace, ignoring the others.
+    :param start: time.time() at the start of the stage
+    """
+    if not sampled(trace):
+        return
+    _buffer.add({'trace': trace, 'stage': stage, 'start': datetime.datetime.fromtimestamp(start),
+                 'seconds': seconds, 'error': error, 'process': _process})
+
+
+def flush():
+    """
+    Save the buffered spans now.
+    """
+    _buffer.flush()
+
+
+def load_traces(since):
+    """
+    :return: dict trace id -> spans sorted by start
+    """
+    traces = collections.defaultdict(list)
+    for span in TRACES.find({'start': {'$gte': since}}, fields=['trace', 'stage', 'start', 'seconds', 'error']):
+        traces[span['trace']].append(span)
+    for spans in traces.itervalues():
+        spans.sort(key=lambda s: s['start'])
+    return traces
+
+
+def duration(spans):
+    """
+    Seconds from the start of the first span to the end of the last one.
+    """
+    end = max(s['start'] + datetime.timedelta(seconds=s['seconds']) for s in spans)
+    return (end - spans[0]['start']).total_seconds()
+
+
+def breakdown(spans):
+    """
+    :return: list of (stage, seconds), in order of the first span of each stage
+    """
+    totals = collections.OrderedDict()
+    for span in spans:
+        totals[span['stage']] = totals.get(span['stage'], 0) + span['seconds']
+    return totals.items()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100. * len(values)))]
+
+
+def print_slowest(traces, count):
+    slowest = sorted(traces.iteritems(), key=lambda t: duration(t[1]), reverse=True)[:count]
+    for trace, spans in slowest:
+        stages = '  '.join('{0} {1:.2f}s'.format(stage, seconds) for stage, seconds in breakdown(spans))
+        print '{0}  {1:9.2f}s  {2}'.format(trace, duration(spans), stages)
+
+
+def print_stages(traces):
+    by_stage = collections.defaultdict(list)
+    errors = collections.Counter()
+    for spans in traces.itervalues():
+        for span in spans:
+            by_stage[span['stage']].append(span['seconds'])
+            errors[span['stage']] += bool(span.get('error'))
+    print '{0:20} {1:>8} {2:>7} {3:>9} {4:>9} {5:>9} {6:>9}'.format('stage', 'spans', 'errors', 'mean', 'p50',
+                                                                  'p95', 'max')
+    for stage, values in sorted(by_stage.iteritems(), key=lambda s: -sum(s[1])):
+        print '{0:20} {1:8} {2:7} {3:9.3f} {4:9.3f} {5:9.3f} {6:9.3f}'.format(
+            stage, len(values), errors[stage], sum(values) / len(values), percentile(values, 50),
+            percentile(values, 95), max(values))
+
+
+def print_trace(trace):
+    spans = sorted(TRACES.find({'trace': trace}), key=lambda s: s['start'])
+    if not spans:
+        print "No spans for trace {0}".format(trace)
+        return
+    t0 = spans[0]['start']
+    for span in spans:
+        print '{0:>10.3f}s  {1:20} {2:9.3f}s  {3}{4}'.format(
+            (span['start'] - t0).total_seconds(), span['stage'], span['seconds'], span.get('process', ''),
+            '  ERROR' if span.get('error') else '')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print the sampled traces of the ingest of the articles')
+    subparsers = parser.add_subparsers(dest='command')
+    for name, help in (('slowest', 'the slowest traces with the time of each stage'),
+                       ('stages', 'the time of each stage over all the traces')):
+        sub = subparsers.add_parser(name, help=help)
+        sub.add_argument('--hours', type=float, default=24, help='traces started in the last HOURS hours')
+        if name == 'slowest':
+            sub.add_argument('-n', '--count', type=int, default=20, help='number of traces')
+    show = subparsers.add_parser('show', help='the spans of a trace')
+    show.add_argument('trace', help='trace id, the trace_id field of the article')
+    args = parser.parse_args()
+
+    if args.command == 'show':
+        print_trace(args.trace)
+    else:
+        traces = load_traces(datetime.datetime.now() - datetime.timedelta(hours=args.hours))
+        if not traces:
+            print "No traces in the last {0} hours".format(args.hours)
+        elif args.command == 'slowest':
+            print_slowest(traces, args.count)
+        else:
+            print_stages(traces)
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 import logging
+import os
+import sys
 
 from pymongo import MongoClient
 from pymongo.errors import OperationFailure
@@ -8,9 +10,12 @@ from geopy import geocoders
 from geopy.geocoders.googlev3 import GQueryError, GTooManyQueriesError
 from dateutil import parser
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from capture import logging_mc, memory
+
 
 FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
-logging.basicConfig(filename='tweet_geoloc.log', format=FORMAT, level=logging.DEBUG)
+logging_mc.setup('tweet_geoloc.log', FORMAT)
 
 # Initialize connection
 client = MongoClient()
@@ -20,10 +25,6 @@ geoj = mcdb.geotweet
 gg = geocoders.GoogleV3()
 gn = geocoders.GeoNames()
 
-data = { "type": "FeatureCollection",
-  "features": []
-   }
-
 def geoloc_tweet(_id):
     """
     Attempts to geolocate a tweet specified by `_id`
@@ -59,15 +60,15 @@ def fetch_loc(location):
     except GQueryError:
         try:
             lat, lon = gn.geocode(location, exactly_one=False)[0][-1]
-            logging.info("fetched %s from Geonames instead" % ((lat, lon)))
+            logging.info("fetched %s from Geonames instead", (lat, lon))
         except TypeError:
-            logging.info("%s not found by Google" % location)
+            logging.info("%s not found by Google", location)
     except GTooManyQueriesError:
         try:
             lat, lon = gn.geocode(location, exactly_one=False)[0][-1]
-            logging.info("fetched %s from Geonames instead" % ((lat, lon)))
+            logging.info("fetched %s from Geonames instead", (lat, lon))
         except TypeError:
-            logging.info("%s not found by Geonames" % location)
+            logging.info("%s not found by Geonames", location)
     return lat, lon
 
 
@@ -95,7 +96,6 @@ def save_tweet_as_geojson(_id, coords, db_source=coll, db_location=geoj):
     twgj["properties"] = props
     db_location.insert({"originalID": ObjectId(tweet["_id"]),
                  "geoJSONproperty": twgj, }, w=1)
-    data["features"].append(twgj)
 
 
 def process_tweet(db_source = coll):
@@ -110,9 +110,10 @@ def process_tweet(db_source = coll):
                 save_tweet_as_geojson(_id["_id"], c)
             #print _id, c
     except OperationFailure:
-        logging.error("operationFailure on tweet id: {}".format(_id))
+        logging.error("operationFailure on tweet id: %s", _id)
 
 if __name__ == "__main__":
+    memory.install('geoloc')
     process_tweet()
 
 
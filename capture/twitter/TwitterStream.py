@@ -4,6 +4,8 @@
 import dateutil.parser
 import logging
 import json
+import os
+import sys
 
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
@@ -12,9 +14,12 @@ from tweepy.streaming import StreamListener
 
 import config
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from capture import logging_mc, memory
+
 
 FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
-logging.basicConfig(filename='/tmp/twitterstream.log', format=FORMAT, level=logging.DEBUG)
+logging_mc.setup('/tmp/twitterstream.log', FORMAT)
 
 mongo_host = config.MONGO_HOST if config.MONGO_HOST else 'localhost'
 
@@ -60,10 +65,11 @@ class Filteredcapture(StreamListener):
         return True
 
     def on_error(self, status):
-        logging.error("Invalid response from twitter api: %s" % status)
+        logging.error("Invalid response from twitter api: %s", status)
 
 
 if __name__ == '__main__':
+    memory.install('twitterstream')
     listener = Filteredcapture()
     logging.info('Connecting to twitter API...')
     stream = tweepy.Stream(auth, listener)
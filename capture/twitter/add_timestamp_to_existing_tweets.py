@@ -1,12 +1,17 @@
 #!/usr/bin/env python2
 #-*- coding: utf-8 -*-
 
+import argparse
 import dateutil.parser
 import logging
+import os
 import pymongo
 import sys
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
 import config
+from utilities.migration import Migration
 
 
 # This is not defined in config.py because this log is specific to this tool,
@@ -15,35 +20,36 @@ import config
 LOG_FILE = '/tmp/tweet_timestamp_migration.log'
 LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
 
-logging.basicConfig(filename=LOG_FILE, format=LOG_FORMAT, level=logging.INFO)
-stdout_handler = logging.StreamHandler(sys.stdout)
-stdout_handler.setFormatter(logging.Formatter(LOG_FORMAT))
-logger = logging.getLogger()
-logger.addHandler(stdout_handler)
-
-mongo_client = pymongo.MongoClient(config.MONGO_HOST)
-collection = mongo_client.MCDB.tweets
-
-# timeout=False should make sure the cursor is not closed after 10min
-# http://api.mongodb.org/python/current/api/pymongo/collection.html#pymongo.collection.Collection.find
-cursor = collection.find({'created_at_timestamp': {'$exists': False}},
-        timeout=False)
-
-total = cursor.count()
-if total == 0:
-    logging.info('There are no tweets to update \o/')
-    sys.exit(0)
-
-i = 0
-for tweet in cursor:
-    try:
-        timestamp = dateutil.parser.parse(tweet['created_at']).strftime('%s')
-        collection.update({'_id': tweet['_id']}, {'$set':
-            {'created_at_timestamp': timestamp}})
-    except Exception as e:
-        logger.exception('_id: %s [Exception] %s', tweet['_id'], e)
-    i += 1
-    if (i % 1000) == 0:
-        logging.info('{:010d}/{:010d} tweets updated.'.format(i, total))
-
-cursor.close()
+
+def add_timestamp(tweet):
+    """
+    Migration transform: store the creation date of a tweet as a timestamp.
+    """
+    timestamp = dateutil.parser.parse(tweet['created_at']).strftime('%s')
+    return {'$set': {'created_at_timestamp': timestamp}}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Store the creation date of the tweets as a timestamp')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='number of worker processes (default: one per CPU)')
+    parser.add_argument('--resume', action='store_true', help='continue the previous run where it stopped')
+    args = parser.parse_args()
+
+    logging.basicConfig(filename=LOG_FILE, format=LOG_FORMAT, level=logging.INFO)
+    stdout_handler = logging.StreamHandler(sys.stdout)
+    stdout_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logging.getLogger().addHandler(stdout_handler)
+
+    mongo_client = pymongo.MongoClient(config.MONGO_HOST)
+    collection = mongo_client.MCDB.tweets
+
+    query = {'created_at_timestamp': {'$exists': False}}
+    if collection.find(query).count() == 0:
+        logging.info('There are no tweets to update \o/')
+        sys.exit(0)
+
+    migration = Migration('add_timestamp_to_existing_tweets', collection, query, add_timestamp,
+                          fields=['created_at'], processes=args.processes)
+    total, updated, errors = migration.run(args.resume)
+    logging.info('{:d} tweets updated, {:d} errors.'.format(updated, errors))
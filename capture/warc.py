@@ -0,0 +1,370 @@
+#-*- coding:utf-8 -*-
+u"""
+Capture of the fetched pages in WARC files and offline replay.
+
+When `settings.WARC_DIRECTORY` is set, every HTTP response received by the
+downloader and the crawlers (redirects included) is appended as a
+``response`` record to a gzipped WARC file in that directory. Each record
+is a separate gzip member, as the usual WARC tools expect, and a file is
+closed and a new one started past `settings.WARC_MAX_SIZE` bytes; files
+being written end with ``.open``.
+
+The same pages can then be fed again to the whole pipeline without network,
+e.g. to apply a better extraction or to reproduce a bug::
+
+    python capture/downloader.py --replay /data/warc
+    python capture/crawler.py --replay /data/warc/*.warc.gz
+
+In replay mode `get` answers from an index of the records of the given
+files (the latest capture of each url wins) and raises
+`requests.ConnectionError` for the urls that were not captured, as a failed
+request would.
+
+The articles already stored are skipped as usual, so a replay only stores
+the articles missing from the database (e.g. on a scratch MongoDB server, see
+`MONGOHOST`). With ``--update`` the stored articles are fetched and
+extracted again instead, and their extracted fields (text, language, ...)
+are updated in place::
+
+    python capture/downloader.py --replay /data/warc --update
+
+The updated articles are not published to the outbox: rebuild the indexes
+(`indexing/index_elastic.py`, `indexing/index_on_sphinx.sh`) afterwards.
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import atexit
+import collections
+import datetime
+import glob
+import os
+import socket
+import threading
+import urlparse
+import uuid
+import zlib
+
+import requests
+from requests.models import PreparedRequest
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+import logging_mc
+import settings
+
+
+logger = logging_mc.get_logger('warc')
+
+config = {
+    'directory': settings.WARC_DIRECTORY,
+    'max_size': settings.WARC_MAX_SIZE,  # Bytes of a file before starting the next one
+    'prefix': 'mediacloud',
+    'max_redirects': 30,  # As requests.Session
+}
+
+# The body is stored as requests gives it, already decoded
+DROPPED_HEADERS = ('content-encoding', 'transfer-encoding', 'content-length')
+READ_SIZE = 1 << 16
+
+Record = collections.namedtuple('Record', 'type url date headers block')
+
+
+def normalize_url(url):
+    """
+    Return `url` as requests sends it, the key of the captured responses.
+    """
+    request = PreparedRequest()
+    request.prepare_url(url, None)
+    return request.url
+
+
+def _header_value(value):
+    return value.encode('utf8') if isinstance(value, unicode) else str(value)
+
+
+def http_block(response):
+    """
+    Serialize a requests response as the block of a WARC response record.
+    """
+    lines = ['HTTP/1.1 {0} {1}'.format(response.status_code, _header_value(response.reason or ''))]
+    for name, value in response.headers.iteritems():
+        if name.lower() not in DROPPED_HEADERS:
+            lines.append('{0}: {1}'.format(name, _header_value(value)))
+    body = response.content or ''
+    lines.append('Content-Length: {0}'.format(len(body)))
+    return '\r\n'.join(lines) + '\r\n\r\n' + body
+
+
+def record_bytes(record_type, url, block, content_type, date=None):
+    """
+    Serialize a WARC record, gzipped as its own member.
+    """
+    date = date or datetime.datetime.utcnow()
+    headers = ['WARC/1.0',
+               'WARC-Type: {0}'.format(record_type),
+               'WARC-Record-ID: <urn:uuid:{0}>'.format(uuid.uuid4()),
+               'WARC-Date: {0}'.format(date.strftime('%Y-%m-%dT%H:%M:%SZ'))]
+    if url:
+        headers.append('WARC-Target-URI: {0}'.format(_header_value(url)))
+    headers.append('Content-Type: {0}'.format(content_type))
+    headers.append('Content-Length: {0}'.format(len(block)))
+    data = '\r\n'.join(headers) + '\r\n\r\n' + block + '\r\n\r\n'
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class WarcWriter(object):
+    """
+    Rolling writer of gzipped WARC files, shared by the threads of a process.
+    """
+    def __init__(self, directory, max_size=None, prefix=None):
+        self.directory = directory
+        self.max_size = config['max_size'] if max_size is None else max_size
+        self.prefix = config['prefix'] if prefix is None else prefix
+        self._file = None
+        self._path = None
+        self._size = 0
+        self._serial = 0
+        self._lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _open(self):
+        self._serial += 1
+        name = '{0}-{1}-{2}-{3:05d}.warc.gz'.format(self.prefix, datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S'),
+                                                   os.getpid(), self._serial)
+        self._path = os.path.join(self.directory, name)
+        self._file = open(self._path + '.open', 'wb')
+        info = 'software: mediacloud_backend\r\nhostname: {0}\r\nformat: WARC File Format 1.0\r\n'.format(
+            socket.gethostname())
+        data = record_bytes('warcinfo', None, info, 'application/warc-fields')
+        self._file.write(data)
+        self._size = len(data)
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            os.rename(self._path + '.open', self._path)
+            self._file = None
+
+    def write(self, record_type, url, block, content_type):
+        data = record_bytes(record_type, url, block, content_type)
+        with self._lock:
+            if self._file is None:
+                self._open()
+            self._file.write(data)
+            self._size += len(data)
+            if self._size >= self.max_size:
+                self._close()
+
+    def write_response(self, response):
+        """
+        Append a response, and the redirects that led to it.
+        """
+        for r in list(response.history) + [response]:
+            self.write('response', r.url, http_block(r), 'application/http; msgtype=response')
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+def iter_members(f):
+    """
+    Iterate over the gzip members of a file.
+    :return: iterator of (offset of the member in the file, decompressed member)
+    """
+    offset = 0
+    data = f.read(READ_SIZE)
+    while data:
+        start = offset
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        parts = []
+        while True:
+            parts.append(decompressor.decompress(data))
+            if decompressor.unused_data:
+                offset += len(data) - len(decompressor.unused_data)
+                data = decompressor.unused_data
+                break
+            offset += len(data)
+            data = f.read(READ_SIZE)
+            if not data:
+                parts.append(decompressor.flush())
+                break
+        yield start, ''.join(parts)
+
+
+def parse_record(data):
+    """
+    Parse a decompressed WARC record.
+    :return: `Record`, or None if it is truncated
+    """
+    head, sep, rest = data.partition('\r\n\r\n')
+    lines = head.split('\r\n')
+    if not sep or not lines[0].startswith('WARC/'):
+        return None
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if len(rest) < length:
+        return None
+    return Record(headers.get('warc-type'), headers.get('warc-target-uri'), headers.get('warc-date'), headers,
+                  rest[:length])
+
+
+def iter_records(path):
+    """
+    Iterate over the records of a gzipped WARC file.
+    :return: iterator of (offset of the record in the file, `Record`)
+    """
+    with open(path, 'rb') as f:
+        for offset, data in iter_members(f):
+            record = parse_record(data)
+            if record is None:
+                logger.warning("Truncated record at %s of %s", offset, path)
+                continue
+            yield offset, record
+
+
+def parse_http(block):
+    """
+    Parse the block of a response record.
+    :return: (status code, reason, headers, body)
+    """
+    head, _, body = block.partition('\r\n\r\n')
+    lines = head.split('\r\n')
+    status = lines[0].split(' ', 2)
+    headers = CaseInsensitiveDict()
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        headers[name.strip()] = value.strip()
+    return int(status[1]), status[2] if len(status) > 2 else '', headers, body
+
+
+class ReplayArchive(object):
+    """
+    Responses captured in WARC files, looked up by url.
+    """
+    def __init__(self, paths):
+        """
+        :param paths: WARC files, or directories containing them
+        """
+        self.files = []
+        for path in paths:
+            if os.path.isdir(path):
+                self.files.extend(sorted(glob.glob(os.path.join(path, '*.warc.gz'))))
+            else:
+                self.files.append(path)
+        self._index = {}
+        for path in self.files:
+            for offset, record in iter_records(path):
+                if record.type == 'response' and record.url:
+                    self._index[normalize_url(record.url)] = (path, offset)
+        logger.info("Replaying %s responses from %s files", len(self._index), len(self.files))
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, url):
+        return normalize_url(url) in self._index
+
+    def _load(self, url):
+        position = self._index.get(url)
+        if position is None:
+            return None
+        path, offset = position
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            _, data = next(iter_members(f))
+        status, reason, headers, body = parse_http(parse_record(data).block)
+        response = requests.models.Response()
+        response.status_code = status
+        response.reason = reason
+        response.headers = headers
+        response._content = body
+        response.encoding = get_encoding_from_headers(headers)
+        response.url = url
+        return response
+
+    def get(self, url, allow_redirects=True):
+        """
+        :return: requests.Response, or None if the url was not captured
+        """
+        url = normalize_url(url)
+        history = []
+        response = self._load(url)
+        while allow_redirects and response is not None and response.is_redirect:
+            if len(history) >= config['max_redirects']:
+                raise requests.TooManyRedirects(url)
+            history.append(response)
+            url = normalize_url(urlparse.urljoin(response.url, response.headers['location']))
+            response = self._load(url)
+        if response is not None:
+            response.history = history
+        return response
+
+
+_writer = None
+_replay = None
+_update = False
+_lock = threading.Lock()
+
+
+def get_writer():
+    """
+    Return the writer of the process, or None if the capture is disabled.
+    """
+    global _writer
+    if config['directory'] is None:
+        return None
+    with _lock:
+        if _writer is None:
+            _writer = WarcWriter(config['directory'])
+            atexit.register(_writer.close)
+        return _writer
+
+
+def start_replay(paths, update=False):
+    """
+    Answer the requests made through `get` from the WARC files in `paths`.
+    :param update: update the articles already stored instead of skipping them
+    """
+    global _replay, _update
+    _replay = ReplayArchive(paths)
+    _update = update
+    return _replay
+
+
+def replaying():
+    return _replay is not None
+
+
+def updating():
+    """
+    Whether the stored articles are extracted again and updated.
+    """
+    return _replay is not None and _update
+
+
+def get(url, session=None, **kwargs):
+    """
+    GET `url` with requests (or `session`), capturing the response if
+    enabled, or from the archive in replay mode.
+    :raise requests.RequestException: as requests, ConnectionError for the
+                                      urls missing from the archive
+    """
+    if _replay is not None:
+        response = _replay.get(url, kwargs.get('allow_redirects', True))
+        if response is None:
+            raise requests.ConnectionError("{0} is not in the archive".format(url))
+        return response
+    response = (session or requests).get(url, **kwargs)
+    writer = get_writer()
+    if writer is not None:
+        writer.write_response(response)
+    return response
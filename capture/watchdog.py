@@ -0,0 +1,226 @@
+#-*- coding:utf-8 -*-
+u"""
+Extraction of the text of the pages in worker processes with a time budget.
+
+A pathological page (huge tables, deeply nested markup) can keep an
+extraction engine busy for minutes, blocking the thread that downloaded it.
+The engines are run instead in a pool of worker processes; a worker which
+exceeds the wall time budget of a page is killed and replaced, and each
+worker limits its own CPU time per page with RLIMIT_CPU. The callers get an
+`ExtractionTimeout` and store the article with a fallback text, flagged with
+``reextract`` for `add_cleaned_text.py`.
+
+The workers are forked by a supervisor process, itself started by `start`
+before the threads of the capture, so that no worker is forked while
+another thread of the capture holds a lock. The supervisor sends the pipe
+of each new worker back over its control connection.
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import multiprocessing
+import os
+import Queue
+import resource
+import signal
+import threading
+from multiprocessing import reduction, util
+
+from _multiprocessing import Connection
+
+import extraction
+import logging_mc
+import settings
+
+
+logger = logging_mc.get_logger('watchdog')
+
+config = {
+    'processes': settings.EXTRACTION_PROCESSES,
+    'wall_time': settings.EXTRACTION_WALL_TIME,  # Seconds a worker may spend on a page
+    'cpu_time': settings.EXTRACTION_CPU_TIME,  # CPU seconds a page may use
+}
+
+
+class ExtractionError(Exception):
+    pass
+
+
+class ExtractionTimeout(ExtractionError):
+    pass
+
+
+def _work(conn, cpu_time):
+    """
+    Main loop of a worker process: extract the pages received on `conn`
+    with the function received with them, and send back the results.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    while True:
+        try:
+            function, html, url, engine = conn.recv()
+        except (EOFError, IOError):
+            return
+        if cpu_time:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            limit = int(usage.ru_utime + usage.ru_stime + cpu_time) + 1
+            if hard != resource.RLIM_INFINITY:
+                limit = min(limit, hard)
+            # the kernel kills the process with SIGXCPU past the soft limit
+            resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+        try:
+            conn.send((True, function(html, url=url, engine=engine)))
+        except Exception as e:
+            conn.send((False, u'{0}: {1}'.format(type(e).__name__, e)))
+
+
+def _supervise(control, parent_end, processes, cpu_time):
+    """
+    Main loop of the supervisor: fork the workers, and replace the one of
+    each slot number received on `control`, until the pool is closed.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    parent_end.close()  # inherited, it would hide the closing of the pool
+    workers = {}
+
+    def spawn(slot):
+        conn, child = multiprocessing.Pipe()
+        workers[slot] = multiprocessing.Process(target=_work, args=(child, cpu_time))
+        workers[slot].daemon = True
+        workers[slot].start()
+        child.close()
+        reduction.send_handle(control, conn.fileno(), os.getppid())
+        conn.close()
+
+    for slot in xrange(processes):
+        spawn(slot)
+    while True:
+        try:
+            slot = control.recv()
+        except (EOFError, IOError):
+            break
+        if workers[slot].is_alive():
+            workers[slot].terminate()
+        workers[slot].join(1)
+        spawn(slot)
+
+
+class WatchdogPool(object):
+    """
+    Pool of extraction processes shared by the threads of a process.
+    """
+    def __init__(self, processes=None, wall_time=None, cpu_time=None):
+        self.processes = config['processes'] if processes is None else processes
+        self.wall_time = config['wall_time'] if wall_time is None else wall_time
+        self.cpu_time = config['cpu_time'] if cpu_time is None else cpu_time
+        self._control, child = multiprocessing.Pipe()
+        # not a daemon, as it has children; closing `_control` stops it
+        self._supervisor = multiprocessing.Process(target=_supervise, name='watchdog',
+                                                   args=(child, self._control, self.processes, self.cpu_time))
+        self._supervisor.start()
+        child.close()
+        self._control_lock = threading.Lock()
+        self._idle = Queue.Queue()
+        for slot in xrange(self.processes):
+            self._idle.put((slot, self._receive()))
+        util.Finalize(self, self.close, exitpriority=10)
+
+    def _receive(self):
+        return Connection(reduction.recv_handle(self._control))
+
+    def extract_text(self, html, url=None, engine=None, function=None):
+        """
+        Extract a page in one of the workers, waiting for a free one.
+        :param function: module level function run in the worker, with the
+                         signature of `extraction.extract_text` (the default)
+        :return: the result of `function`, an `extraction.Extraction` tuple by default
+        :raise ExtractionTimeout: if the page exceeded the time budget
+        :raise ExtractionError: if the engine failed
+        """
+        job = (function or extraction.extract_text, html, url, engine)
+        slot, conn = self._idle.get()
+        try:
+            ok, result = self._run(conn, job)
+        except BaseException:
+            self._idle.put((slot, self._replace(slot, conn)))
+            raise
+        if ok is None:
+            conn = self._replace(slot, conn)
+        self._idle.put((slot, conn))
+        if ok is None:
+            logger.warning("Extraction of %s exceeded its time budget", url)
+            raise ExtractionTimeout(url)
+        if not ok:
+            raise ExtractionError(result)
+        return result
+
+    def _run(self, conn, job):
+        """
+        :return: (ok, result) as sent by the worker, (None, None) if it exceeded the budget
+        """
+        try:
+            conn.send(job)
+            if not conn.poll(self.wall_time):
+                return None, None
+            return conn.recv()
+        except (EOFError, IOError):
+            # the worker was killed by its CPU limit
+            return None, None
+
+    def _replace(self, slot, conn):
+        """
+        Have the supervisor replace the worker of `slot`.
+        :return: the connection to the new worker
+        """
+        conn.close()
+        with self._control_lock:
+            self._control.send(slot)
+            return self._receive()
+
+    def close(self):
+        """
+        Stop the supervisor, which stops the workers.
+        """
+        with self._control_lock:
+            if not self._control.closed:
+                self._control.close()
+        self._supervisor.join(5)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Return the pool of the process, started on first use.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WatchdogPool()
+        return _pool
+
+
+def start():
+    """
+    Start the pool if the engine runs under the watchdog. Call it before
+    starting any thread (metrics, profiling, memory, thread pools): the
+    supervisor forked while another thread holds a lock could stay blocked
+    on it forever.
+    """
+    if settings.EXTRACTION_WATCHDOG:
+        get_pool()
+
+
+def extract_text(html, tree=None, url=None, engine=None, function=None):
+    """
+    `extraction.extract_text`, or `function`, run in the shared pool of
+    workers. The tree, if given, is not used as it can't be sent to the
+    workers: they parse the page again, so the callers should not parse it
+    only for the engine.
+    """
+    return get_pool().extract_text(html, url, engine, function)
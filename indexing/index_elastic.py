@@ -4,18 +4,22 @@ Index any collection into Elasticsearch.
 this script sould be used to import
 """
 
-import elasticsearch
+import os
+import sys
+
 from pymongo import MongoClient
 import argparse
 from elasticsearch.helpers import bulk, streaming_bulk
 
-es = elasticsearch.Elasticsearch(hosts=['localhost'])
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from capture import connections, profiling
 
 
 
 def index_collection(db, collection, fields, host='localhost', port=27017):
     if len(fields) == 1:
         fields = fields[0].split(',')
+    es = connections.elastic()
     es.indices.create(index=db.lower(), ignore=400)
     conn = MongoClient(host, port)
     coll = conn[db][collection]
@@ -58,4 +62,5 @@ if __name__ == "__main__":
     parser.add_argument('--fields', '-f', required=True, type=str, nargs="+", help="Fields to be indexed")
     args = parser.parse_args()  # print args, args.prune
 
+    profiling.install('index_elastic')
     index_collection(db=args.db, collection=args.col, fields=args.fields, host=args.host, port=args.port)
@@ -1,3 +1,10 @@
 #!/usr/bin/env bash
+# index_on_sphinx.sh        rebuilds all the indexes
+# index_on_sphinx.sh delta  indexes the articles stored since the last rebuild
 
-indexer --rotate --all --config sphinx.conf
+if [ "$1" == "delta" ]; then
+    indexer --rotate mediacloud_articles_delta --config sphinx.conf
+else
+    # the delta starts again from the articles stored after this point
+    python ../capture/outbox.py sphinx-mark && indexer --rotate --all --config sphinx.conf
+fi
@@ -20,6 +20,7 @@ __author__ = 'Flavio Codeço Coelho'
 import argparse
 from xml.etree.ElementTree import Element, tostring, SubElement
 import time
+import os
 import sys
 import zlib
 import cPickle as CP
@@ -27,6 +28,9 @@ import json
 
 from pymongo import MongoClient
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from capture import connections, profiling
+
 
 SW = sys.stdout  #Stream Writer
 header = '<?xml version="1.0" encoding="utf-8"?><sphinx:docset>'
@@ -58,7 +62,8 @@ def serialize(doc, id, fields):
     """
     Receives raw MongoDB document data and returns XML.
     SphinxSearch demands that each document is identified by
-    an unique unsigned integer `id`. We use a counter for this.
+    an unique unsigned integer `id`. We use a counter for this,
+    or an integer field of the documents when several indexes hold them.
     """
     document = Element("sphinx:document", attrib={'id': str(id)})
     try:
@@ -108,15 +113,22 @@ def decompress_content(compressed_html):
     return orig_html
 
 
-def query(db, collection, fields, attrs, host='127.0.0.1', port=27017):
+def query(db, collection, fields, attrs, host='127.0.0.1', port=27017, spec=None, id_field=None):
     """
     Given a mongo db, a collection and a list of fields, writes a stream of XML to stdout
+    :param spec: query of the documents, all of them by default
+    :param id_field: integer field numbering the documents instead of a counter, so
+                     that a delta index can replace them (see capture/outbox.py). The
+                     documents stored without it are numbered now, in the same sequence
+                     as `capture.connections.SPHINX_IDS` for the articles
     """
     locationdic = {'db': db, 'collection': collection}
     conn = MongoClient(host, port)
     coll = conn[db][collection]
     fields_to_fetch = fields + attrs
-    cursor = coll.find({}, fields=fields_to_fetch)
+    cursor = coll.find(spec or {}, fields=fields_to_fetch + [id_field] if id_field else fields_to_fetch)
+    if id_field:
+        sequence = connections.Sequence(conn[db].counters, '{0}.{1}'.format(collection, id_field))
     schema = get_schema_tag(schema_head, fields + locationdic.keys(), attrs)
     SW.write(header)
     SW.write(schema)
@@ -125,7 +137,10 @@ def query(db, collection, fields, attrs, host='127.0.0.1', port=27017):
         id = int('0x' + str(doc['_id']), 16)
         doc.update(locationdic)
         try:
-            ser_doc = serialize(doc, i, fields_to_fetch)
+            if id_field and doc.get(id_field) is None:
+                doc[id_field] = sequence.next()
+                coll.update({'_id': doc['_id']}, {'$set': {id_field: doc[id_field]}})
+            ser_doc = serialize(doc, doc[id_field] if id_field else i, fields_to_fetch)
             SW.write(ser_doc)
 
         except IOError as e:
@@ -145,7 +160,10 @@ if __name__ == "__main__":
     parser.add_argument('--port', '-p', type=int, default=27017, help="port")
     parser.add_argument('--fields', '-f', required=True, type=str, nargs="+", help="Fields to be indexed")
     parser.add_argument('--attrs', '-a', required=True, type=str, nargs="+", help="Extra Attributes")
+    parser.add_argument('--id-field', default=None, help="Integer field numbering the documents")
     args = parser.parse_args()  # print args, args.prune
 
-    query(db=args.db, collection=args.col, fields=args.fields, attrs=args.attrs, host=args.host, port=args.port)
-    #TODO: allow the user to specify an unique integer id field to be used in cases where the index needs to be updated if it is not provided, a counter should be used.
+    # the profiler logs to stderr, the XML goes to stdout
+    profiling.install('mongo2sphinx')
+    query(db=args.db, collection=args.col, fields=args.fields, attrs=args.attrs, host=args.host, port=args.port,
+          id_field=args.id_field)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+u"""
+Command line of the Media Cloud backend.
+
+Each stage of the capture is a subcommand, whose modules are only imported
+when it runs, so ``--help`` and the quick commands start at once::
+
+    python mediacloud.py --help
+    python mediacloud.py ensure-indexes
+    python mediacloud.py --mongo-host db1 --threads 60 download
+    python mediacloud.py crawl --incremental valor
+    python mediacloud.py consume elastic
+
+The options before the first subcommand are shared by all of them: the
+hosts of MongoDB and Elasticsearch, the threads and batch sizes of the
+stages, the metrics port, the profiling and the replay of WARC files.
+Several stages joined by ``+`` run in the same process, one after the
+other or at the same time with ``--parallel``, sharing its connection
+pools (see `capture/connections.py`)::
+
+    python mediacloud.py --parallel download + crawl --incremental
+
+The scripts of `capture/` and `indexing/` still run on their own.
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import argparse
+import collections
+import os
+import sys
+import threading
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SEPARATOR = '+'  # Between the stages run in the same process
+
+COMMANDS = collections.OrderedDict()  # name -> (help, arguments, instrumented, function)
+EXTRACTING = set(['download', 'crawl', 'backfill'])  # Stages extracting the text of the pages
+
+
+def arg(*args, **kwargs):
+    return args, kwargs
+
+
+def command(name, help, arguments=(), instrumented=True):
+    """
+    Register the decorated function as the subcommand `name`, called with
+    the parsed arguments.
+    :param arguments: `arg` of each argument of the subcommand
+    :param instrumented: whether the process exports metrics and can be profiled
+    """
+    def register(function):
+        COMMANDS[name] = (help, arguments, instrumented, function)
+        return function
+    return register
+
+
+def configure(config, args):
+    """
+    Apply the shared options to the `config` of a module.
+    """
+    if args.threads and 'threads' in config:
+        config['threads'] = args.threads
+    if args.batch_size and 'batch_size' in config:
+        config['batch_size'] = args.batch_size
+
+
+REPLAY = arg('--replay', nargs='+', metavar='WARC',
+             help='fetch the pages from these WARC files or directories instead of the network')
+UPDATE = arg('--update', action='store_true',
+             help='with --replay, update the articles already stored instead of skipping them')
+OUTLETS = arg('outlets', nargs='*', help='names of the outlets (default: all)')
+
+
+@command('ensure-indexes', "create the indexes of the MCDB collections", instrumented=False)
+def ensure_indexes(args):
+    from capture import connections
+    connections.ensure_indexes()
+
+
+@command('search-google', "search Google for urls listing RSS feeds", [
+    arg('-s', '--subject', default='', help='subject of the feeds'),
+    arg('-f', '--filter', default='site', help='filter results by language or by domain: .br'),
+])
+def search_google(args):
+    from capture import googlerss
+    googlerss.main(args.subject, args.filter)
+
+
+@command('extract-feeds', "search for feeds on the urls found", [
+    arg('-f', '--file', default='', help='file with one or more urls to check (one per line)'),
+    arg('-d', '--depth', type=int, default=2, help='depth of the search, from the initial url'),
+    arg('-m', '--mode', choices=['crawl', 'sitemap'], default='crawl',
+        help='crawl the pages with httrack or read the robots.txt and sitemaps of the sites'),
+    arg('-p', '--prioritize', type=int, default=0, metavar='N',
+        help='scan the urls of the file or of the collection by the rank of their domains in the link '
+             'graph, then N top ranked domains without feeds'),
+])
+def extract_feeds(args):
+    from capture import extract_feeds
+    extract_feeds.main(args.file, args.depth, args.mode, args.prioritize)
+
+
+@command('download', "download the articles of the feeds")
+def download(args):
+    from capture import downloader
+    configure(downloader.config, args)
+    downloader.parallel_fetch()
+
+
+@command('crawl', "crawl the latest news of the outlets", [
+    OUTLETS,
+    arg('-i', '--incremental', action='store_true',
+        help='use conditional requests and follow the index pages until the stored links'),
+])
+def crawl(args):
+    from capture import crawler
+    configure(crawler.config, args)
+    crawler.main(args.outlets or None, incremental=args.incremental)
+
+
+@command('backfill', "crawl the archives of the outlets", [
+    OUTLETS,
+    arg('-f', '--first', type=int, default=None, help='first archive page'),
+    arg('-l', '--last', type=int, required=True, help='last archive page'),
+    arg('-s', '--size', type=int, default=None, help='pages per partition'),
+])
+def backfill(args):
+    from capture import backfill
+    configure(backfill.config, args)
+    backfill.main(args.outlets or None, args.last, args.first, args.size)
+
+
+@command('load-pypln', "upload the articles to PyPLN", [
+    arg('-l', '--limit', metavar='N', type=int, default=0, help='adds limit=N to the mongo query'),
+    arg('-s', '--skip', metavar='N', type=int, default=0, help='adds skip=N to the mongo query'),
+])
+def load_pypln(args):
+    from capture import load_into_pypln
+    configure(load_into_pypln.config, args)
+    load_into_pypln.load(args.skip, args.limit)
+
+
+@command('pypln-properties', "queue the fetch of the PyPLN analyses of the uploaded articles")
+def pypln_properties(args):
+    from capture import run_tasks_pypln
+    run_tasks_pypln.get_pypln_properties()
+
+
+@command('search-pypln', "store the PyPLN analyses that are ready")
+def search_pypln(args):
+    from capture import search_pypln
+    search_pypln.main()
+
+
+@command('consume', "run a consumer of the outbox of the articles stored", [
+    arg('name', choices=['elastic', 'pypln', 'rollups'], help='consumer'),
+    arg('--once', action='store_true', help='stop when there are no more events'),
+])
+def consume(args):
+    from capture import outbox
+    configure(outbox.config, args)
+    outbox.consume(args.name, args.once)
+
+
+@command('outbox-status', "print the offset of each consumer of the outbox", instrumented=False)
+def outbox_status(args):
+    from capture import outbox
+    outbox.print_status()
+
+
+INDEXED = [
+    arg('--db', '-d', default='MCDB', help='database'),
+    arg('--col', '-c', default='articles', help='collection'),
+    arg('--port', '-p', type=int, default=27017, help='port of MongoDB'),
+    arg('--fields', '-f', required=True, nargs='+', help='fields to be indexed'),
+]
+
+
+@command('index-elastic', "index a collection on Elasticsearch", INDEXED)
+def index_elastic(args):
+    from capture import settings
+    from indexing import index_elastic
+    index_elastic.index_collection(args.db, args.col, args.fields, settings.MONGOHOST, args.port)
+
+
+@command('mongo2sphinx', "write a collection as the XML of a Sphinx xmlpipe2 source", INDEXED + [
+    arg('--attrs', '-a', required=True, nargs='+', help='extra attributes'),
+])
+def mongo2sphinx(args):
+    from capture import settings
+    from indexing import mongo2sphinx
+    mongo2sphinx.query(args.db, args.col, args.fields, args.attrs, settings.MONGOHOST, args.port)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Media Cloud backend. Stages joined by '{0}' run in the same process.".format(SEPARATOR),
+        usage='%(prog)s [options] command [arguments] [{0} command [arguments] ...]'.format(SEPARATOR))
+    parser.add_argument('--mongo-host', help='host of MongoDB (settings.MONGOHOST)')
+    parser.add_argument('--elastic-host', help='host of Elasticsearch (settings.ELASTICHOST)')
+    parser.add_argument('-t', '--threads', type=int, help='threads of the stages that fetch pages')
+    parser.add_argument('-b', '--batch-size', type=int, help='documents read or written at once by the stages')
+    parser.add_argument('--metrics-port', type=int, help='serve the metrics on this local port')
+    parser.add_argument('--profile', action='store_true', help='profile the process from the start')
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help='level of the logs')
+    parser.add_argument('--parallel', action='store_true', help='run the stages at the same time')
+    parser.add_argument(*REPLAY[0], **REPLAY[1])
+    parser.add_argument(*UPDATE[0], **UPDATE[1])
+    subparsers = parser.add_subparsers(dest='command', metavar='command', prog=parser.prog + ' [options]')
+    for name, (help, arguments, instrumented, function) in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help, description=help)
+        for args, kwargs in arguments:
+            subparser.add_argument(*args, **kwargs)
+    return parser, subparsers.choices
+
+
+def split_stages(argv):
+    stages = [[]]
+    for word in argv:
+        if word == SEPARATOR:
+            stages.append([])
+        else:
+            stages[-1].append(word)
+    return stages
+
+
+def parse(argv):
+    """
+    :return: the shared options, and the parsed arguments of each stage
+    """
+    parser, subparsers = build_parser()
+    stages = split_stages(argv)
+    options = parser.parse_args(stages[0])
+    parsed = [options]
+    for words in stages[1:]:
+        if not words or words[0] not in subparsers:
+            parser.error("'{0}' must be followed by a command".format(SEPARATOR))
+        stage = subparsers[words[0]].parse_args(words[1:])
+        stage.command = words[0]
+        parsed.append(stage)
+    for stage in parsed:
+        for name in ('threads', 'batch_size'):
+            setattr(stage, name, getattr(options, name))
+    return options, parsed
+
+
+def setup(options, names, instrumented):
+    """
+    Apply the shared options before the modules of the stages are imported.
+    """
+    from capture import settings
+    if options.mongo_host:
+        settings.MONGOHOST = options.mongo_host
+    if options.elastic_host:
+        settings.ELASTICHOST = options.elastic_host
+    if options.log_level:
+        settings.LOG_LEVEL = options.log_level
+    if options.metrics_port is not None:
+        settings.METRICS_PORT = options.metrics_port
+    if options.replay:
+        from capture import warc
+        warc.start_replay(options.replay, options.update)
+    if EXTRACTING.intersection(names):
+        from capture import watchdog
+        watchdog.start()  # before the threads of the metrics, profiling and memory
+    if instrumented:
+        from capture import memory, metrics, profiling
+        if options.profile:
+            os.environ['MEDIACLOUD_PROFILE'] = '1'
+        name = '-'.join(names)
+        metrics.start(name)
+        profiling.install(name)
+        memory.install(name)
+
+
+def run_stage(stage, errors):
+    from capture import logging_mc
+    try:
+        COMMANDS[stage.command][3](stage)
+    except Exception as e:
+        logging_mc.get_logger('mediacloud').exception("Stage %s failed: %s", stage.command, e)
+        errors.append(stage.command)
+
+
+def main(argv=None):
+    options, stages = parse(sys.argv[1:] if argv is None else argv)
+    sys.path.insert(0, ROOT)
+    names = [stage.command for stage in stages]
+    setup(options, names, any(COMMANDS[name][2] for name in names))
+    errors = []
+    if options.parallel and len(stages) > 1:
+        threads = [threading.Thread(target=run_stage, args=(stage, errors), name=stage.command)
+                   for stage in stages]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(1)  # without timeout the main thread wouldn't see the signals
+    else:
+        for stage in stages:
+            run_stage(stage, errors)
+            if errors:
+                break
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
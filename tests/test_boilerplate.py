@@ -0,0 +1,55 @@
+#-*- coding:utf-8 -*-
+
+import unittest
+
+from capture import boilerplate, compare_extractors, extraction
+
+
+PAGE = u"""<html><head><title>Câmara aprova reforma</title>
+<script>var menu = "o que é de mais para a gente";</script></head><body>
+<ul class="menu"><li><a href="/">Capa</a></li><li><a href="/politica">Política e a economia do país</a></li></ul>
+<div class="materia">
+  <h1>Câmara aprova reforma</h1>
+  <p>A Câmara dos Deputados aprovou nesta terça-feira o texto da reforma, que ainda será votado no Senado.</p>
+  <p>Segundo o relator, as mudanças devem entrar em vigor no próximo ano, mas dependem de uma nova votação.</p>
+  <p>Leia também: <a href="/1">Governo prevê economia com a reforma de que tanto se fala</a></p>
+  <script>trackPageView("a página de que se fala");</script>
+</div>
+<div class="rodape"><p>Todos os direitos reservados.</p></div>
+</body></html>"""
+
+
+class TestBoilerplate(unittest.TestCase):
+    def setUp(self):
+        self.tree = extraction.parse_html(PAGE)
+
+    def test_body(self):
+        node, text = boilerplate.extract(self.tree)
+        self.assertEqual(node.get('class'), 'materia')
+        self.assertTrue(text.startswith(u'Câmara aprova reforma\n\nA Câmara dos Deputados'))
+        self.assertIn(u'dependem de uma nova votação.', text)
+        self.assertNotIn(u'Leia também', text)
+        self.assertNotIn(u'trackPageView', text)
+
+    def test_engines(self):
+        article = extraction.extract_article(PAGE, self.tree, engine='density')
+        self.assertEqual(article.title, u'Câmara aprova reforma')
+        self.assertRaises(ValueError, extraction.extract_article, PAGE, self.tree, engine='unknown')
+
+    def test_no_text(self):
+        self.assertEqual(boilerplate.extract(extraction.parse_html(u'<html><body><a href="/">Capa</a></body></html>')),
+                         (None, u''))
+
+    def test_deep_nesting(self):
+        html = u'<div>' * 200 + u'<p>o texto de que se fala</p>' + u'</div>' * 200
+        tree = extraction.parse_html(u'<html><body>' + html + u'</body></html>')
+        self.assertEqual(boilerplate.extract(tree)[1], u'o texto de que se fala')
+
+    def test_word_scores(self):
+        self.assertEqual(compare_extractors.word_scores(u'a b c', u'a b c'), (1.0, 1.0, 1.0))
+        precision, recall, f1 = compare_extractors.word_scores(u'a b', u'a b c d')
+        self.assertEqual((precision, recall), (1.0, 0.5))
+
+
+if __name__ == '__main__':
+    unittest.main()
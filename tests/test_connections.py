@@ -0,0 +1,109 @@
+#-*- coding:utf-8 -*-
+
+import os
+import unittest
+from multiprocessing import Pool
+
+import pymongo
+
+from capture import connections
+
+
+class FakeClient(object):
+    """
+    Stands for a MongoClient, recording the indexes ensured.
+    """
+    created = []
+
+    def __init__(self, *args, **kwargs):
+        self.pid = os.getpid()
+        self.indexes = []
+        FakeClient.created.append(self)
+
+    def __getitem__(self, name):
+        return FakeDatabase(self, name)
+
+
+class FakeDatabase(object):
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def __getitem__(self, name):
+        return FakeCollection(self, name)
+
+
+class FakeCollection(object):
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+
+    def find_one(self, *args, **kwargs):
+        return {'client': self.database.client, 'database': self.database.name, 'collection': self.name}
+
+    def ensure_index(self, keys, **options):
+        self.database.client.indexes.append((self.database.name, self.name, keys, options))
+
+
+class FakeCounters(object):
+    def __init__(self):
+        self.docs = {}
+
+    def find_and_modify(self, query, update, upsert=False, new=False):
+        doc = self.docs.setdefault(query['_id'], {'_id': query['_id'], 'last': 0})
+        doc['last'] += update['$inc']['last']
+        return dict(doc)
+
+
+def client_pid(_):
+    return connections.MCDB.articles.find_one()['client'].pid, os.getpid()
+
+
+class TestConnections(unittest.TestCase):
+    def setUp(self):
+        self.MongoClient = pymongo.MongoClient
+        pymongo.MongoClient = FakeClient
+        del FakeClient.created[:]
+        connections._clients.clear()
+
+    def tearDown(self):
+        pymongo.MongoClient = self.MongoClient
+        connections._clients.clear()
+
+    def test_lazy_shared_client(self):
+        feeds, articles = connections.MCDB.feeds, connections.MCDB['articles']
+        self.assertEqual(FakeClient.created, [])
+        self.assertEqual(feeds.find_one()['collection'], 'feeds')
+        found = articles.find_one()
+        self.assertEqual((found['database'], found['collection']), ('MCDB', 'articles'))
+        self.assertEqual(FakeClient.created, [found['client']])
+        self.assertEqual(connections.MCDB.articles.pypln.name, 'articles.pypln')
+
+    def test_client_per_process(self):
+        parent = connections.mongo()
+        pool = Pool(2)
+        pids = pool.map(client_pid, range(4))
+        pool.close()
+        pool.join()
+        for client, pid in pids:
+            self.assertEqual(client, pid)
+            self.assertNotEqual(pid, parent.pid)
+
+    def test_ensure_indexes(self):
+        connections.ensure_indexes('MCDB_test')
+        indexes = connections.mongo().indexes
+        self.assertEqual(len(indexes), len(connections.INDEXES))
+        self.assertIn(('MCDB_test', 'traces', [('start', pymongo.ASCENDING)],
+                       {'expireAfterSeconds': int(connections.settings.TRACE_RETENTION * 86400)}), indexes)
+
+    def test_sequence(self):
+        counters = FakeCounters()
+        first, second = connections.Sequence(counters, 'ids', block=3), connections.Sequence(counters, 'ids', block=3)
+        numbers = [first.next() for _ in range(4)] + [second.next() for _ in range(2)]
+        self.assertEqual(numbers[:3], [1, 2, 3])
+        self.assertEqual(len(set(numbers)), 6)
+        self.assertEqual(counters.docs['ids']['last'], 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#-*- coding:utf-8 -*-
+
+import unittest
+
+from capture import content_paths, extraction
+
+
+PAGE = u"""<html><head><title>{title} - Jornal</title></head><body>
+<div id="menu"><a href="/">Capa</a> <a href="/politica">Política</a></div>
+<div id="{body_id}"><p>{title}.</p>{paragraphs}</div>
+<div class="comentarios"><p>Comente esta notícia</p></div>
+</body></html>"""
+
+PARAGRAPH = u"<p>O governo federal anunciou {0} novas medidas para a economia durante a reunião de hoje, " \
+            u"com impacto previsto sobre os preços e o emprego ao longo dos próximos meses.</p>"
+
+
+def page(n, body_id='texto'):
+    return PAGE.format(title=u'Notícia número {0}'.format(n), body_id=body_id,
+                       paragraphs=u''.join(PARAGRAPH.format(n * 10 + i) for i in range(4)))
+
+
+class FakeCollection(object):
+    def __init__(self):
+        self.docs = {}
+
+    def find_one(self, query, fields=None):
+        return self.docs.get(query['_id'])
+
+    def update(self, query, update, upsert=False):
+        self.docs.setdefault(query['_id'], {'_id': query['_id']}).update(update['$set'])
+
+    def remove(self, query):
+        self.docs.pop(query['_id'], None)
+
+
+class TestContentPaths(unittest.TestCase):
+    def setUp(self):
+        self.saved = content_paths.PATHS
+        content_paths.PATHS = FakeCollection()
+        self.paths = content_paths.ContentPaths(extraction.extract_text)
+
+    def tearDown(self):
+        content_paths.PATHS = self.saved
+
+    def extract(self, n, **kwargs):
+        return self.paths.extract(page(n, **kwargs), url='http://www.jornal.com.br/politica/{0}'.format(n))
+
+    def test_engine_reads_its_node(self):
+        news, text = content_paths.engine_extract(page(1), url='http://www.jornal.com.br/politica/1')
+        self.assertEqual(news.body_selector, '#texto')
+        self.assertTrue(content_paths.same_text(text, news.cleaned_text))
+
+    def test_learns_the_body_node(self):
+        verify = content_paths.config['verify_pages']
+        for n in range(verify):
+            self.assertIsNone(self.extract(n).selector)
+        self.assertEqual(content_paths.PATHS.docs['jornal.com.br']['selector'], '#texto')
+        news = self.extract(verify)
+        self.assertEqual(news.selector, '#texto')
+        self.assertIn(u'{0} novas medidas'.format(verify * 10 + 3), news.cleaned_text)
+        self.assertNotIn(u'Comente', news.cleaned_text)
+        self.assertEqual(news.title, u'Notícia número {0} - Jornal'.format(verify))
+
+    def test_falls_back_to_goose_and_drops_stale_selector(self):
+        content_paths.PATHS.docs['jornal.com.br'] = {'selector': '#texto'}
+        news = self.extract(1, body_id='materia')
+        self.assertIsNone(news.selector)
+        self.assertIn(u'novas medidas', news.cleaned_text)
+        for n in range(content_paths.config['max_misses'] - 1):
+            self.extract(n, body_id='materia')
+        self.assertNotIn('jornal.com.br', content_paths.PATHS.docs)
+
+    def test_same_text(self):
+        text = u' '.join(PARAGRAPH.format(i) for i in range(3))
+        self.assertTrue(content_paths.same_text(text, text))
+        other = u' Outro parágrafo sobre futebol: campeonato, torcida, estádio, gols, vitória, derrota e empate.'
+        self.assertFalse(content_paths.same_text(text, text + other))
+        self.assertFalse(content_paths.same_text(text * 2, text))
+
+
+if __name__ == '__main__':
+    unittest.main()
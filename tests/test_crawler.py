@@ -0,0 +1,287 @@
+#-*- coding:utf-8 -*-
+
+import datetime
+import itertools
+import unittest
+import urlparse
+
+from capture import backfill, connections, crawler, downloader, extraction, outbox, warc
+
+
+INDEX = u"""<html><body>
+<div id="block-valor_capa_automatica-central_automatico">
+  <h2><a href="/politica/3561234/noticia-um">Um</a></h2>
+  <h2><a href="http://www.valor.com.br/brasil/3561235/noticia-dois">Dois</a></h2>
+  <h2>sem link</h2>
+</div>
+<div class="materia-manchete destaque"><a href="/rs/noticia/1">ZH</a><a href="/rs/secao">Seção</a></div>
+</body></html>"""
+
+
+class TestOutlets(unittest.TestCase):
+    def test_all_outlets_load(self):
+        outlets = crawler.load_outlets()
+        self.assertEqual(set(o['name'] for o in outlets), set(['estadao', 'folha', 'oglobo', 'valor', 'zh']))
+        for outlet in outlets:
+            self.assertTrue(crawler.index_urls(outlet))
+
+    def test_unknown_outlet(self):
+        self.assertRaises(ValueError, crawler.load_outlets, ['nonexistent'])
+
+    def test_category_expansion(self):
+        valor = crawler.load_outlets(['valor'])[0]
+        urls = crawler.index_urls(valor)
+        self.assertIn(('http://www.valor.com.br/ultimas-noticias/politica', 'politica'), urls)
+
+
+class TestExtraction(unittest.TestCase):
+    def setUp(self):
+        self.tree = crawler.parse_html(INDEX)
+
+    def test_find_links(self):
+        valor = crawler.load_outlets(['valor'])[0]
+        links = crawler.find_links(valor, self.tree, 'http://www.valor.com.br/ultimas-noticias/brasil')
+        self.assertEqual(links, ['http://www.valor.com.br/politica/3561234/noticia-um',
+                                 'http://www.valor.com.br/brasil/3561235/noticia-dois'])
+
+    def test_first_link_of_container(self):
+        zh = crawler.load_outlets(['zh'])[0]
+        links = crawler.find_links(zh, self.tree, 'http://zh.clicrbs.com.br/rs/ultimas-noticias/')
+        self.assertEqual(links, ['http://zh.clicrbs.com.br/rs/noticia/1'])
+
+    def test_dates(self):
+        outlets = dict((o['name'], o) for o in crawler.load_outlets())
+        cases = [('valor', u'02/05/2014 às 10h35', datetime.datetime(2014, 5, 2, 10, 35)),
+                 ('zh', u'Publicado em 02/05/2014 - 09h05min', datetime.datetime(2014, 5, 2, 9, 5)),
+                 ('estadao', u'21 Março 2014 | 10h 30', datetime.datetime(2014, 3, 21, 10, 30)),
+                 ('estadao', u'5 de janeiro de 2014 17:02', datetime.datetime(2014, 1, 5, 17, 2))]
+        for name, text, expected in cases:
+            self.assertEqual(crawler.parse_outlet_date(text, outlets[name]['date']), expected)
+
+    def test_category_from_url(self):
+        folha = crawler.load_outlets(['folha'])[0]
+        url = 'http://www1.folha.uol.com.br/poder/2014/05/1234-noticia.shtml'
+        self.assertEqual(crawler.extract_category(folha, url, None), 'poder')
+
+    def test_unicode_document_with_declaration(self):
+        tree = crawler.parse_html(u'<?xml version="1.0" encoding="iso-8859-1"?><html><body><p>ação</p></body></html>')
+        self.assertEqual(tree.cssselect('p')[0].text, u'ação')
+
+    def test_goose_on_shared_tree(self):
+        html = (u'<html><head><title>Título</title></head><body><div id="menu"><a href="/">Capa</a></div>'
+                u'<div class="texto"><p>' + u'O governo anunciou hoje as novas medidas para a economia. ' * 10 +
+                u'</p></div><span class="data">02/05/2014</span></body></html>')
+        tree = crawler.parse_html(html)
+        news = extraction.goose_extract(html, tree, 'http://www.valor.com.br/brasil/1/noticia')
+        self.assertEqual(news.cleaned_text, extraction.goose_extract(html).cleaned_text)
+        self.assertTrue(news.cleaned_text.startswith(u'O governo anunciou'))
+        # Goose cleans its own copy, the tree is still complete for the other extractors
+        self.assertEqual(len(tree.cssselect('span.data')), 1)
+        self.assertEqual(len(tree.cssselect('#menu a')), 1)
+
+
+class FakeResponse(object):
+    def __init__(self, url, content, status_code=200, headers=None):
+        self.url = url
+        self.content = content
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.encoding = None
+
+
+class FakeHttp(object):
+    """
+    Serves index pages listing `per_page` article links each, page `n`
+    (1 for the index) listing the articles n*per_page to (n+1)*per_page - 1.
+    """
+    def __init__(self, per_page=3, etag=None):
+        self.per_page = per_page
+        self.etag = etag
+        self.requests = []
+
+    def get(self, url, headers=None):
+        self.requests.append((url, headers or {}))
+        if self.etag is not None and (headers or {}).get('If-None-Match') == self.etag:
+            return FakeResponse(url, '', 304)
+        page = int(url.rsplit('-', 1)[1].split('.')[0]) if 'noticias-' in url else 1
+        links = ''.join('<li><a href="/poder/2014/05/{0}-noticia.shtml">n</a></li>'.format(i)
+                        for i in range(page * self.per_page, (page + 1) * self.per_page))
+        return FakeResponse(url, '<html><body><div class="news-index"><ol>' + links + '</ol></div></body></html>',
+                            headers={'etag': '"v1"'})
+
+
+class TestContinuation(unittest.TestCase):
+    TEASER = '/poder/2014/05/1-noticia.shtml'
+
+    def setUp(self):
+        self.folha = crawler.load_outlets(['folha'])[0]
+        self.saved = crawler.content_paths.extract, crawler.detect_language
+        texts = {self.TEASER: u'Leia o post completo no blog', '/blog/1': u'Texto completo'}
+        crawler.content_paths.extract = lambda html, tree, url: extraction.Extraction(
+            u'T', texts[urlparse.urlparse(url).path], None)
+        crawler.detect_language = lambda text, domain: 'pt'
+
+    def tearDown(self):
+        crawler.content_paths.extract, crawler.detect_language = self.saved
+
+    def test_link_is_the_listed_url(self):
+        pages = {self.TEASER: '<html><body><article id="news"><a href="/blog/1">blog</a></article></body></html>',
+                 '/blog/1': '<html><body><p>Texto completo</p></body></html>'}
+        http = FakeHttp()
+        http.get = lambda url, headers=None: FakeResponse(url, pages[urlparse.urlparse(url).path])
+        url = 'http://www1.folha.uol.com.br' + self.TEASER
+        article = crawler.download_article(self.folha, http, url)
+        self.assertEqual(article['link'], url)
+        self.assertEqual(article['continuation_link'], 'http://www1.folha.uol.com.br/blog/1')
+        self.assertEqual(article['cleaned_text'], u'Texto completo')
+
+
+class TestIncremental(unittest.TestCase):
+    def setUp(self):
+        self.folha = crawler.load_outlets(['folha'])[0]
+        self.saved = crawler.known_links, crawler.load_validators
+        crawler.load_validators = lambda urls: {}
+
+    def tearDown(self):
+        crawler.known_links, crawler.load_validators = self.saved
+
+    def crawl(self, stored, incremental=True, http=None):
+        crawler.known_links = lambda links: set(l for l in links if int(l.rsplit('/', 1)[1].split('-')[0]) in stored)
+        c = crawler.Crawler([self.folha], threads=2, incremental=incremental)
+        c.http = http or FakeHttp()
+        pool = crawler.ThreadPool(2)
+        try:
+            return c, c.find_new_articles(pool)
+        finally:
+            pool.close()
+
+    def test_stops_at_first_page_already_stored(self):
+        # articles 3 to 8 are new (index and page 2), page 3 is all stored
+        c, found = self.crawl(stored=set(range(9, 100)))
+        self.assertEqual(sorted(int(t[1].rsplit('/', 1)[1].split('-')[0]) for t in found), range(3, 9))
+        self.assertEqual([r[0].rsplit('/', 1)[1] for r in c.http.requests],
+                         ['index.shtml', 'noticias-2.shtml', 'noticias-3.shtml'])
+
+    def test_only_index_pages_without_incremental(self):
+        c, found = self.crawl(stored=set(), incremental=False)
+        self.assertEqual(len(found), 3)
+        self.assertEqual(len(c.http.requests), 1)
+
+    def test_unchanged_index(self):
+        crawler.load_validators = lambda urls: dict((u, {'etag': '"v1"'}) for u in urls)
+        c, found = self.crawl(stored=set(), http=FakeHttp(etag='"v1"'))
+        self.assertEqual(found, [])
+        self.assertEqual(c.http.requests[0][1], {'If-None-Match': '"v1"'})
+
+    def test_validators_kept_only_when_all_stored(self):
+        c, found = self.crawl(stored=set(range(6, 100)))
+        saved = []
+        crawler.save_validators, original = saved.append, crawler.save_validators
+        try:
+            c.save_state(set(t[1] for t in found[:-1]))
+            c.save_state(set(t[1] for t in found))
+        finally:
+            crawler.save_validators = original
+        self.assertEqual(saved[0].keys(), ['http://www1.folha.uol.com.br/ultimas-noticias/noticias-2.shtml'])
+        self.assertEqual(len(saved[1]), 2)
+
+
+class TestBackfill(unittest.TestCase):
+    def setUp(self):
+        self.estadao = crawler.load_outlets(['estadao'])[0]
+        self.saved = backfill.checkpoint
+        self.checkpoints = []
+        backfill.checkpoint = lambda part, next_page, stored, done=False: \
+            self.checkpoints.append((next_page, stored, done))
+
+    def tearDown(self):
+        backfill.checkpoint = self.saved
+
+    def test_partitions(self):
+        parts = backfill.partitions(self.estadao, 45, size=20)
+        politica = [(p['start'], p['end']) for p in parts if p['category'] == 'politica']
+        self.assertEqual(politica, [(2, 21), (22, 41), (42, 45)])
+        self.assertEqual(len(set(p['_id'] for p in parts)), len(parts))
+
+    def test_partition_ends_with_the_archive(self):
+        b = backfill.Backfill([self.estadao], threads=1)
+        b.crawl_page = lambda outlet, category, page: (10, 3) if page < 5 else (0, 0)
+        part = dict(backfill.partitions(self.estadao, 21)[0], next_page=3)
+        self.assertEqual(b.crawl_partition(part), 6)
+        self.assertEqual(self.checkpoints, [(4, 3, False), (5, 3, False), (22, 0, True)])
+
+    def test_failed_page_leaves_partition_pending(self):
+        b = backfill.Backfill([self.estadao], threads=1)
+        b.crawl_page = lambda outlet, category, page: (10, 1) if page < 4 else None
+        part = dict(backfill.partitions(self.estadao, 21)[0], next_page=2)
+        self.assertEqual(b.crawl_partition(part), 2)
+        self.assertFalse(any(done for _, _, done in self.checkpoints))
+
+
+class FakeArticles(object):
+    def __init__(self, docs):
+        self.docs = docs
+        self.updates = []
+
+    def find(self, query, fields=None):
+        if 'link' in query:
+            return [d for d in self.docs if d['link'] in query['link']['$in']]
+        return [d for d in self.docs if d['_id'] in query['_id']['$in']]
+
+    def update(self, query, update, w=None):
+        self.updates.append((query['_id'], update))
+
+    def insert(self, docs, w=None):
+        self.docs.extend(docs)
+
+
+class FakeOutbox(object):
+    def __init__(self):
+        self.events = []
+
+    def insert(self, events, w=None):
+        self.events.extend(events)
+
+
+class TestStoreArticles(unittest.TestCase):
+    def setUp(self):
+        self.saved = (crawler.ARTICLES, downloader.ARTICLES, connections.SPHINX_IDS, outbox.OUTBOX,
+                      warc._replay, warc._update)
+        crawler.ARTICLES = downloader.ARTICLES = FakeArticles([{'_id': 1, 'link': 'http://a/1'}])
+        connections.SPHINX_IDS, outbox.OUTBOX = itertools.count(1), FakeOutbox()
+
+    def tearDown(self):
+        (crawler.ARTICLES, downloader.ARTICLES, connections.SPHINX_IDS, outbox.OUTBOX,
+         warc._replay, warc._update) = self.saved
+
+    def test_updated_articles_not_counted(self):
+        warc._replay, warc._update = object(), True
+        now = datetime.datetime.now()
+        articles = [{'_id': 2, 'link': 'http://a/1', 'crawled': now, 'cleaned_text': u'novo'},
+                    {'_id': 3, 'link': 'http://a/2', 'crawled': now}]
+        self.assertEqual(crawler.store_articles(articles), 1)
+        self.assertEqual([d['_id'] for d in crawler.ARTICLES.docs], [1, 3])
+        self.assertEqual([e['article'] for e in outbox.OUTBOX.events], [3])
+        self.assertEqual(crawler.store_articles([]), 0)
+
+
+class TestReplayUpdate(unittest.TestCase):
+    def setUp(self):
+        self.saved = crawler.ARTICLES, downloader.ARTICLES, warc._replay, warc._update
+        crawler.ARTICLES = downloader.ARTICLES = FakeArticles([{'_id': 1, 'link': 'http://a/1'}])
+        warc._replay, warc._update = object(), True
+
+    def tearDown(self):
+        crawler.ARTICLES, downloader.ARTICLES, warc._replay, warc._update = self.saved
+
+    def test_stored_articles_are_updated(self):
+        self.assertEqual(crawler.known_links(['http://a/1']), set())
+        articles = [{'link': 'http://a/1', 'cleaned_text': u'novo', 'title': u'Um', 'trace_id': 'x'},
+                    {'link': 'http://a/2', 'cleaned_text': u'outro'}]
+        self.assertEqual(crawler.update_stored(articles), articles[1:])
+        self.assertEqual(crawler.ARTICLES.updates,
+                         [(1, {'$set': {'cleaned_text': u'novo', 'title': u'Um'}, '$unset': {'reextract': ''}})])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+# coding: utf-8
+
+import datetime
+import unittest
+
+import numpy as np
+
+from utilities import dates
+
+
+class TestDateParser(unittest.TestCase):
+    def setUp(self):
+        self.parser = dates.DateParser()
+
+    def test_shapes(self):
+        cases = [('Seg, 21 Out 2013 21:14:36 -0200', datetime.datetime(2013, 10, 21, 23, 14, 36), 'rfc822'),
+                 ('Ter, 31 Jul 2012 16:54:00 GMT', datetime.datetime(2012, 7, 31, 16, 54, 0), 'rfc822'),
+                 ('23 Abr 2008', datetime.datetime(2008, 4, 23), 'rfc822'),
+                 ('2013-10-14T10:40:00-03:00', datetime.datetime(2013, 10, 14, 13, 40), 'iso8601'),
+                 ('2014-05-02T13:36:12.345Z', datetime.datetime(2014, 5, 2, 13, 36, 12, 345000), 'iso8601'),
+                 (u'02/05/2014 às 10h35', datetime.datetime(2014, 5, 2, 10, 35), 'dmy'),
+                 ('02/05/2014 - 09h05min', datetime.datetime(2014, 5, 2, 9, 5), 'dmy'),
+                 (u'terça-feira, 9 de outubro de 2012', datetime.datetime(2012, 10, 9), 'long'),
+                 (u'21 de Março de 2014 17:02', datetime.datetime(2014, 3, 21, 17, 2), 'long')]
+        for value, expected, fmt in cases:
+            self.assertEqual(self.parser.parse(value, value), expected)
+            self.assertEqual(self.parser.format_of(value), fmt)
+
+    def test_fallback(self):
+        self.assertEqual(self.parser.parse('2013-10-14T10:40:00+-3:00', 'feed'),
+                         datetime.datetime(2013, 10, 14, 13, 40))
+        self.assertIsNone(self.parser.format_of('feed'))
+        self.assertEqual(self.parser.parse('Mon, 21 Oct 2013 22:14:36 -0200', 'feed'),
+                         datetime.datetime(2013, 10, 22, 0, 14, 36))
+        self.assertEqual(self.parser.format_of('feed'), 'rfc822')
+        # an odd string of the source doesn't change its format
+        self.parser.parse('2013-10-14T10:40:00+-3:00', 'feed')
+        self.assertRaises(ValueError, self.parser.parse, 'amanhã', 'feed')
+        self.assertEqual(self.parser.format_of('feed'), 'rfc822')
+
+    def test_memo_follows_the_source(self):
+        self.parser.parse('2013-10-14T10:40:00Z', 'feed')
+        self.assertEqual(self.parser.parse('Seg, 21 Out 2013 21:14:36 -0200', 'feed'),
+                         datetime.datetime(2013, 10, 21, 23, 14, 36))
+        self.assertEqual(self.parser.format_of('feed'), 'rfc822')
+
+    def test_batch(self):
+        result = self.parser.parse_many(['2013-10-14T10:40:00Z', 'nada', u'02/05/2014 às 10h35'])
+        self.assertEqual(result.dtype, np.dtype('datetime64[us]'))
+        self.assertEqual(result[0], np.datetime64('2013-10-14T10:40:00'))
+        self.assertTrue(np.isnat(result[1]))
+        self.assertEqual(result[2], np.datetime64('2014-05-02T10:35'))
+
+
+if __name__ == '__main__':
+    unittest.main()
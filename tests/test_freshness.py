@@ -0,0 +1,84 @@
+#-*- coding:utf-8 -*-
+
+import datetime
+import unittest
+
+from bson.objectid import ObjectId
+
+from capture import freshness
+
+
+class FakeBulk(object):
+    def __init__(self, collection):
+        self.collection = collection
+        self.upserts = []
+
+    def find(self, query):
+        bulk = self
+
+        class Selection(object):
+            def upsert(self):
+                return self
+
+            def update(self, update):
+                bulk.upserts.append((query['_id'], update))
+        return Selection()
+
+    def execute(self):
+        for _id, update in self.upserts:
+            doc = self.collection.docs.setdefault(_id, dict(update['$setOnInsert'], _id=_id, counts={}))
+            for field, n in update['$inc'].iteritems():
+                index = field.split('.')[1]
+                doc['counts'][index] = doc['counts'].get(index, 0) + n
+
+
+class FakeCollection(object):
+    def __init__(self):
+        self.docs = {}
+
+    def initialize_unordered_bulk_op(self):
+        return FakeBulk(self)
+
+    def find(self, query):
+        return [d for d in self.docs.values() if d['hour'] >= query['hour']['$gte']]
+
+
+class TestFreshness(unittest.TestCase):
+    def setUp(self):
+        self.saved = freshness.FRESHNESS
+        freshness.FRESHNESS = FakeCollection()
+        freshness.flush()
+
+    def tearDown(self):
+        freshness.FRESHNESS = self.saved
+
+    def test_buckets(self):
+        self.assertEqual(freshness.bucket(0.5), 0)
+        self.assertEqual(freshness.bucket(1), 1)
+        for seconds in (3, 100, 3600, 86400 * 3):
+            index = freshness.bucket(seconds)
+            self.assertTrue(freshness.upper_bound(index - 1) <= seconds < freshness.upper_bound(index))
+        self.assertEqual(freshness.bucket(1e9), freshness.LAST_BUCKET)
+
+    def test_rollups_add_up_to_percentiles(self):
+        now = datetime.datetime.utcnow()
+        for minutes in range(1, 101):
+            article = {'link': 'http://www.folha.uol.com.br/poder/{0}'.format(minutes),
+                       'published': now - datetime.timedelta(minutes=minutes)}
+            freshness.inserted(article, now)
+        freshness.inserted({'source': 'valor', 'published': now + datetime.timedelta(hours=1)}, now)
+        freshness.inserted({'source': 'valor', 'published': u'ontem'}, now)
+        freshness.flush()
+        freshness.indexed({'source': 'valor'}, ObjectId.from_datetime(now - datetime.timedelta(seconds=30)))
+        freshness.flush()
+        report = freshness.percentiles(now - datetime.timedelta(hours=1))
+        folha = report['folha.uol.com.br']['publish_to_insert']
+        self.assertEqual(folha['count'], 100)
+        self.assertTrue(50 * 60 <= folha['p50'] < 50 * 60 * 1.2)
+        self.assertTrue(95 * 60 <= folha['p95'] < 95 * 60 * 1.2)
+        self.assertEqual(report['valor']['publish_to_insert'], {'count': 1, 'p50': 1, 'p95': 1, 'p99': 1})
+        self.assertTrue(30 <= report['valor']['insert_to_index']['p50'] < 40)
+
+
+if __name__ == '__main__':
+    unittest.main()
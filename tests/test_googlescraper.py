@@ -0,0 +1,103 @@
+#-*- coding:utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import urlparse
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+from capture import GoogleScraper
+from capture.ratelimit import RateLimiter
+
+
+RESULT_PAGE = u"""<html><body>
+<a href="/url?q=http://www.site{start}a.com.br/rss&amp;sa=U&amp;ei=x">a</a>
+<a href="/url?q=http://www.site{start}b.com.br/feeds/&amp;sa=U">b</a>
+<a href="http://webcache.googleusercontent.com/search?q=cache:x">cache</a>
+<a href="/search?q=rss&amp;start=100">next</a>
+</body></html>"""
+
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """
+    Serves canned google result pages; the page at start=500 fails.
+    """
+    def do_GET(self):
+        params = urlparse.parse_qs(urlparse.urlparse(self.path).query)
+        start = params.get('start', ['0'])[0]
+        self.server.requests.append(start)
+        if start == '500':
+            self.send_response(503)
+            self.end_headers()
+            return
+        body = RESULT_PAGE.format(start=start).encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestGoogleScraper(unittest.TestCase):
+    def setUp(self):
+        self.server = _ThreadingServer(('127.0.0.1', 0), _StandInHandler)
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.search_url = 'http://127.0.0.1:{}/search'.format(self.server.server_port)
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir)
+
+    def scrape(self, number_pages, cache=None):
+        return GoogleScraper.scrape('RSS+site:br', number_pages=number_pages, search_url=self.search_url,
+                                    cache=cache, rate_limiter=RateLimiter(0), threads=4)
+
+    def test_fetch_pages_concurrently(self):
+        urls = self.scrape(3)
+        self.assertEqual(sorted(self.server.requests), ['0', '100', '200'])
+        hosts = set(u.netloc for u in urls)
+        self.assertIn('www.site100a.com.br', hosts)
+        self.assertNotIn('webcache.googleusercontent.com', hosts)
+        self.assertEqual(len(hosts), 6)
+
+    def test_failed_page_is_skipped(self):
+        urls = self.scrape(6)
+        self.assertEqual(len(self.server.requests), 6)
+        self.assertEqual(len(set(u.netloc for u in urls)), 10)
+
+    def test_cache_avoids_repeated_requests(self):
+        cache = GoogleScraper.ResultCache(os.path.join(self.tmpdir, 'cache'))
+        first = self.scrape(2, cache)
+        second = self.scrape(2, cache)
+        cache.close()
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(sorted(u.geturl() for u in first), sorted(u.geturl() for u in second))
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_spacing(self):
+        limiter = RateLimiter(0.05)
+        waits = [limiter.wait('host') for _ in range(3)]
+        self.assertEqual(waits[0], 0)
+        self.assertGreater(waits[1], 0.04)
+        self.assertGreater(waits[2], 0.04)
+        self.assertEqual(limiter.wait('other'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
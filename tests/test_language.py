@@ -0,0 +1,68 @@
+#-*- coding:utf-8 -*-
+
+import unittest
+
+from capture import language
+
+
+class FakeCollection(object):
+    def __init__(self):
+        self.docs = {}
+
+    def find_one(self, query):
+        return self.docs.get(query['_id'])
+
+    def update(self, query, update, upsert=False):
+        doc = self.docs.setdefault(query['_id'], {'_id': query['_id'], 'counts': {}})
+        for key, n in update.get('$inc', {}).iteritems():
+            code = key.split('.', 1)[1]
+            doc['counts'][code] = doc['counts'].get(code, 0) + n
+        doc.update(update.get('$set', {}))
+
+    def remove(self, query):
+        self.docs.pop(query['_id'], None)
+
+
+class TestLanguageMemo(unittest.TestCase):
+    def setUp(self):
+        self.saved = language.LANGUAGES, language.detect
+        self.calls = []
+        language.LANGUAGES = FakeCollection()
+        self.detected = {"name": "PORTUGUESE", "code": "pt"}
+        language.detect = lambda text: (self.calls.append(text) or dict(self.detected), True)
+        self.memo = language.LanguageMemo()
+
+    def tearDown(self):
+        language.LANGUAGES, language.detect = self.saved
+
+    def test_monolingual_source(self):
+        for i in range(language.config['min_samples']):
+            self.memo.language(u'texto', 'feed')
+        self.assertEqual(language.LANGUAGES.docs['feed']['language']['code'], 'pt')
+        n = len(self.calls)
+        for i in range(language.config['recheck_every'] - 1):
+            self.assertEqual(self.memo.language(u'texto', 'feed')['code'], 'pt')
+        self.assertEqual(len(self.calls), n)
+        self.memo.language(u'texto', 'feed')
+        self.assertEqual(len(self.calls), n + 1)
+
+    def test_recheck_resets_memo(self):
+        language.LANGUAGES.docs['feed'] = {'_id': 'feed', 'language': dict(self.detected), 'counts': {'pt': 20}}
+        self.detected = {"name": "ENGLISH", "code": "en"}
+        for i in range(language.config['recheck_every']):
+            self.memo.language(u'text', 'feed')
+        self.assertNotIn('feed', language.LANGUAGES.docs)
+        self.assertEqual(self.memo.language(u'text', 'feed')['code'], 'en')
+
+    def test_mixed_source(self):
+        for i in range(language.config['min_samples']):
+            self.detected = [{"name": "PORTUGUESE", "code": "pt"}, {"name": "ENGLISH", "code": "en"}][i % 2]
+            self.memo.language(u'texto', 'feed')
+        self.assertTrue(language.LANGUAGES.docs['feed']['mixed'])
+        n = len(self.calls)
+        self.memo.language(u'texto', 'feed')
+        self.assertEqual(len(self.calls), n + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
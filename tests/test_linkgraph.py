@@ -0,0 +1,46 @@
+#-*- coding:utf-8 -*-
+
+import unittest
+
+from capture import linkgraph
+
+
+EDGES = [('a.com.br', 'b.com.br', 1), ('b.com.br', 'c.com.br', 1), ('c.com.br', 'a.com.br', 1),
+         ('d.com.br', 'c.com.br', 2), ('d.com.br', 'a.com.br', 1)]
+
+
+class TestLinkGraph(unittest.TestCase):
+    def test_domain_of(self):
+        self.assertEqual(linkgraph.domain_of('http://www.Folha.uol.com.br:80/poder/'), 'folha.uol.com.br')
+        self.assertEqual(linkgraph.domain_of('g1.globo.com/economia'), 'g1.globo.com')
+        self.assertIsNone(linkgraph.domain_of(''))
+
+    def test_csr_adjacency(self):
+        graph = linkgraph.LinkGraph(EDGES)
+        d = graph.index['d.com.br']
+        targets = [graph.domains[j] for j in graph.indices[graph.indptr[d]:graph.indptr[d + 1]]]
+        self.assertEqual(sorted(targets), ['a.com.br', 'c.com.br'])
+        self.assertEqual(len(graph.indices), len(EDGES))
+
+    def test_pagerank(self):
+        ranks = linkgraph.LinkGraph(EDGES).pagerank()
+        self.assertAlmostEqual(sum(ranks.values()), 1.0)
+        # nobody links to d
+        self.assertEqual(min(ranks, key=ranks.get), 'd.com.br')
+
+    def test_warm_start_converges_to_same_ranks(self):
+        graph = linkgraph.LinkGraph(EDGES)
+        cold = graph.pagerank()
+        warm = graph.pagerank(previous=cold)
+        for domain in cold:
+            self.assertAlmostEqual(cold[domain], warm[domain], places=5)
+
+    def test_prioritize(self):
+        urls = ['http://b.com.br/x/y.html', 'http://a.com.br/noticias/2014/z.html', 'http://a.com.br/']
+        ranks = {'a.com.br': 0.6, 'b.com.br': 0.4}
+        self.assertEqual(linkgraph.prioritize(urls, ranks),
+                         ['http://a.com.br/', 'http://a.com.br/noticias/2014/z.html', 'http://b.com.br/x/y.html'])
+
+
+if __name__ == '__main__':
+    unittest.main()
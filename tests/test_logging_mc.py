@@ -0,0 +1,105 @@
+#-*- coding:utf-8 -*-
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from multiprocessing import Pool
+
+from capture import logging_mc
+
+
+class ThreadFormatter(logging.Formatter):
+    def format(self, record):
+        return '{0} {1}'.format(threading.current_thread().name, record.getMessage())
+
+
+def log_in_worker(path):
+    logger = logging.getLogger('test_logging_mc.worker')
+    logger.info("worker %s", os.getpid())
+    return os.getpid()
+
+
+class TestLogging(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'test.log')
+
+    def tearDown(self):
+        logging_mc.flush()
+        handler = logging_mc._files.pop(self.path, None)
+        if handler is not None:
+            handler.close()
+        shutil.rmtree(self.tmpdir)
+
+    def get_logger(self, name):
+        logger = logging_mc.get_logger(name, self.path, console=False)
+        self.addCleanup(lambda: logger.handlers.__delitem__(slice(None)))
+        return logger
+
+    def read(self):
+        logging_mc.flush()
+        with open(self.path) as f:
+            return f.read().splitlines()
+
+    def test_formatted_by_the_writer(self):
+        logger = self.get_logger('test_logging_mc.writer')
+        logging_mc._files[self.path].setFormatter(ThreadFormatter())
+        logger.info("article %s", 1)
+        self.assertEqual(self.read(), ['logging_mc article 1'])
+
+    def test_one_handler_per_file(self):
+        first = self.get_logger('test_logging_mc.first')
+        second = self.get_logger('test_logging_mc.second')
+        self.assertIs(self.get_logger('test_logging_mc.first'), first)
+        self.assertEqual(len(first.handlers), 1)
+        self.assertEqual(first.handlers[0].targets, second.handlers[0].targets)
+        first.info("one")
+        second.info("two")
+        self.assertEqual([line.split(' - ')[1:] for line in self.read()],
+                         [['test_logging_mc.first', 'INFO', 'one'], ['test_logging_mc.second', 'INFO', 'two']])
+
+    def test_rate_limit(self):
+        logger = self.get_logger('test_logging_mc.limited')
+        limiter = logger.handlers[0].filters[0]
+        limiter.limit = 3
+        for i in range(10):
+            logger.error("Failed to fetch %s", i)
+        logger.error("Other message")
+        for record in limiter.expire(now=float('inf')):
+            logger.handlers[0].emit(record)
+        messages = [line.split(' - ', 3)[3] for line in self.read()]
+        self.assertEqual(messages, ['Failed to fetch 0', 'Failed to fetch 1', 'Failed to fetch 2', 'Other message',
+                                    '7 similar messages suppressed in 60 s, the first was: Failed to fetch 0'])
+
+    def test_full_queue_drops(self):
+        logger = self.get_logger('test_logging_mc.dropped')
+        logger.info("first")  # starts the writer
+        logger.handlers[0].filters[0].limit = 0
+        logging_mc._dropped = 0
+        size = logging_mc._queue.maxsize
+        with logging_mc._files[self.path].lock:  # blocks the writer
+            logging_mc._queue.maxsize = 5
+            for i in range(20):
+                logger.info("record %s", i)
+            dropped = logging_mc._dropped
+            logging_mc._queue.maxsize = size
+        self.assertGreaterEqual(dropped, 14)
+
+    def test_pool_workers(self):
+        logger = self.get_logger('test_logging_mc.worker')
+        logger.info("parent")
+        pool = Pool(2)
+        pids = set(pool.map(log_in_worker, [self.path] * 4))
+        pool.close()
+        pool.join()
+        lines = self.read()
+        self.assertIn('parent', lines[0])
+        for pid in pids:
+            self.assertTrue([line for line in lines if line.endswith('worker {0}'.format(pid))])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+#-*- coding:utf-8 -*-
+
+import subprocess
+import sys
+import unittest
+
+import mediacloud
+
+
+class TestCommandLine(unittest.TestCase):
+    def test_stages(self):
+        options, stages = mediacloud.parse(['--threads', '8', '--parallel', 'download', '+',
+                                            'crawl', '-i', 'valor', '+', 'load-pypln', '-l', '10'])
+        self.assertTrue(options.parallel)
+        self.assertEqual([stage.command for stage in stages], ['download', 'crawl', 'load-pypln'])
+        self.assertEqual(stages[1].outlets, ['valor'])
+        self.assertTrue(stages[1].incremental)
+        self.assertEqual(stages[2].limit, 10)
+        self.assertEqual([stage.threads for stage in stages], [8, 8, 8])
+
+    def test_shared_options_apply_to_config(self):
+        options, stages = mediacloud.parse(['-t', '3', '-b', '7', 'crawl'])
+        config = {'threads': 1, 'batch_size': 1, 'host_interval': 1}
+        mediacloud.configure(config, stages[0])
+        self.assertEqual(config, {'threads': 3, 'batch_size': 7, 'host_interval': 1})
+
+    def test_help_imports_no_stage(self):
+        code = ("import sys, mediacloud\n"
+                "try:\n"
+                "    mediacloud.main(['--help'])\n"
+                "except SystemExit:\n"
+                "    pass\n"
+                "sys.stderr.write(repr(sorted(m for m in sys.modules if m.startswith('capture'))))\n")
+        process = subprocess.Popen([sys.executable, '-c', code], cwd=mediacloud.ROOT,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = process.communicate()
+        self.assertIn('download', out)
+        self.assertEqual(err, '[]')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#-*- coding:utf-8 -*-
+
+import glob
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import urllib2
+
+from capture import memory, metrics
+
+
+HELD = {'features': []}  # module-level state growing for the life of the process
+
+
+class Leaky(object):
+    pass
+
+
+class TestMemory(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.tracker = memory.MemoryTracker('test', self.tmpdir)
+
+    def tearDown(self):
+        del HELD['features'][:]
+        shutil.rmtree(self.tmpdir)
+
+    def test_rss(self):
+        self.assertGreater(memory.rss(), 1024 ** 2)
+
+    def test_module_containers(self):
+        HELD['features'].extend(range(5))
+        sizes = memory.module_containers()
+        self.assertEqual(sizes[u"{0}.HELD['features']".format(__name__)], 5)
+        self.assertEqual(sizes[u'{0}.HELD'.format(__name__)], 1)
+
+    def test_report_shows_growth(self):
+        self.tracker.report()
+        HELD['features'].extend(Leaky() for _ in xrange(5000))
+        path = self.tracker.write_report()
+        self.assertEqual(os.path.dirname(path), self.tmpdir)
+        with open(path) as f:
+            lines = f.read().decode('utf8').splitlines()
+        self.assertTrue(lines[1].startswith('RSS'))
+        self.assertIn(['Leaky', '5000', '+5000'], [line.split() for line in lines])
+        self.assertIn([u"{0}.HELD['features']".format(__name__), '5000', '+5000'], [line.split() for line in lines])
+
+    def test_requested_report_written_by_watcher(self):
+        thread = threading.Thread(target=self.tracker.watch, args=(0, 0))
+        thread.daemon = True
+        thread.start()
+        self.tracker.requested.set()
+        t0 = time.time()
+        while not glob.glob(os.path.join(self.tmpdir, 'test-*.txt')) and time.time() - t0 < 10:
+            time.sleep(0.05)
+        self.assertEqual(len(glob.glob(os.path.join(self.tmpdir, 'test-*.txt'))), 1)
+        self.assertFalse(self.tracker.requested.is_set())
+
+    def test_report_over_http(self):
+        metrics.add_page('/memory', self.tracker.report)
+        server = metrics.start_http_server(0)
+        try:
+            text = urllib2.urlopen('http://127.0.0.1:{0}/memory'.format(server.server_port), timeout=5).read()
+        finally:
+            server.shutdown()
+            server.server_close()
+            metrics.PAGES.pop('/memory')
+        self.assertIn('Memory of test', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+#-*- coding:utf-8 -*-
+
+import os
+import time
+import unittest
+import urllib2
+from multiprocessing import Pool, Queue
+
+from capture import metrics
+
+
+class FakeCollection(object):
+    def __init__(self):
+        self.docs = []
+
+    def insert(self, doc):
+        self.docs.append(doc)
+
+
+class QueueCollection(object):
+    """
+    Collection of the snapshots inserted by forked processes.
+    """
+    def __init__(self):
+        self.queue = Queue()
+
+    def insert(self, doc):
+        self.queue.put(doc)
+
+
+def observe_in_worker(stage):
+    metrics.STAGE_SECONDS.labels(stage).observe(0.01)
+    return os.getpid()
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_histogram_buckets_are_cumulative(self):
+        h = self.registry.register(metrics.Histogram('latency_seconds', 'Latency', ['stage'], buckets=(0.1, 1)))
+        for value in (0.05, 0.5, 0.7, 3):
+            h.labels('fetch').observe(value)
+        text = self.registry.render()
+        self.assertIn('# TYPE latency_seconds histogram', text)
+        self.assertIn('latency_seconds_bucket{stage="fetch",le="0.1"} 1\n', text)
+        self.assertIn('latency_seconds_bucket{stage="fetch",le="1"} 3\n', text)
+        self.assertIn('latency_seconds_bucket{stage="fetch",le="+Inf"} 4\n', text)
+        self.assertIn('latency_seconds_count{stage="fetch"} 4\n', text)
+        self.assertIn('latency_seconds_sum{stage="fetch"} 4.25\n', text)
+
+    def test_counter_and_gauge(self):
+        c = self.registry.register(metrics.Counter('errors_total', 'Errors', ['stage']))
+        g = self.registry.register(metrics.Gauge('in_flight', 'In flight'))
+        c.labels('a"b').inc()
+        c.labels('a"b').inc(2)
+        g.inc()
+        g.inc()
+        g.dec()
+        text = self.registry.render()
+        self.assertIn('errors_total{stage="a\\"b"} 3\n', text)
+        self.assertIn('in_flight 1\n', text)
+        self.assertIs(self.registry.register(metrics.Counter('errors_total', 'Errors', ['stage'])), c)
+
+    def test_stage_counts_exceptions(self):
+        before = metrics.STAGE_ERRORS.labels('test_stage').value
+        with metrics.stage('test_stage'):
+            pass
+        with self.assertRaises(ValueError):
+            with metrics.stage('test_stage'):
+                raise ValueError
+        self.assertEqual(sum(metrics.STAGE_SECONDS.labels('test_stage').counts), 2)
+        self.assertEqual(metrics.STAGE_ERRORS.labels('test_stage').value, before + 1)
+
+    def test_http_and_flush(self):
+        metrics.STAGE_SECONDS.labels('test_http').observe(0.01)
+        server = metrics.start_http_server(0)
+        try:
+            url = 'http://127.0.0.1:{0}/metrics'.format(server.server_port)
+            text = urllib2.urlopen(url, timeout=5).read()
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertIn('mediacloud_stage_seconds_count{stage="test_http"} 1', text)
+        saved, metrics.METRICS = metrics.METRICS, FakeCollection()
+        try:
+            metrics.flush('test')
+            doc = metrics.METRICS.docs[0]
+        finally:
+            metrics.METRICS = saved
+        self.assertEqual(doc['process'], 'test')
+        self.assertEqual(sum(doc['metrics']['mediacloud_stage_seconds']['values']['test_http']['counts']), 1)
+
+    def test_pool_workers_flush(self):
+        metrics.STAGE_SECONDS.labels('test_pool').observe(0.01)
+        saved, metrics.METRICS = metrics.METRICS, QueueCollection()
+        metrics.start('test_pool', port=0, flush_interval=0)  # already started in the parent
+        try:
+            pool = Pool(1, initializer=metrics.start_worker, initargs=('test_pool', 3600))
+            pid = pool.apply(observe_in_worker, ('test_pool',))
+            pool.close()
+            pool.join()
+            doc = metrics.METRICS.queue.get(timeout=5)
+        finally:
+            metrics.METRICS = saved
+            metrics._started.discard('test_pool')
+        self.assertEqual((doc['process'], doc['pid']), ('test_pool', pid))
+        self.assertNotEqual(pid, os.getpid())
+        self.assertEqual(sum(doc['metrics']['mediacloud_stage_seconds']['values']['test_pool']['counts']), 1)
+
+    def test_recording_is_cheap(self):
+        child = metrics.STAGE_SECONDS.labels('test_cost')
+        t0 = time.time()
+        for _ in xrange(10000):
+            child.observe(0.02)
+        self.assertLess((time.time() - t0) / 10000, 1e-4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,219 @@
+#-*- coding:utf-8 -*-
+
+import datetime
+import time
+import unittest
+
+from bson.objectid import ObjectId
+
+from utilities import migration
+
+
+def matches(document, query):
+    for key, condition in query.items():
+        if key == '$and':
+            if not all(matches(document, q) for q in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = document.get(key)
+            if '$exists' in condition and (key in document) != condition['$exists']:
+                return False
+            if '$gt' in condition and not value > condition['$gt']:
+                return False
+            if '$gte' in condition and not value >= condition['$gte']:
+                return False
+            if '$lt' in condition and not value < condition['$lt']:
+                return False
+        elif document.get(key) != condition:
+            return False
+    return True
+
+
+def apply_update(document, update):
+    document.update(update.get('$set', {}))
+    for key in update.get('$unset', {}):
+        document.pop(key, None)
+    for key, n in update.get('$inc', {}).items():
+        document[key] = document.get(key, 0) + n
+
+
+class FakeCursor(list):
+    def sort(self, key, direction):
+        return FakeCursor(sorted(self, key=lambda d: d[key], reverse=direction < 0))
+
+    def limit(self, n):
+        return FakeCursor(self[:n])
+
+    def skip(self, n):
+        return FakeCursor(self[n:])
+
+    def batch_size(self, n):
+        return self
+
+    def count(self):
+        return len(self)
+
+    def close(self):
+        pass
+
+
+class FakeBulk(object):
+    def __init__(self, collection):
+        self.collection = collection
+        self.updates = []
+
+    def find(self, query):
+        bulk = self
+
+        class Selection(object):
+            def update_one(self, update):
+                bulk.updates.append((query, update))
+        return Selection()
+
+    def execute(self):
+        self.collection.bulk_writes += 1
+        for query, update in self.updates:
+            self.collection.update(query, update)
+
+
+class FakeClient(object):
+    host, port = 'localhost', 27017
+
+
+class FakeDatabase(object):
+    name = 'MCDB'
+    connection = FakeClient()
+
+    def __init__(self):
+        self.migrations = FakeCollection(self, 'migrations')
+
+
+class FakeCollection(object):
+    def __init__(self, database=None, name='articles'):
+        self.database = database
+        self.name = name
+        self.docs = {}
+        self.bulk_writes = 0
+
+    def insert(self, document):
+        self.docs[document['_id']] = dict(document)
+
+    def find(self, query=None, fields=None, timeout=True):
+        return FakeCursor(dict(d) for d in self.docs.values() if matches(d, query or {}))
+
+    def find_one(self, query):
+        docs = self.find(query)
+        return docs[0] if docs else None
+
+    def remove(self, query):
+        for document in self.find(query):
+            del self.docs[document['_id']]
+
+    def update(self, query, update):
+        for document in self.docs.values():
+            if matches(document, query):
+                apply_update(document, update)
+
+    def initialize_unordered_bulk_op(self):
+        return FakeBulk(self)
+
+
+def double(document):
+    if document['n'] == 13:
+        raise ValueError('unlucky')
+    if document['n'] % 2:
+        return {'$set': {'double': document['n'] * 2}}
+
+
+def slow(document):
+    try:
+        if document['n'] == 3:
+            time.sleep(5)
+    except Exception:
+        pass
+    return {'$set': {'double': document['n'] * 2}}
+
+
+def flag(document):
+    return {'$set': {'slow': True}}
+
+
+class TestShardBounds(unittest.TestCase):
+    def test_ranges_cover_the_ids(self):
+        collection = FakeCollection(FakeDatabase())
+        for n in range(100):
+            collection.insert({'_id': n, 'n': n})
+        bounds = migration.shard_bounds(collection, {}, 4)
+        self.assertEqual(bounds, [(None, 25), (25, 50), (50, 75), (75, None)])
+
+    def test_object_ids_are_split_by_time(self):
+        collection = FakeCollection(FakeDatabase())
+        start = datetime.datetime(2014, 1, 1)
+        for day in range(10):
+            _id = ObjectId.from_datetime(start + datetime.timedelta(days=day))
+            collection.insert({'_id': _id, 'n': day})
+        bounds = migration.shard_bounds(collection, {}, 3)
+        self.assertEqual(len(bounds), 3)
+        self.assertEqual(bounds[1][0].generation_time.day, 4)
+        self.assertEqual(bounds[2][0].generation_time.day, 7)
+
+    def test_empty_collection(self):
+        self.assertEqual(migration.shard_bounds(FakeCollection(FakeDatabase()), {}, 4), [])
+
+
+class TestMigration(unittest.TestCase):
+    def setUp(self):
+        self.collection = FakeCollection(FakeDatabase())
+        for n in range(50):
+            self.collection.insert({'_id': n, 'n': n})
+        self.migration = migration.Migration('double', self.collection, {'double': {'$exists': False}},
+                                             double, processes=1, shards=2, batch_size=10)
+
+    def test_shards_are_transformed_in_batches(self):
+        shards = self.migration.plan()
+        self.assertEqual(len(shards), 2)
+        results = [self.migration.process_shard(s) for s in shards]
+        self.assertEqual(sum(r[1] for r in results), 50)
+        self.assertEqual(sum(r[2] for r in results), 24)
+        self.assertEqual(sum(r[3] for r in results), 1)
+        self.assertEqual(self.collection.docs[7]['double'], 14)
+        self.assertNotIn('double', self.collection.docs[8])
+        self.assertEqual(self.collection.bulk_writes, 6)
+
+    def test_planned_again_when_done(self):
+        for shard in self.migration.plan():
+            self.migration.process_shard(shard)
+        self.collection.insert({'_id': 50, 'n': 51})
+        shards = self.migration.plan(resume=True)
+        self.assertEqual(len(shards), 2)
+        self.assertFalse(any(self.migration.checkpoints.docs[s]['done'] for s in shards))
+        results = [self.migration.process_shard(s) for s in shards]
+        self.assertEqual(self.collection.docs[50]['double'], 102)
+        # the even numbers are still without `double`, and 13 fails again
+        self.assertEqual(sum(r[1] for r in results), 27)
+
+    def test_time_limit(self):
+        slowly = migration.Migration('slow', self.collection, {'n': {'$lt': 5}}, slow, processes=1, shards=1,
+                                     time_limit=1, on_timeout=flag)
+        t0 = time.time()
+        _, processed, updated, errors = slowly.process_shard(slowly.plan()[0])
+        self.assertLess(time.time() - t0, 3)
+        self.assertEqual((processed, updated, errors), (5, 5, 1))
+        self.assertEqual(self.collection.docs[3].get('slow'), True)
+        self.assertNotIn('double', self.collection.docs[3])
+        self.assertEqual(self.collection.docs[4]['double'], 8)
+
+    def test_resumes_from_checkpoint(self):
+        shard = self.migration.plan()[0]
+        self.migration.checkpoints.update({'_id': shard}, {'$set': {'last_id': 9}})
+        self.assertEqual(self.migration.plan(resume=True), sorted(self.migration.checkpoints.docs))
+        _, processed, updated, errors = self.migration.process_shard(shard)
+        self.assertEqual(processed, 15)
+        self.assertNotIn('double', self.collection.docs[7])
+        self.assertEqual(self.collection.docs[11]['double'], 22)
+        self.assertEqual(self.migration.checkpoints.docs[shard]['last_id'], 24)
+        self.assertTrue(self.migration.checkpoints.docs[shard]['done'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+#-*- coding:utf-8 -*-
+
+import datetime
+import unittest
+
+from bson.objectid import ObjectId
+
+from capture import outbox
+
+
+class FakeCollection(object):
+    """
+    Stands for the outbox collections, with the queries of the consumers.
+    """
+    def __init__(self):
+        self.docs = {}
+
+    def insert(self, docs, **kwargs):
+        for doc in docs:
+            doc.setdefault('_id', ObjectId())
+            self.docs[doc['_id']] = doc
+
+    def find_one(self, spec):
+        return self.docs.get(spec['_id'])
+
+    def update(self, spec, update, upsert=False):
+        self.docs.setdefault(spec['_id'], {'_id': spec['_id']}).update(update['$set'])
+
+    def find(self, spec, sort=None, limit=0, fields=None):
+        bounds = spec['_id']
+        docs = [doc for _id, doc in sorted(self.docs.items())
+                if _id < bounds['$lt'] and ('$gt' not in bounds or _id > bounds['$gt'])]
+        return docs[:limit] if limit else docs
+
+
+def events_at(*ages):
+    now = datetime.datetime.utcnow()
+    return [{'_id': ObjectId.from_datetime(now - datetime.timedelta(seconds=age)), 'article': age}
+            for age in ages]
+
+
+class TestOutbox(unittest.TestCase):
+    def setUp(self):
+        self.collections = outbox.OUTBOX, outbox.OFFSETS
+        outbox.OUTBOX, outbox.OFFSETS = FakeCollection(), FakeCollection()
+        self.handled = []
+        self.consumer = outbox.Consumer('test', lambda events: self.handled.append([e['article'] for e in events]),
+                                        batch_size=2)
+
+    def tearDown(self):
+        outbox.OUTBOX, outbox.OFFSETS = self.collections
+
+    def test_event(self):
+        published = datetime.datetime(2014, 5, 1, 12)
+        article = {'_id': ObjectId(), 'link': 'http://g1.globo.com/politica/1.html',
+                   'published': published, 'trace_id': 'abc'}
+        event = outbox.event(article, published + datetime.timedelta(minutes=5))
+        self.assertEqual(event['article'], article['_id'])
+        self.assertEqual(event['source'], 'g1.globo.com')
+        self.assertEqual(event['trace_id'], 'abc')
+        self.assertIsNone(outbox.event({'_id': 1, 'published': u'ontem'}, published)['published'])
+
+    def test_consumer_reads_in_order_from_its_offset(self):
+        outbox.OUTBOX.insert(events_at(30, 20, 10, 0))
+        self.consumer.run(once=True)
+        # the last event is left for the next read, until it settles
+        self.assertEqual(self.handled, [[30, 20], [10]])
+        self.assertEqual(self.consumer.offset(), sorted(outbox.OUTBOX.docs)[2])
+        outbox.OUTBOX.insert(events_at(8))
+        self.consumer.run(once=True)
+        self.assertEqual(self.handled[-1], [8])
+
+    def test_failed_batch_is_read_again(self):
+        outbox.OUTBOX.insert(events_at(30, 20))
+
+        def fail(events):
+            raise ValueError("Elasticsearch is down")
+        self.assertRaises(ValueError, outbox.Consumer('test', fail).poll)
+        self.assertIsNone(self.consumer.offset())
+        self.consumer.poll()
+        self.assertEqual(self.handled, [[30, 20]])
+
+
+if __name__ == '__main__':
+    unittest.main()
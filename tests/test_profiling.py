@@ -0,0 +1,119 @@
+#-*- coding:utf-8 -*-
+
+import glob
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+import unittest
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
+from capture import profiling
+
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(xrange(1000))
+
+
+def busy_worker(seconds):
+    t0 = time.time()
+    while time.time() - t0 < seconds:
+        sum(xrange(1000))
+    return os.getpid()
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        if profiling._profiler is not None:
+            profiling._profiler.close()
+        profiling._profiler = None
+        signal.signal(signal.SIGUSR2, signal.SIG_DFL)
+        shutil.rmtree(self.tmpdir)
+
+    def read_stacks(self, path):
+        stacks = {}
+        with open(path) as f:
+            for line in f:
+                stack, count = line.rsplit(' ', 1)
+                stacks[stack] = int(count)
+        return stacks
+
+    def test_collapsed_stacks_of_all_threads(self):
+        profiler = profiling.SamplingProfiler('test', self.tmpdir, interval=0.005, dump_interval=60)
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_loop, args=(stop,))
+        worker.start()
+        profiler.start()
+        time.sleep(0.3)
+        profiler.close()
+        stop.set()
+        worker.join()
+        self.assertTrue(os.path.exists(profiler.path))
+        stacks = self.read_stacks(profiler.path)
+        busy = [s for s in stacks if s.split(';')[-1].startswith('busy_loop(test_profiling.py')]
+        self.assertTrue(busy)
+        self.assertFalse([s for s in stacks if '_run(profiling.py' in s])
+        self.assertGreater(sum(stacks[s] for s in busy), 10)
+
+    def test_signal_toggles_profiling(self):
+        os.environ.pop('MEDIACLOUD_PROFILE', None)
+        profiler = profiling.install('test')
+        profiler.directory, profiler.interval = self.tmpdir, 0.005
+        self.assertFalse(profiler.running)
+        os.kill(os.getpid(), signal.SIGUSR2)
+        time.sleep(0.1)
+        self.assertTrue(profiler.running)
+        os.kill(os.getpid(), signal.SIGUSR2)
+        profiler.close()
+        self.assertFalse(profiler.running)
+        self.assertEqual(glob.glob(os.path.join(self.tmpdir, '*.collapsed')), [profiler.path])
+
+    def test_signal_handled_during_pool_map(self):
+        os.environ.pop('MEDIACLOUD_PROFILE', None)
+        profiler = profiling.install('test')
+        profiler.directory, profiler.interval = self.tmpdir, 0.005
+
+        def wait_for_profiling(n):
+            if n == 0:
+                os.kill(os.getpid(), signal.SIGUSR2)
+            t0 = time.time()
+            while not profiler.running and time.time() - t0 < 5:
+                time.sleep(0.01)
+            return profiler.running
+
+        pool = ThreadPool(2)
+        self.assertEqual(profiling.pool_map(pool, wait_for_profiling, [0, 1]), [True, True])
+        self.assertEqual(sorted(profiling.interruptible(pool.imap_unordered(abs, [-1, 2]))), [1, 2])
+        pool.close()
+        profiler.close()
+
+    def test_pool_workers_are_profiled(self):
+        os.environ['MEDIACLOUD_PROFILE'] = '1'
+        try:
+            profiler = profiling.install('test')
+        finally:
+            del os.environ['MEDIACLOUD_PROFILE']
+        profiler.close()
+        profiler.directory, profiler.interval = self.tmpdir, 0.005
+        profiler.start()
+        pool = Pool(2)
+        pids = set(pool.map(busy_worker, [0.3, 0.3]))
+        pool.close()
+        pool.join()
+        profiler.close()
+        files = glob.glob(os.path.join(self.tmpdir, '*.collapsed'))
+        worker_files = [f for f in files if int(os.path.basename(f).split('-')[1]) in pids]
+        self.assertTrue(worker_files)
+        for path in worker_files:
+            self.assertTrue(any('busy_worker(test_profiling.py' in s for s in self.read_stacks(path)))
+
+
+if __name__ == '__main__':
+    unittest.main()
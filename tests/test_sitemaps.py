@@ -0,0 +1,69 @@
+#-*- coding:utf-8 -*-
+
+import datetime
+import gzip
+import unittest
+from StringIO import StringIO
+
+from capture import sitemaps
+
+
+SITEMAP_INDEX = """<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>http://example.com.br/sitemap-news.xml</loc><lastmod>2014-05-02T10:00:00-03:00</lastmod></sitemap>
+  <sitemap><loc>http://example.com.br/sitemap-2013.xml</loc></sitemap>
+</sitemapindex>
+"""
+
+NEWS_SITEMAP = """<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"
+        xmlns:news="http://www.google.com/schemas/sitemap-news/0.9">
+  <url>
+    <loc>http://example.com.br/politica/2014/05/noticia.html</loc>
+    <news:news><news:publication_date>2014-05-02T09:30:00Z</news:publication_date></news:news>
+  </url>
+  <url><loc>http://example.com.br/esporte/jogo.html</loc><lastmod>2014-05-01</lastmod></url>
+</urlset>
+"""
+
+
+class TestRobots(unittest.TestCase):
+    def test_parse_robots_sitemaps(self):
+        lines = ["User-agent: *", "Disallow: /busca", "Sitemap: http://example.com.br/sitemap.xml",
+                 "sitemap: /sitemap-news.xml  # news", "Sitemap: http://example.com.br/sitemap.xml"]
+        self.assertEqual(sitemaps.parse_robots_sitemaps(lines, 'http://example.com.br/'),
+                         ['http://example.com.br/sitemap.xml', 'http://example.com.br/sitemap-news.xml'])
+
+    def test_site_root(self):
+        self.assertEqual(sitemaps.site_root('Example.com.br/politica/x.html'), 'http://example.com.br/')
+
+
+class TestSitemapParsing(unittest.TestCase):
+    def test_sitemap_index(self):
+        entries = list(sitemaps.iter_sitemap(StringIO(SITEMAP_INDEX)))
+        self.assertEqual([e.kind for e in entries], ['sitemap', 'sitemap'])
+        self.assertEqual(entries[0].lastmod, datetime.datetime(2014, 5, 2, 13, 0))
+        self.assertIsNone(entries[1].lastmod)
+
+    def test_news_sitemap(self):
+        entries = list(sitemaps.iter_sitemap(StringIO(NEWS_SITEMAP)))
+        self.assertEqual([e.loc for e in entries], ['http://example.com.br/politica/2014/05/noticia.html',
+                                                    'http://example.com.br/esporte/jogo.html'])
+        self.assertEqual(entries[0].lastmod, datetime.datetime(2014, 5, 2, 9, 30))
+
+    def test_gzipped_sitemap(self):
+        buf = StringIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+            f.write(NEWS_SITEMAP)
+        buf.seek(0)
+        entries = list(sitemaps.iter_sitemap(sitemaps._GunzipStream(buf)))
+        self.assertEqual(len(entries), 2)
+
+    def test_section_url(self):
+        self.assertEqual(sitemaps.section_url('http://example.com.br/politica/2014/05/noticia.html'),
+                         'http://example.com.br/politica/')
+        self.assertIsNone(sitemaps.section_url('http://example.com.br/noticia.html'))
+
+
+if __name__ == '__main__':
+    unittest.main()
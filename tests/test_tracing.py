@@ -0,0 +1,72 @@
+#-*- coding:utf-8 -*-
+
+import datetime
+import time
+import unittest
+
+from capture import metrics, tracing
+
+
+class FakeCollection(object):
+    def __init__(self):
+        self.docs = []
+
+    def insert(self, docs, w=1):
+        self.docs.extend(docs)
+
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        self.saved = dict(tracing.config), tracing.TRACES
+        tracing.TRACES = FakeCollection()
+        tracing.flush()
+
+    def tearDown(self):
+        tracing.config.update(self.saved[0])
+        tracing.TRACES = self.saved[1]
+
+    def test_sampling_depends_only_on_the_id(self):
+        tracing.config['sample_rate'] = 0.25
+        traces = [tracing.new_trace() for _ in xrange(2000)]
+        kept = [t for t in traces if tracing.sampled(t)]
+        self.assertTrue(300 < len(kept) < 700)
+        self.assertEqual(kept, [t for t in traces if tracing.sampled(t)])
+        self.assertFalse(tracing.sampled(None))
+
+    def test_stage_records_span_of_sampled_trace(self):
+        tracing.config['sample_rate'] = 1
+        trace = tracing.new_trace()
+        with metrics.stage('extraction', trace):
+            pass
+        with self.assertRaises(ValueError):
+            with metrics.stage('mongo_write', trace):
+                raise ValueError
+        tracing.config['sample_rate'] = 0
+        with metrics.stage('extraction', tracing.new_trace()):
+            pass
+        self.assertEqual(tracing.TRACES.docs, [])
+        tracing.flush()
+        spans = tracing.TRACES.docs
+        self.assertEqual([(s['trace'], s['stage'], s['error']) for s in spans],
+                         [(trace, 'extraction', False), (trace, 'mongo_write', True)])
+
+    def test_buffer_is_saved_in_batches(self):
+        tracing.config.update(sample_rate=1, batch_size=3)
+        trace = tracing.new_trace()
+        for _ in xrange(4):
+            tracing.record(trace, 'es_index', time.time(), 0.01)
+        self.assertEqual(len(tracing.TRACES.docs), 3)
+
+    def test_breakdown_and_duration(self):
+        t0 = datetime.datetime(2014, 5, 2, 10, 0)
+        spans = [{'stage': 'article_fetch', 'start': t0, 'seconds': 2.0},
+                 {'stage': 'extraction', 'start': t0 + datetime.timedelta(seconds=2), 'seconds': 1.0},
+                 {'stage': 'article_fetch', 'start': t0 + datetime.timedelta(seconds=3), 'seconds': 0.5},
+                 {'stage': 'pypln_upload', 'start': t0 + datetime.timedelta(seconds=60), 'seconds': 4.0}]
+        self.assertEqual(tracing.duration(spans), 64.0)
+        self.assertEqual(tracing.breakdown(spans), [('article_fetch', 2.5), ('extraction', 1.0),
+                                                    ('pypln_upload', 4.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+#-*- coding:utf-8 -*-
+
+import glob
+import gzip
+import os
+import shutil
+import StringIO
+import tempfile
+import threading
+import unittest
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+import requests
+
+from capture import warc
+
+
+PAGE = u"<html><head><title>Notícia {0}</title></head><body><p>Texto da notícia {0}.</p></body></html>"
+
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """
+    Serves gzipped article pages; /old redirects to /noticia/1 and /missing fails.
+    """
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.path == '/old':
+            self.send_response(301)
+            self.send_header('Location', '/noticia/1')
+            self.end_headers()
+            return
+        if self.path == '/missing':
+            self.send_response(404)
+            self.end_headers()
+            return
+        buf = StringIO.StringIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+            f.write(PAGE.format(self.path.rsplit('/', 1)[1]).encode('utf8'))
+        body = buf.getvalue()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestWarc(unittest.TestCase):
+    def setUp(self):
+        self.server = _ThreadingServer(('127.0.0.1', 0), _StandInHandler)
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.base = 'http://127.0.0.1:{0}'.format(self.server.server_port)
+        self.tmpdir = tempfile.mkdtemp()
+        self.saved = dict(warc.config)
+        warc.config['directory'] = self.tmpdir
+
+    def tearDown(self):
+        if warc._writer is not None:
+            warc._writer.close()
+        warc._writer = warc._replay = None
+        warc.config.update(self.saved)
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir)
+
+    def capture(self, *paths):
+        responses = [warc.get(self.base + path, timeout=5) for path in paths]
+        warc.get_writer().close()
+        return responses
+
+    def test_captured_responses_are_replayed_without_network(self):
+        live = self.capture('/noticia/1', '/old', '/missing')
+        self.assertEqual(len(glob.glob(os.path.join(self.tmpdir, '*.warc.gz'))), 1)
+        self.assertEqual(glob.glob(os.path.join(self.tmpdir, '*.open')), [])
+        self.server.requests = []
+        archive = warc.start_replay([self.tmpdir])
+        self.assertEqual(len(archive), 3)
+        page = warc.get(self.base + '/noticia/1')
+        self.assertEqual(page.content, live[0].content)
+        self.assertEqual(page.text, PAGE.format(1))
+        self.assertEqual(page.encoding, 'utf-8')
+        self.assertNotIn('content-encoding', page.headers)
+        redirected = warc.get(self.base + '/old')
+        self.assertEqual(redirected.url, self.base + '/noticia/1')
+        self.assertEqual([r.status_code for r in redirected.history], [301])
+        self.assertEqual(warc.get(self.base + '/missing').status_code, 404)
+        self.assertRaises(requests.ConnectionError, warc.get, self.base + '/noticia/2')
+        self.assertEqual(self.server.requests, [])
+
+    def test_files_roll_over_max_size(self):
+        warc.config['max_size'] = 1
+        self.capture('/noticia/1', '/noticia/2', '/noticia/3')
+        files = sorted(glob.glob(os.path.join(self.tmpdir, '*.warc.gz')))
+        self.assertEqual(len(files), 3)
+        records = [r for _, r in warc.iter_records(files[1])]
+        self.assertEqual([r.type for r in records], ['warcinfo', 'response'])
+        self.assertEqual(records[1].url, self.base + '/noticia/2')
+        archive = warc.ReplayArchive(files)
+        self.assertEqual(archive.get(self.base + '/noticia/3').text, PAGE.format(3))
+
+    def test_truncated_record_is_skipped(self):
+        self.capture('/noticia/1', '/noticia/2')
+        path = glob.glob(os.path.join(self.tmpdir, '*.warc.gz'))[0]
+        with open(path, 'rb') as f:
+            data = f.read()
+        with open(path, 'wb') as f:
+            f.write(data[:-20])
+        archive = warc.ReplayArchive([path])
+        self.assertIn(self.base + '/noticia/1', archive)
+        self.assertNotIn(self.base + '/noticia/2', archive)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+#-*- coding:utf-8 -*-
+
+import os
+import time
+import unittest
+
+from capture import extraction, watchdog
+
+
+def fake_extract_text(html, tree=None, url=None, engine=None):
+    if html == 'sleep':
+        time.sleep(10)
+    elif html == 'loop':
+        while True:
+            pass
+    elif html == 'parent':
+        return extraction.Extraction(None, unicode(os.getppid()), None)
+    elif html == 'fail':
+        raise ValueError("broken page")
+    return extraction.Extraction(u'Título', html, None)
+
+
+class TestWatchdog(unittest.TestCase):
+    def setUp(self):
+        # the workers are forked, so they run the fake engine
+        self.saved = extraction.extract_text
+        extraction.extract_text = fake_extract_text
+        self.pool = watchdog.WatchdogPool(processes=1, wall_time=0.5, cpu_time=1)
+
+    def tearDown(self):
+        self.pool.close()
+        extraction.extract_text = self.saved
+
+    def test_extract(self):
+        self.assertEqual(self.pool.extract_text(u'texto da notícia'),
+                         extraction.Extraction(u'Título', u'texto da notícia', None))
+
+    def test_wall_time(self):
+        t0 = time.time()
+        self.assertRaises(watchdog.ExtractionTimeout, self.pool.extract_text, 'sleep')
+        self.assertLess(time.time() - t0, 2)
+        # the worker was replaced
+        self.assertEqual(self.pool.extract_text(u'outra').cleaned_text, u'outra')
+
+    def test_cpu_time(self):
+        self.pool.wall_time = 10
+        self.assertRaises(watchdog.ExtractionTimeout, self.pool.extract_text, 'loop')
+        self.assertEqual(self.pool.extract_text(u'outra').cleaned_text, u'outra')
+
+    def test_workers_forked_by_the_supervisor(self):
+        self.assertRaises(watchdog.ExtractionTimeout, self.pool.extract_text, 'sleep')
+        supervisor = int(self.pool.extract_text('parent').cleaned_text)
+        self.assertNotEqual(supervisor, os.getpid())
+        self.assertEqual(supervisor, self.pool._supervisor.pid)
+        self.pool.close()
+        self.assertFalse(self.pool._supervisor.is_alive())
+
+    def test_engine_error(self):
+        self.assertRaises(watchdog.ExtractionError, self.pool.extract_text, 'fail')
+        self.assertEqual(self.pool.extract_text(u'outra').cleaned_text, u'outra')
+
+
+if __name__ == '__main__':
+    unittest.main()
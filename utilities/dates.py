@@ -0,0 +1,198 @@
+#-*- coding:utf-8 -*-
+u"""
+Fast parsing of the date strings found in feeds and news pages.
+
+The common shapes (RFC 822 with english or portuguese names, ISO 8601,
+``dd/mm/yyyy às HHhMM``, ``9 de outubro de 2012``) are matched by
+precompiled regular expressions; anything else goes to the slower
+`parsedates.parse_date`. The shape that matched is memoized per source (a
+feed, an outlet, a field), so the following strings of the same source try
+it first; the strings left to the slower parser don't change it, so an odd
+string doesn't send the rest of its source to the slower parser.
+
+Dates with a time zone are returned as naive datetimes in UTC, as
+`parsedates.parse_pt_date` does and as MongoDB stores them.
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import datetime
+import re
+import threading
+
+import numpy as np
+
+from parsedates import FULL_MONTHS, MONTHS, parse_date as slow_parse_date
+
+
+MONTH_NAMES = dict(MONTHS)
+MONTH_NAMES.update(FULL_MONTHS)
+MONTH_NAMES.update({u'marco': 3, 'sept': 9})
+
+TIME_ZONES = {'gmt': 0, 'ut': 0, 'utc': 0, 'z': 0, 'brt': -180, 'brst': -120,
+              'est': -300, 'edt': -240, 'cst': -360, 'cdt': -300,
+              'mst': -420, 'mdt': -360, 'pst': -480, 'pdt': -420}
+
+_TIME = r'(\d{1,2}):(\d{2})(?::(\d{2}))?'
+_ZONE = r'([+-]\d{2}:?\d{2}|[a-z]{1,4})'
+
+PATTERNS = [
+    # Mon, 21 Oct 2013 22:14:36 -0200 / Seg, 21 Out 2013 22:14:36 GMT / 23 Abr 2008
+    ('rfc822', re.compile(r'^(?:[^\W\d]+\.?,?\s+)?(\d{1,2})\s+([^\W\d]+)\.?\s+(\d{2,4})'
+                          r'(?:\s+' + _TIME + r')?(?:\s*' + _ZONE + r')?$', re.UNICODE)),
+    # 2013-10-14T10:40:00-03:00 / 2014-05-02 10:35:00 / 2014-05-02
+    ('iso8601', re.compile(r'^(\d{4})-(\d{2})-(\d{2})(?:[t ](\d{2}):(\d{2})(?::(\d{2})(?:[.,](\d{1,6})\d*)?)?)?'
+                           r'\s*(z|[+-]\d{2}(?::?\d{2})?)?$')),
+    # 02/05/2014 às 10h35 / 02/05/2014 - 09h05min / 02/05/2014 10:35
+    ('dmy', re.compile(r'^(\d{1,2})/(\d{1,2})/(\d{4})(?:\s*(?:[^\W\d]+|-|,)?\s*(\d{1,2})\s*[h:]\s*(\d{2})'
+                       r'(?:\s*min)?)?$', re.UNICODE)),
+    # terça-feira, 9 de outubro de 2012 / 21 de março de 2014 17:02
+    ('long', re.compile(r'^(?:[^\W\d][\w-]*,?\s+)?(\d{1,2})\s+de\s+([^\W\d]+)\s+de\s+(\d{4})'
+                        r'(?:\s*(?:,|-|às|as)?\s*(\d{1,2})\s*[h:]\s*(\d{2}))?$', re.UNICODE)),
+]
+FORMATS = [name for name, _ in PATTERNS]
+_PATTERNS = dict(PATTERNS)
+
+
+def _offset(zone):
+    """
+    Offset of a time zone, in minutes, or None if it is unknown.
+    """
+    if not zone:
+        return 0
+    if zone[0] in '+-':
+        digits = zone[1:].replace(':', '')
+        minutes = int(digits[:2]) * 60 + (int(digits[2:4]) if len(digits) > 2 else 0)
+        return minutes if zone[0] == '+' else -minutes
+    return TIME_ZONES.get(zone)
+
+
+def _build(year, month, day, hour=None, minute=None, second=None, zone=None, fraction=None):
+    offset = _offset(zone)
+    if offset is None:
+        return None
+    year = int(year)
+    if year < 100:
+        year += 2000 if year < 70 else 1900
+    microsecond = int(fraction.ljust(6, '0')) if fraction else 0
+    date = datetime.datetime(year, int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0),
+                             microsecond)
+    return date - datetime.timedelta(minutes=offset) if offset else date
+
+
+def _month(name):
+    return MONTH_NAMES.get(name) or MONTH_NAMES.get(name[:3])
+
+
+def parse_format(fmt, value):
+    """
+    Parse a lower cased and stripped string with one of the `FORMATS`.
+    :return: naive datetime, or None if the string does not have this format
+    """
+    match = _PATTERNS[fmt].match(value)
+    if match is None:
+        return None
+    g = match.groups()
+    try:
+        if fmt == 'rfc822':
+            month = _month(g[1])
+            return _build(g[2], month, g[0], g[3], g[4], g[5], g[6]) if month else None
+        if fmt == 'iso8601':
+            return _build(g[0], g[1], g[2], g[3], g[4], g[5], g[7], g[6])
+        if fmt == 'dmy':
+            return _build(g[2], g[1], g[0], g[3], g[4])
+        month = _month(g[1])
+        return _build(g[2], month, g[0], g[3], g[4]) if month else None
+    except ValueError:
+        return None
+
+
+def _normalize(value):
+    value = value.strip().lower()
+    if '\n' in value:
+        # garbage before the date, e.g. php warnings
+        value = value.split('\n')[-1].strip()
+    return value
+
+
+class DateParser(object):
+    """
+    Date parser remembering the format of the strings of each source.
+    """
+    def __init__(self):
+        self._formats = {}
+        self._lock = threading.Lock()
+
+    def format_of(self, source):
+        """
+        Format memoized for `source`: one of `FORMATS` or None.
+        """
+        return self._formats.get(source)
+
+    def parse(self, value, source=None):
+        """
+        Parse a date string.
+        :param source: anything identifying where the string comes from
+        :return: naive datetime
+        :raise ValueError: if the string can't be parsed
+        """
+        if not isinstance(value, basestring):
+            raise ValueError("Not a date string: {0!r}".format(value))
+        text = _normalize(value)
+        memo = self._formats.get(source)
+        if memo is not None:
+            date = parse_format(memo, text)
+            if date is not None:
+                return date
+        for fmt in FORMATS:
+            if fmt == memo:
+                continue
+            date = parse_format(fmt, text)
+            if date is not None:
+                self._remember(source, fmt)
+                return date
+        try:
+            date = slow_parse_date(value)
+        except (ValueError, OverflowError, KeyError):
+            # parse_pt_date lets KeyError through for unknown month names
+            raise ValueError("Unknown date format: {0!r}".format(value))
+        if date.tzinfo is not None:
+            date = (date - date.utcoffset()).replace(tzinfo=None)
+        return date
+
+    def _remember(self, source, fmt):
+        if source is not None and self._formats.get(source) != fmt:
+            with self._lock:
+                self._formats[source] = fmt
+
+    def parse_many(self, values, source=None):
+        """
+        Parse a sequence of date strings, e.g. a whole field of a collection.
+        :return: numpy array of datetime64[us], NaT where a string could not be parsed
+        """
+        dates = []
+        for value in values:
+            try:
+                dates.append(self.parse(value, source))
+            except ValueError:
+                dates.append(None)
+        return np.array(dates, dtype='datetime64[us]')
+
+
+PARSER = DateParser()
+
+
+def parse_date(value, source=None):
+    """
+    Parse a date string with the shared parser. See `DateParser.parse`.
+    """
+    return PARSER.parse(value, source)
+
+
+def parse_dates(values, source=None):
+    """
+    Parse many date strings with the shared parser. See `DateParser.parse_many`.
+    """
+    return PARSER.parse_many(values, source)
@@ -0,0 +1,275 @@
+#-*- coding:utf-8 -*-
+u"""
+Resumable, parallel migrations of MongoDB collections.
+
+A migration applies a transform to every document of a collection matching
+a query. The collection is split in shards of `_id` ranges (by creation
+time for ObjectIds) which are processed by a pool of processes; the updates
+are written with unordered bulk operations and the last `_id` done in each
+shard is saved in the `migrations` collection after every batch, so an
+interrupted migration run again with `resume` continues where it stopped::
+
+    def transform(document):
+        return {'$set': {'title_length': len(document['title'])}}
+
+    Migration('title_length', MCDB.articles, {'title_length': {'$exists': False}},
+              transform, fields=['title']).run(resume=True)
+
+Without `resume`, or once all its shards are done, a migration is planned
+again over the documents matching its query at that time.
+
+The transform must be a module level function, as it is sent to the worker
+processes, and returns the update of the document or None to leave it as is.
+With `time_limit`, a transform still running after that many seconds is
+interrupted (SIGALRM in the worker) and the document gets the update of
+`on_timeout` instead, if given.
+
+license: GPL V3 or Later
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import datetime
+import logging
+import multiprocessing
+import signal
+import time
+
+import pymongo
+from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError
+
+
+logger = logging.getLogger('migration')
+
+config = {
+    'processes': multiprocessing.cpu_count(),
+    'shards_per_process': 4,  # More shards than processes balance uneven shards
+    'batch_size': 1000,  # Documents per bulk write and checkpoint
+}
+
+
+def shard_bounds(collection, query, shards):
+    """
+    Split the `_id`s of the documents matching `query` in `shards` ranges.
+    :return: list of (lower, upper) bounds, lower inclusive and upper
+             exclusive, None meaning unbounded
+    """
+    first = list(collection.find(query, fields=['_id']).sort('_id', pymongo.ASCENDING).limit(1))
+    last = list(collection.find(query, fields=['_id']).sort('_id', pymongo.DESCENDING).limit(1))
+    if not first:
+        return []
+    low, high = first[0]['_id'], last[0]['_id']
+    cuts = []
+    if isinstance(low, ObjectId) and isinstance(high, ObjectId):
+        start, step = low.generation_time, (high.generation_time - low.generation_time) / shards
+        cuts = [ObjectId.from_datetime(start + step * i) for i in xrange(1, shards)]
+    else:
+        count = collection.find(query).count()
+        for i in xrange(1, shards):
+            docs = list(collection.find(query, fields=['_id']).sort('_id', pymongo.ASCENDING)
+                        .skip(count * i // shards).limit(1))
+            if docs:
+                cuts.append(docs[0]['_id'])
+    unique = []
+    for cut in cuts:
+        if cut > low and (not unique or cut > unique[-1]):
+            unique.append(cut)
+    edges = [None] + unique + [None]
+    return zip(edges[:-1], edges[1:])
+
+
+def _id_range(lower, upper, last_id=None):
+    condition = {}
+    if last_id is not None:
+        condition['$gt'] = last_id
+    elif lower is not None:
+        condition['$gte'] = lower
+    if upper is not None:
+        condition['$lt'] = upper
+    return {'_id': condition} if condition else {}
+
+
+class TransformTimeout(BaseException):
+    """
+    Raised in a transform past its time limit. Not an `Exception`, so that
+    the `except Exception` of the transform doesn't swallow it.
+    """
+
+
+def _timeout(signum, frame):
+    raise TransformTimeout()
+
+
+def _run_shard(args):
+    """
+    Process one shard in a worker process.
+    :return: (shard id, documents processed, documents updated, errors)
+    """
+    migration, shard_id = args
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        return migration.process_shard(shard_id)
+    except Exception as e:
+        logger.exception("Shard %s failed: %s", shard_id, e)
+        return shard_id, 0, 0, 1
+
+
+class Migration(object):
+    def __init__(self, name, collection, query, transform, fields=None, processes=None, shards=None,
+                 batch_size=None, time_limit=None, on_timeout=None):
+        """
+        :param name: name of the migration, used to resume it
+        :param collection: pymongo collection to migrate
+        :param query: documents to migrate
+        :param transform: function document -> update or None
+        :param fields: fields of the documents given to `transform`, all if None
+        :param processes: number of worker processes
+        :param shards: number of `_id` ranges, a few per process by default
+        :param batch_size: documents per bulk write and checkpoint
+        :param time_limit: seconds a transform may take on a document, unlimited if None
+        :param on_timeout: function document -> update or None, for the documents
+                           whose transform exceeded `time_limit`
+        """
+        self.name = name
+        self.query = query
+        self.transform = transform
+        self.fields = fields
+        self.processes = config['processes'] if processes is None else processes
+        self.shards = self.processes * config['shards_per_process'] if shards is None else shards
+        self.batch_size = config['batch_size'] if batch_size is None else batch_size
+        self.time_limit = time_limit
+        self.on_timeout = on_timeout
+        client = collection.database.connection
+        self._address = (client.host, client.port, collection.database.name, collection.name)
+        self._collection = collection
+
+    def __getstate__(self):
+        # collections can't be pickled, the workers connect again
+        state = dict(self.__dict__)
+        state['_collection'] = None
+        return state
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            host, port, database, name = self._address
+            self._collection = pymongo.MongoClient(host, port)[database][name]
+        return self._collection
+
+    @property
+    def checkpoints(self):
+        return self.collection.database.migrations
+
+    def plan(self, resume=False):
+        """
+        Create the shards of the migration.
+        :param resume: keep the shards of the previous run if some are not done
+        :return: list of the ids of the shards to migrate
+        """
+        pending = [s for s in self.checkpoints.find({'migration': self.name}) if not s['done']]
+        if resume and pending:
+            return [s['_id'] for s in sorted(pending, key=lambda s: s['shard'])]
+        if pending:
+            logger.warning("%s: starting again, %s shards of the previous run were not done", self.name,
+                           len(pending))
+        self.checkpoints.remove({'migration': self.name})
+        shards = []
+        for i, (lower, upper) in enumerate(shard_bounds(self.collection, self.query, self.shards)):
+            shards.append(u'{0}:{1}'.format(self.name, i))
+            self.checkpoints.insert({'_id': shards[-1], 'migration': self.name,
+                                     'shard': i, 'lower': lower, 'upper': upper, 'last_id': None, 'done': False,
+                                     'processed': 0, 'updated': 0, 'errors': 0})
+        return shards
+
+    def process_shard(self, shard_id):
+        """
+        Migrate the documents of a shard from its last checkpoint.
+        :return: (shard id, documents processed, documents updated, errors)
+        """
+        shard = self.checkpoints.find_one({'_id': shard_id})
+        query = {'$and': [self.query, _id_range(shard['lower'], shard['upper'], shard['last_id'])]}
+        cursor = self.collection.find(query, fields=self.fields, timeout=False)
+        cursor = cursor.sort('_id', pymongo.ASCENDING).batch_size(self.batch_size)
+        processed = updated = errors = 0
+        t0 = time.time()
+        try:
+            batch = []
+            for document in cursor:
+                batch.append(document)
+                if len(batch) >= self.batch_size:
+                    counts = self._write(shard_id, batch)
+                    processed, updated, errors = processed + len(batch), updated + counts[0], errors + counts[1]
+                    batch = []
+                    logger.info("%s: %s documents (%.1f/s)", shard_id, processed, processed / (time.time() - t0))
+            counts = self._write(shard_id, batch, done=True)
+            processed, updated, errors = processed + len(batch), updated + counts[0], errors + counts[1]
+        finally:
+            cursor.close()
+        return shard_id, processed, updated, errors
+
+    def _transform(self, document):
+        if not self.time_limit:
+            return self.transform(document)
+        handler = signal.signal(signal.SIGALRM, _timeout)
+        signal.alarm(self.time_limit)
+        try:
+            return self.transform(document)
+        finally:
+            signal.alarm(0)
+            signal.signal(signal.SIGALRM, handler)
+
+    def _write(self, shard_id, documents, done=False):
+        """
+        Transform a batch of documents, write the updates in bulk and save the checkpoint.
+        :return: (documents updated, errors)
+        """
+        updates, errors = 0, 0
+        bulk = self.collection.initialize_unordered_bulk_op()
+        for document in documents:
+            try:
+                update = self._transform(document)
+            except TransformTimeout:
+                logger.error("%s: %s exceeded the time limit of %s s", self.name, document['_id'], self.time_limit)
+                errors += 1
+                update = self.on_timeout(document) if self.on_timeout else None
+            except Exception as e:
+                logger.exception("%s: failed to migrate %s: %s", self.name, document['_id'], e)
+                errors += 1
+                continue
+            if update:
+                bulk.find({'_id': document['_id']}).update_one(update)
+                updates += 1
+        if updates:
+            try:
+                bulk.execute()
+            except BulkWriteError as e:
+                logger.error("%s: %s writes failed", self.name, len(e.details.get('writeErrors', [])))
+                errors += len(e.details.get('writeErrors', []))
+        checkpoint = {'$inc': {'processed': len(documents), 'updated': updates, 'errors': errors},
+                      '$set': {'done': done, 'checkpoint': datetime.datetime.now()}}
+        if documents:
+            checkpoint['$set']['last_id'] = documents[-1]['_id']
+        self.checkpoints.update({'_id': shard_id}, checkpoint)
+        return updates, errors
+
+    def run(self, resume=False):
+        """
+        Run the migration, or resume the previous run if `resume`.
+        :return: (documents processed, documents updated, errors)
+        """
+        shards = self.plan(resume)
+        logger.info("%s: %s shards to migrate with %s processes", self.name, len(shards), self.processes)
+        t0 = time.time()
+        processed = updated = errors = 0
+        pool = multiprocessing.Pool(self.processes)
+        try:
+            done = pool.imap_unordered(_run_shard, [(self, s) for s in shards])
+            for n, (shard_id, p, u, e) in enumerate(done, 1):
+                processed, updated, errors = processed + p, updated + u, errors + e
+                logger.info("%s: %s/%s shards done, %s documents (%.1f/s), %s updated, %s errors",
+                            self.name, n, len(shards), processed, processed / (time.time() - t0), updated, errors)
+        finally:
+            pool.close()
+            pool.join()
+        return processed, updated, errors
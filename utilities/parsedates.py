@@ -19,6 +19,8 @@ import pymongo
 from dateutil.parser import parse as dateutil_parse_date
 from pymongo.errors import DuplicateKeyError
 
+from migration import Migration
+
 
 BSON_DATE = ord(bson.BSONDAT) # WTF, pymongo?
 MONTHS = {'jan': 1, 'fev': 2, 'mar': 3, 'abr': 4,  'mai': 5,  'jun': 6,
@@ -109,41 +111,38 @@ def parse_date(value):
     return new_value
 
 
-def parse_dates_in(collection):
+DATE_FIELDS = ['published', 'updated']
+
+
+def _parse_date_fields(document):
+    """
+    Migration transform: parse the date strings of a document.
+    """
+    from dates import parse_date as fast_parse_date
+    undesired_types = (type(None), datetime.datetime, datetime.date)
+    new_values = {}
+    for field_name in DATE_FIELDS:
+        value = document.get(field_name, None)
+        if type(value) not in undesired_types:
+            try:
+                new_values[field_name] = fast_parse_date(value, field_name)
+            except ValueError:
+                print('ERROR {} ({} = {})'.format(document['_id'], field_name,
+                        repr(value)))
+    if new_values:
+        return {'$set': new_values}
+
+
+def parse_dates_in(collection, processes=None, resume=False):
     published = {'$and': [{'published': {'$exists': True}},
                           {'published': {'$not': {'$type': BSON_DATE}}}]}
     updated = {'$and': [{'updated': {'$exists': True}},
                         {'updated': {'$not': {'$type': BSON_DATE}}}]}
     date_filter = {'$or': [published, updated]}
-    fields = {'updated': True, 'published': True, '_id': True}
-    cursor = collection.find(date_filter, fields)
-
-    date_fields = ['published', 'updated']
-    undesired_types = (type(None), datetime.datetime, datetime.date)
-    updated_documents = 0
-    total = cursor.count()
-
-    for document in cursor:
-        print('Updating document "{}"...'.format(document['_id']), end='')
-
-        updated = False
-        for field_name in date_fields:
-            value = document.get(field_name, None)
-            if type(value) not in undesired_types:
-                try:
-                    new_value = parse_date(value)
-                except ValueError:
-                    print(' ERROR ({} = {})'.format(field_name, repr(value)),
-                            end='')
-                else:
-                    print(' UPDATED ({}: {} -> {})'.format(field_name,
-                        repr(value), repr(new_value)), end='')
-                    collection.update({'_id': document['_id']},
-                                        {'$set': {field_name: new_value}})
-                    updated = True
-        print('')
-        if updated:
-            updated_documents += 1
+    name = 'parse_dates:{}'.format(collection.full_name)
+    migration = Migration(name, collection, date_filter, _parse_date_fields,
+                          fields=DATE_FIELDS, processes=processes)
+    total, updated_documents, errors = migration.run(resume)
 
     print('Total documents updates: {}. Found: {}'
             .format(updated_documents, total))
@@ -154,6 +153,10 @@ if __name__ == '__main__':
     args.add_argument('host', type=str, help='MongoDB host to connect to')
     args.add_argument('--port', type=int, default=27017,
             help='MongoDB port to connect to')
+    args.add_argument('--processes', type=int, default=None,
+            help='number of worker processes (default: one per CPU)')
+    args.add_argument('--resume', action='store_true',
+            help='continue the previous run where it stopped')
     args.add_argument('database', type=str)
     args.add_argument('collection', type=str)
     argv = args.parse_args()
@@ -162,4 +165,4 @@ if __name__ == '__main__':
     database = client[argv.database]
     collection = database[argv.collection]
 
-    parse_dates_in(collection)
+    parse_dates_in(collection, argv.processes, argv.resume)